@@ -41,6 +41,9 @@ def main():
     parser.add_argument('-w', '--environment_rhs', default=None, help="Right hand side of environment filter. Format: positions separated by commas, groups by slashes, e.g. m/n,i matches mi or ni.")
     parser.add_argument('-n', '--prevent_normalization', action='store_true', help="For deltah entropy: prevents normalization of the entropy difference by the pre-neutralization entropy. To replicate the Surendran \& Niyogi metric, do NOT use this flag.")
     parser.add_argument('-x', '--separate_pairs', action='store_true', help="If present, calculate FL for each pair in the pairs file separately.")
+    parser.add_argument('-u', '--unbatched', action='store_true', help="With -l, calculate the FL of each segment pair separately instead of deriving all of them from one pass over the corpus. Only unbatched runs use -j.")
+    parser.add_argument('-j', '--num_cores', type=int, default=-1, help='Number of processes to spread segment pairs over when they are calculated one at a time, i.e. with -e, or with -l and -u (or -a deltah with an environment filter). Defaults to -1 (no multiprocessing).')
+    parser.add_argument('-z', '--lazy', action='store_true', help="Unpickle the words of the corpus as they are used, instead of loading the whole corpus first. Uses less memory on large corpora, but makes each pass over the corpus slower.")
     parser.add_argument('-o', '--outfile', help='Name of output file')
 
     args = parser.parse_args()
@@ -51,9 +54,9 @@ def main():
 
     try:
         home = os.path.expanduser('~')
-        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name))
+        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name), lazy = args.lazy)
     except FileNotFoundError:
-        corpus = load_binary(args.corpus_file_name)
+        corpus = load_binary(args.corpus_file_name, lazy = args.lazy)
 
     # Create corpus context
 
@@ -81,6 +84,12 @@ def main():
             split_rhs = None
         environment_filters = [EnvironmentFilter([], split_lhs, split_rhs)]
 
+    # Minimal pair FL takes a list of filters, delta-H a single one
+    if args.algorithm == 'deltah':
+        environment_filter = environment_filters[0] if environment_filters else None
+    else:
+        environment_filter = environment_filters
+
     # Initialize results
 
     overall_result = None
@@ -91,8 +100,9 @@ def main():
     # Determine which function to call
 
     if args.all_pairwise_fls:
-        results = all_pairwise_fls(corpus, relative_fl=args.relative_fl, algorithm=args.algorithm, relative_count=args.relative_count,
-                     distinguish_homophones=args.distinguish_homophones, environment_filters=environment_filters, prevent_normalization=args.prevent_normalization)
+        results = all_pairwise_fls(corpus, relative_fl=args.relative_fl, algorithm=args.algorithm, relative_count_to_relevant_sounds=args.relative_count,
+                     distinguish_homophones=args.distinguish_homophones, environment_filter=environment_filter, prevent_normalization=args.prevent_normalization,
+                     batched=not args.unbatched, num_cores=args.num_cores)
         for pair, fl in results:
             detailed_results[pair] = fl
         keys_label = 'segment pair'
@@ -110,42 +120,36 @@ def main():
 
         if args.algorithm == 'minpair':
             if args.relative_fl:
-                results = relative_minpair_fl(corpus, segpairs_or_segment, relative_count=bool(args.relative_count), distinguish_homophones=args.distinguish_homophones, environment_filters=environment_filters)
-                overall_result = results[0]
-                detailed_results = results[1]
-                keys_label = 'segment pair'
+                overall_result = relative_minpair_fl(corpus, segpairs_or_segment, relative_count_to_relevant_sounds=bool(args.relative_count), distinguish_homophones=args.distinguish_homophones, environment_filter=environment_filter, num_cores=args.num_cores)
             else:
                 if args.separate_pairs:
                     for pair in segpairs_or_segment:
                         pair = tuple(pair)
-                        detailed_results[pair] = minpair_fl(corpus, [pair], relative_count=bool(args.relative_count), distinguish_homophones=args.distinguish_homophones, environment_filters=environment_filters)[0]
+                        detailed_results[pair] = minpair_fl(corpus, [pair], relative_count_to_relevant_sounds=bool(args.relative_count), distinguish_homophones=args.distinguish_homophones, environment_filter=environment_filter)[0]
                     keys_label = 'segment pair'
                 else:
-                    results = minpair_fl(corpus, segpairs_or_segment, relative_count=bool(args.relative_count), distinguish_homophones=args.distinguish_homophones, environment_filters=environment_filters)
+                    results = minpair_fl(corpus, segpairs_or_segment, relative_count_to_relevant_sounds=bool(args.relative_count), distinguish_homophones=args.distinguish_homophones, environment_filter=environment_filter)
                     overall_result = results[0]
                     detailed_results = {mp: '' for mp in results[1]}
                     keys_label = 'minimal pair (all listed regardless of distinguish_homophones value)'
         elif args.algorithm == 'deltah':
             if args.relative_fl:
-                results = relative_deltah_fl(corpus, segpairs_or_segment, environment_filters=environment_filters, prevent_normalization=args.prevent_normalization)
-                overall_result = results[0]
-                detailed_results = results[1]
-                keys_label = 'segment pair'
+                overall_result = relative_deltah_fl(corpus, segpairs_or_segment, environment_filter=environment_filter, prevent_normalization=args.prevent_normalization, num_cores=args.num_cores)
             else:
                 if args.separate_pairs:
                     for pair in segpairs_or_segment:
                         pair = tuple(pair)
-                        detailed_results[pair] = (deltah_fl(corpus, [pair], environment_filters=environment_filters, prevent_normalization=args.prevent_normalization))
+                        detailed_results[pair] = (deltah_fl(corpus, [pair], environment_filter=environment_filter, prevent_normalization=args.prevent_normalization))
                     keys_label = 'segment pair'
                 else:
-                    overall_result = deltah_fl(corpus, segpairs_or_segment, environment_filters=environment_filters, prevent_normalization=args.prevent_normalization)
+                    overall_result = deltah_fl(corpus, segpairs_or_segment, environment_filter=environment_filter, prevent_normalization=args.prevent_normalization)
         else:
             raise Exception('-a / --algorithm must be set to either \'minpair\' or \'deltah\'.')
 
     if args.outfile:
         with open(args.outfile, 'w') as outfile:
             outstr = '{}\t{}\n'.format(keys_label, values_label)
-            if overall_result:
+            if overall_result is not None:
                 outstr += 'OVERALL\t{}\n'.format(overall_result)
             for key in detailed_results:
                 outstr += '{}\t{}\n'.format(key, detailed_results[key])
@@ -153,7 +157,7 @@ def main():
 
 
     else:
-        if overall_result:
+        if overall_result is not None:
             easy_result = overall_result
         else:
             easy_result = detailed_results
@@ -25,6 +25,7 @@ def main():
     parser.add_argument('-s', '--sequence_type', default='transcription', help="The attribute of Words to calculate KL over. Normally this will be the transcription, but it can also be the spelling or a user-specified tier.")
     parser.add_argument('-t', '--type_or_token', default='token', help='Specifies whether entropy is based on type or token frequency.')
     parser.add_argument('-c', '--context_type', type=str, default='Canonical', help="How to deal with variable pronunciations. Options are 'Canonical', 'MostFrequent', 'SeparatedTokens', or 'Weighted'. See documentation for details.")
+    parser.add_argument('-z', '--lazy', action='store_true', help="Unpickle the words of the corpus as they are used, instead of loading the whole corpus first. Uses less memory on large corpora, but makes each pass over the corpus slower.")
     parser.add_argument('-o', '--outfile', help='Name of output file (optional)')
     
     args = parser.parse_args()
@@ -33,12 +34,12 @@ def main():
 
     try:
         home = os.path.expanduser('~')
-        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name))
+        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name), lazy = args.lazy)
     except FileNotFoundError:
         corpus_path = args.corpus_file_name
         if not os.path.isfile(corpus_path):
             corpus_path = os.path.join(os.getcwd(), corpus_path)
-        corpus = load_binary(corpus_path)
+        corpus = load_binary(corpus_path, lazy = args.lazy)
 
     if args.context_type == 'Canonical':
         corpus = CanonicalVariantContext(corpus, args.sequence_type, args.type_or_token)
@@ -25,6 +25,7 @@ def main():
     parser.add_argument('-s', '--sequence_type', default='transcription', help="The attribute of Words to calculate MI over. Normally this will be the transcription, but it can also be the spelling or a user-specified tier.")
     parser.add_argument('-w', '--in_word', action='store_true', help="Flag: domain for counting unigrams/bigrams set to the word rather than the unigram/bigram; ignores adjacency and word edges (#)")
     parser.add_argument('-e', '--halve_edges', action='store_true', help="Flag: make the number of edge characters (#) equal to the size of the corpus + 1, rather than double the size of the corpus - 1")
+    parser.add_argument('-z', '--lazy', action='store_true', help="Unpickle the words of the corpus as they are used, instead of loading the whole corpus first. Uses less memory on large corpora, but makes each pass over the corpus slower.")
     parser.add_argument('-o', '--outfile', help='Name of output file')
 
     args = parser.parse_args()
@@ -33,9 +34,9 @@ def main():
 
     try:
         home = os.path.expanduser('~')
-        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name))
+        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name), lazy = args.lazy)
     except FileNotFoundError:
-        corpus = load_binary(args.corpus_file_name)
+        corpus = load_binary(args.corpus_file_name, lazy = args.lazy)
 
     if args.context_type == 'Canonical':
         corpus = CanonicalVariantContext(corpus, args.sequence_type)
@@ -43,6 +43,7 @@ def main():
     parser.add_argument('-e', '--trans_delimiter', default='', help="If not empty string, splits the query by this str to make a transcription/spelling list for the query's Word object.")
     parser.add_argument('-m', '--find_mutation_minpairs', action='store_true', help='This flag causes the script not to calculate neighborhood density, but rather to find minimal pairs---see documentation.')
     parser.add_argument('-q', '--force_quadratic_algorithm', action='store_true', help='This flag prevents PCT from using the more efficient linear-time algorithm for edit distance of 1 neighborhoods.')
+    parser.add_argument('-z', '--lazy', action='store_true', help="Unpickle the words of the corpus as they are used, instead of loading the whole corpus first. Uses less memory on large corpora, but makes each pass over the corpus slower.")
     parser.add_argument('-o', '--outfile', help='Name of output file')
 
     args = parser.parse_args()
@@ -51,9 +52,9 @@ def main():
 
     try:
         home = os.path.expanduser('~')
-        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name))
+        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name), lazy = args.lazy)
     except FileNotFoundError:
-        corpus = load_binary(args.corpus_file_name)
+        corpus = load_binary(args.corpus_file_name, lazy = args.lazy)
         
     if args.context_type == 'Canonical':
         corpus = CanonicalVariantContext(corpus, args.sequence_type, type_or_token=args.count_what)
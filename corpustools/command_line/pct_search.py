@@ -26,6 +26,7 @@ def main():
         +' [otin], or [opin].'))
     parser.add_argument('-s', '--sequence_type', default='transcription', 
         help="The attribute of Words to search within. Normally this will be the transcription, but it can also be the spelling or a user-specified tier.")
+    parser.add_argument('-z', '--lazy', action='store_true', help="Unpickle the words of the corpus as they are used, instead of loading the whole corpus first. Uses less memory on large corpora, but makes each pass over the corpus slower.")
     parser.add_argument('-o', '--outfile', help='Name of output file')
 
     args = parser.parse_args()
@@ -34,9 +35,9 @@ def main():
 
     try:
         home = os.path.expanduser('~')
-        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name))
+        corpus = load_binary(os.path.join(home, 'Documents', 'PCT', 'CorpusTools', 'CORPUS', args.corpus_file_name), lazy = args.lazy)
     except FileNotFoundError:
-        corpus = load_binary(args.corpus_file_name)
+        corpus = load_binary(args.corpus_file_name, lazy = args.lazy)
 
     split_sequence = [tuple(pos.split('/')) for pos in args.sequence.split(',')]
     middle = split_sequence[0]
@@ -5,6 +5,9 @@ import copy
 import operator
 
 from corpustools.corpus.classes.lexicon import Word
+from corpustools.neighdens.deletion_index import DeletionIndex
+from corpustools.neighdens.mutation_index import MutationIndex
+from corpustools.neighdens.tier_index import TierIndex
 
 from corpustools.exceptions import PCTContextError
 
@@ -177,6 +180,117 @@ class BaseCorpusContext(object):
                             for k,v in return_dict.items() if k != 'total'}
         return return_dict
 
+    def get_sequence_probs(self):
+        """
+        Generate (and cache) the probability of each distinct sequence
+        (i.e., transcription or spelling) in the Corpus, along with an
+        index of which sequences contain each segment
+
+        Returns
+        -------
+        dict
+            Keys are sequences and values are their probability in the
+            Corpus, based on the frequencies of the words that have them
+        dict
+            Keys are segments and values are lists of the sequences that
+            contain them
+        """
+        if 'sequences' not in self._freq_base:
+            freq_sum = 0
+            probs = collections.defaultdict(float)
+            for word in self:
+                probs[getattr(word, self.sequence_type)] += word.frequency
+                freq_sum += word.frequency
+            probs = {k:v/freq_sum for k,v in probs.items()}
+            index = collections.defaultdict(list)
+            for k in probs:
+                for seg in set(k):
+                    index[seg].append(k)
+            self._freq_base['sequences'] = (probs, dict(index))
+        return self._freq_base['sequences']
+
+    def get_sequence_entropy(self, segments_only = False):
+        """
+        Calculate (and cache) the entropy of the choice among the distinct
+        sequences in the Corpus
+
+        Parameters
+        ----------
+        segments_only : boolean
+            If True, sequences that contain the same segments (but differ
+            in stress or tone, for instance) count as a single sequence,
+            defaults to False
+
+        Returns
+        -------
+        float
+            Entropy of the sequence probabilities
+        """
+        if ('entropy', segments_only) not in self._freq_base:
+            probs, index = self.get_sequence_probs()
+            if segments_only:
+                segment_probs = collections.defaultdict(float)
+                for k,v in probs.items():
+                    segment_probs[tuple(k)] += v
+                probs = segment_probs
+            self._freq_base[('entropy', segments_only)] = \
+                -(sum([p*math.log(p,2) if p > 0 else 0 for p in probs.values()]))
+        return self._freq_base[('entropy', segments_only)]
+
+    def get_deletion_index(self, max_distance):
+        """
+        Build (and cache) a symmetric deletion index of the words in the
+        context, for finding edit distance neighbours (see
+        `DeletionIndex`)
+
+        Parameters
+        ----------
+        max_distance : int
+            Largest edit distance the index will be queried for
+
+        Returns
+        -------
+        DeletionIndex
+            Index of the words in the context
+        """
+        max_distance = int(max_distance)
+        for key, index in self._freq_base.items():
+            if isinstance(key, tuple) and key[0] == 'deletion_index' and key[1] >= max_distance:
+                return index
+        index = DeletionIndex(self, max_distance)
+        self._freq_base[('deletion_index', max_distance)] = index
+        return index
+
+    def get_mutation_index(self):
+        """
+        Build (and cache) an index of the words in the context by their
+        single-position wildcard keys, for finding mutation minimal pairs
+        (see `MutationIndex`)
+
+        Returns
+        -------
+        MutationIndex
+            Index of the words in the context
+        """
+        if 'mutation_index' not in self._freq_base:
+            self._freq_base['mutation_index'] = MutationIndex(self)
+        return self._freq_base['mutation_index']
+
+    def get_tier_index(self):
+        """
+        Build (and cache) an index of the words in the context by the
+        string form of their sequence, for looking up neighbour
+        candidates (see `TierIndex`)
+
+        Returns
+        -------
+        TierIndex
+            Index of the words in the context
+        """
+        if 'tier_index' not in self._freq_base:
+            self._freq_base['tier_index'] = TierIndex(self)
+        return self._freq_base['tier_index']
+
     def __exit__(self, exc_type, exc, exc_tb):
         if exc_type is None:
             return True
@@ -0,0 +1,365 @@
+from array import array
+
+import numpy as np
+
+from .lexicon import (Transcription, Segment, segment_id, _segment_symbols)
+
+
+class TierColumn(object):
+    """
+    Column of tier values (transcriptions or spellings) for every word in
+    a corpus, stored as one flat array of segment IDs (see
+    ``lexicon.segment_id``) and the offsets of each word in it
+
+    Stress and tone markings are not stored.
+
+    Parameters
+    ----------
+    ids : numpy.ndarray
+        Segment IDs of all words, one after the other
+    offsets : numpy.ndarray
+        Start of each word in `ids`, followed by the total length
+
+    Attributes
+    ----------
+    ids : numpy.ndarray
+        Segment IDs of all words, one after the other
+    offsets : numpy.ndarray
+        Start of each word in `ids`, followed by the total length
+    """
+    def __init__(self, ids, offsets):
+        self.ids = ids
+        self.offsets = offsets
+        self._word_index = None
+
+    @classmethod
+    def from_sequences(cls, sequences):
+        """
+        Build a TierColumn from Transcriptions or strings
+
+        Parameters
+        ----------
+        sequences : iterable
+            Transcriptions, strings or lists of segment symbols
+
+        Returns
+        -------
+        TierColumn
+            Column of the sequences
+        """
+        chunks = []
+        for seq in sequences:
+            if isinstance(seq, Transcription):
+                chunks.append(seq._ids)
+            else:
+                chunks.append(array('H', [segment_id(s) for s in seq]))
+        offsets = np.zeros(len(chunks) + 1, dtype = np.int64)
+        np.cumsum([len(c) for c in chunks], out = offsets[1:])
+        ids = np.frombuffer(b''.join(c.tobytes() for c in chunks), dtype = np.uint16)
+        return cls(ids, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return Transcription.from_ids(self.ids[self.offsets[index]:self.offsets[index + 1]])
+
+    @property
+    def lengths(self):
+        """
+        Number of segments in each word
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def word_index(self):
+        """
+        Index of the word that each element of `ids` belongs to
+        """
+        if self._word_index is None:
+            self._word_index = np.repeat(np.arange(len(self)), self.lengths)
+        return self._word_index
+
+    def count(self, segments):
+        """
+        Count the segments in each word that are in a set of segments
+
+        Parameters
+        ----------
+        segments : list
+            Segment symbols or Segments to count
+
+        Returns
+        -------
+        numpy.ndarray
+            Count for each word
+        """
+        targets = [segment_id(s.symbol if isinstance(s, Segment) else s)
+                    for s in segments]
+        hits = np.isin(self.ids, targets)
+        return np.bincount(self.word_index[hits], minlength = len(self))
+
+    def ngram_counts(self, gramsize = 1, weights = None, word_boundaries = True):
+        """
+        Count the n-grams of segments in all words
+
+        Parameters
+        ----------
+        gramsize : int
+            Size of n-grams to count, defaults to 1
+        weights : numpy.ndarray, optional
+            Amount to count for each word (for instance, its frequency),
+            defaults to 1 for every word
+        word_boundaries : bool
+            If True (the default), words are surrounded by '#'
+
+        Returns
+        -------
+        dict
+            Keys are tuples of segment symbols and values are their counts
+        """
+        num_words = len(self)
+        if weights is None:
+            weights = np.ones(num_words)
+        ids = self.ids
+        offsets = self.offsets
+        if word_boundaries:
+            pad = np.arange(num_words + 1) * 2
+            padded = np.full(len(ids) + 2 * num_words, segment_id('#'), dtype = np.uint16)
+            padded[np.arange(len(ids)) + pad[self.word_index] + 1] = ids
+            ids = padded
+            offsets = offsets + pad
+        word_index = np.repeat(np.arange(num_words), np.diff(offsets))
+        starts = np.flatnonzero(np.arange(len(ids)) + gramsize <= offsets[1:][word_index])
+        if len(starts) == 0:
+            return {}
+        grams = np.stack([ids[starts + i] for i in range(gramsize)], axis = 1)
+        unique, inverse = np.unique(grams, axis = 0, return_inverse = True)
+        totals = np.bincount(inverse.ravel(), weights = weights[word_index[starts]],
+                             minlength = len(unique))
+        return {tuple(_segment_symbols[i] for i in gram): total
+                    for gram, total in zip(unique.tolist(), totals.tolist())}
+
+
+class WordView(object):
+    """
+    Lightweight, read-only view of one word in a ColumnarCorpus, with
+    the same attribute names as the Word it was built from
+    """
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            column = self._store.columns[name]
+        except KeyError:
+            raise AttributeError(name)
+        value = column[self._index]
+        if isinstance(value, np.generic):
+            value = value.item()
+        return value
+
+    @property
+    def spelling(self):
+        return self._store.spelling[self._index]
+
+    @property
+    def transcription(self):
+        if self._store.transcription_name is None:
+            return None
+        return getattr(self, self._store.transcription_name)
+
+    @property
+    def frequency(self):
+        return float(self._store.frequency[self._index])
+
+    def __repr__(self):
+        return '<WordView: \'%s\'>' % self.spelling
+
+    def __str__(self):
+        return self.spelling
+
+
+class ColumnarCorpus(object):
+    """
+    Column-oriented snapshot of a Corpus, for vectorised operations over
+    all of its words
+
+    Numeric attributes are stored as float arrays, spelling and factor
+    attributes as object arrays and tiers as TierColumns. The snapshot
+    does not follow later changes to the Corpus or its Words.
+
+    Parameters
+    ----------
+    corpus : Corpus
+        Corpus to take the snapshot of
+    attributes : list of Attribute, optional
+        Attributes to store, defaults to all of the Corpus' attributes
+
+    Attributes
+    ----------
+    keys : list
+        Corpus keys of the words, in the order of the columns
+    columns : dict
+        Columns keyed by attribute name
+    spelling : numpy.ndarray
+        Spelling of each word
+    frequency : numpy.ndarray
+        Frequency of each word
+    """
+    def __init__(self, corpus, attributes = None):
+        self.name = corpus.name
+        self.keys = list(corpus.wordlist.keys())
+        words = list(corpus.wordlist.values())
+        if attributes is None:
+            attributes = corpus.attributes
+        self.attributes = list(attributes)
+        self.columns = {}
+        self.spelling = np.array([w.spelling for w in words], dtype = object)
+        self.frequency = np.array([w.frequency for w in words], dtype = float)
+        self.transcription_name = None
+        for a in self.attributes:
+            values = [getattr(w, a.name) for w in words]
+            if a.att_type == 'tier':
+                self.columns[a.name] = TierColumn.from_sequences(values)
+            elif a.att_type == 'numeric':
+                self.columns[a.name] = np.array(values, dtype = float)
+            else:
+                self.columns[a.name] = np.array(values, dtype = object)
+        if words and words[0]._transcription_name in self.columns:
+            self.transcription_name = words[0]._transcription_name
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, index):
+        return WordView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield WordView(self, i)
+
+    def column(self, name):
+        """
+        Get the column of an attribute
+
+        Parameters
+        ----------
+        name : str
+            Name of the attribute ('spelling' and 'frequency' can also
+            be used)
+
+        Returns
+        -------
+        numpy.ndarray or TierColumn
+            Values of the attribute for every word
+        """
+        if name == 'spelling':
+            return self.spelling
+        elif name == 'frequency':
+            return self.frequency
+        elif name == 'transcription' and self.transcription_name is not None:
+            name = self.transcription_name
+        return self.columns[name]
+
+    def frequency_sum(self, mask = None):
+        """
+        Sum the frequencies of words
+
+        Parameters
+        ----------
+        mask : numpy.ndarray, optional
+            Boolean mask of the words to include, defaults to all words
+
+        Returns
+        -------
+        float
+            Total frequency
+        """
+        if mask is None:
+            return float(self.frequency.sum())
+        return float(self.frequency[mask].sum())
+
+    def mask(self, filters):
+        """
+        Find the words that pass a set of filters, in the format of
+        ``Corpus.subset``
+
+        Parameters
+        ----------
+        filters : list of tuples
+            Numeric filters are tuples of an Attribute, a comparison
+            function from the ``operator`` module and a value; factor
+            filters are tuples of an Attribute and a set of levels
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean mask of the words that pass every filter
+        """
+        mask = np.ones(len(self), dtype = bool)
+        for f in filters:
+            if f[0].att_type == 'numeric':
+                mask &= np.asarray(f[1](self.column(f[0].name), f[2]), dtype = bool)
+            elif f[0].att_type == 'factor':
+                levels = f[1]
+                mask &= np.fromiter((v in levels for v in self.column(f[0].name)),
+                                    dtype = bool, count = len(self))
+        return mask
+
+    def argsort(self, name, reverse = False):
+        """
+        Order the words by an attribute
+
+        Parameters
+        ----------
+        name : str
+            Name of the attribute to sort by
+        reverse : bool
+            If True, sort in descending order
+
+        Returns
+        -------
+        numpy.ndarray
+            Indices of the words in sorted order
+        """
+        column = self.column(name)
+        if isinstance(column, TierColumn):
+            order = np.array(sorted(range(len(self)), key = lambda i: column[i]._list),
+                             dtype = np.int64)
+        else:
+            order = np.argsort(column, kind = 'mergesort')
+        if reverse:
+            order = order[::-1]
+        return order
+
+    def ngram_counts(self, sequence_type = 'transcription', gramsize = 1,
+                    weighted = True, word_boundaries = True):
+        """
+        Count the n-grams of segments in a tier over all words
+
+        Parameters
+        ----------
+        sequence_type : str
+            Name of the tier to count n-grams in
+        gramsize : int
+            Size of n-grams to count, defaults to 1
+        weighted : bool
+            If True (the default), weight each word by its frequency
+        word_boundaries : bool
+            If True (the default), words are surrounded by '#'
+
+        Returns
+        -------
+        dict
+            Keys are tuples of segment symbols and values are their counts
+        """
+        column = self.column(sequence_type)
+        if not isinstance(column, TierColumn):
+            column = TierColumn.from_sequences(column)
+        weights = self.frequency if weighted else None
+        return column.ngram_counts(gramsize, weights = weights,
+                                   word_boundaries = word_boundaries)
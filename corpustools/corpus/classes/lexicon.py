@@ -6,9 +6,95 @@ import collections
 import operator
 import locale
 import copy
+from array import array
+
+import numpy as np
 
 from corpustools.exceptions import CorpusIntegrityError
 
+_segment_ids = {}
+_segment_symbols = []
+_segment_codes = []
+
+# Segment codes are taken from the Unicode private use area
+_CODE_OFFSET = 0xE000
+
+def segment_id(symbol):
+    """
+    Get the interned integer ID of a segment symbol
+
+    IDs are assigned on first use and are only valid within the current
+    process, so they are never pickled.
+
+    Parameters
+    ----------
+    symbol : str
+        Segment symbol
+
+    Returns
+    -------
+    int
+        ID of the symbol
+    """
+    try:
+        return _segment_ids[symbol]
+    except KeyError:
+        i = len(_segment_symbols)
+        _segment_ids[symbol] = i
+        _segment_symbols.append(symbol)
+        _segment_codes.append(chr(_CODE_OFFSET + i))
+        return i
+
+def segment_code(symbol):
+    """
+    Get the single character that stands for a segment symbol in
+    compiled environment patterns
+
+    Parameters
+    ----------
+    symbol : str
+        Segment symbol
+
+    Returns
+    -------
+    str
+        Single character code for the symbol
+    """
+    return _segment_codes[segment_id(symbol)]
+
+def encode_segments(segments):
+    """
+    Encode a sequence of segment symbols as a string with one character
+    per segment, for matching against compiled environment patterns
+
+    Parameters
+    ----------
+    segments : iterable
+        Segment symbols
+
+    Returns
+    -------
+    str
+        Encoded sequence
+    """
+    return ''.join([_segment_codes[segment_id(s)] for s in segments])
+
+def decode_segments(encoded):
+    """
+    Decode a string made by `encode_segments` into segment symbols
+
+    Parameters
+    ----------
+    encoded : str
+        Encoded sequence
+
+    Returns
+    -------
+    list
+        Segment symbols
+    """
+    return [_segment_symbols[ord(c) - _CODE_OFFSET] for c in encoded]
+
 class Segment(object):
     """
     Class for segment symbols
@@ -169,8 +255,11 @@ class Transcription(object):
 
     Attributes
     ----------
+    _ids : array
+        Interned IDs (see `segment_id`) of the segment symbols
     _list : list
-        List of strings representing segment symbols
+        List of strings representing segment symbols, converted to and
+        from `_ids`
     stress_pattern: dict
         Dictionary with keys of segment indices and values of the stress
         for that segment
@@ -178,52 +267,133 @@ class Transcription(object):
         Possible keys of 'morpheme' or 'tone' that keeps track of where
         morpheme or tone boundaries are inserted
     """
+    __slots__ = ('_ids', '_hash', '_stress_pattern', '_boundaries')
+
     def __init__(self,seg_list):
-        self._list = []
+        symbols = []
         #self._times = []
-        self.stress_pattern = {}
-        self.boundaries = {}
+        stress_pattern = {}
+        boundaries = {}
         cur_group = 0
         cur_tone = None
         if seg_list is not None:
             for i,s in enumerate(seg_list):
                 try:
-                    self._list.append(s.label)
+                    symbols.append(s.label)
                     #if s.begin is not None and s.end is not None:
                     #    self._times.append((s.begin,s.end))
                     if s.stress is not None:
-                        self.stress_pattern[i] = s.stress
+                        stress_pattern[i] = s.stress
                     if s.tone is not None:
-                        if 'tone' not in self.boundaries:
-                            self.boundaries['tone'] = {}
+                        if 'tone' not in boundaries:
+                            boundaries['tone'] = {}
                         if s.tone != cur_tone:
-                            self.boundaries['tone'][i] = s.tone
+                            boundaries['tone'][i] = s.tone
                             cur_tone = s.tone
                     if s.group is not None:
-                        if 'morpheme' not in self.boundaries:
-                            self.boundaries['morpheme'] = []
+                        if 'morpheme' not in boundaries:
+                            boundaries['morpheme'] = []
                         if s.group != cur_group:
-                            self.boundaries['morpheme'].append(i)
+                            boundaries['morpheme'].append(i)
                             cur_group = s.group
                 except AttributeError:
                     if isinstance(s,str) or isinstance(s, Segment):
-                        self._list.append(s)
+                        symbols.append(s)
                     elif isinstance(s,dict):
                         try:
                             symbol = s['label']
                         except KeyError:
                             symbol = s['symbol']
-                        self._list.append(symbol)
+                        symbols.append(symbol)
                         #if 'begin' in s and 'end' in s:
                         #    self._times.append((s['begin'],s['end']))
                     elif isinstance(s,list):
                         if len(s) == 3:
-                            self._list.append(s[0])
+                            symbols.append(s[0])
                             #self._times.append((s[1],s[2]))
                         else:
                             raise(NotImplementedError('That format for seg_list is not supported.'))
                     else:
                         raise(NotImplementedError('That format for seg_list is not supported.'))
+        self._list = symbols
+        # Most transcriptions have no stress or boundaries, so empty
+        # dictionaries are only created when they are asked for
+        self._stress_pattern = stress_pattern or None
+        self._boundaries = boundaries or None
+
+    @property
+    def stress_pattern(self):
+        if self._stress_pattern is None:
+            self._stress_pattern = {}
+        return self._stress_pattern
+
+    @stress_pattern.setter
+    def stress_pattern(self, value):
+        self._stress_pattern = value
+        self._hash = None
+
+    @property
+    def boundaries(self):
+        if self._boundaries is None:
+            self._boundaries = {}
+        return self._boundaries
+
+    @boundaries.setter
+    def boundaries(self, value):
+        self._boundaries = value
+        self._hash = None
+
+    @property
+    def _list(self):
+        return [_segment_symbols[i] for i in self._ids]
+
+    @_list.setter
+    def _list(self, symbols):
+        self._ids = array('H', [segment_id(s.symbol if isinstance(s, Segment) else s)
+                                for s in symbols])
+        self._hash = None
+
+    def encoded(self, word_boundaries = True):
+        """
+        Get the Transcription as a string with one character per segment,
+        as used by compiled EnvironmentFilter patterns (see
+        `encode_segments`)
+
+        Parameters
+        ----------
+        word_boundaries : bool
+            If True (the default), include word boundaries on either side
+
+        Returns
+        -------
+        str
+            Encoded Transcription
+        """
+        codes = ''.join([_segment_codes[i] for i in self._ids])
+        if word_boundaries:
+            boundary = segment_code('#')
+            return boundary + codes + boundary
+        return codes
+
+    @classmethod
+    def from_ids(cls, ids):
+        """
+        Create a Transcription directly from interned segment IDs (see
+        `segment_id`), without stress or boundaries
+
+        Parameters
+        ----------
+        ids : iterable
+            Segment IDs
+
+        Returns
+        -------
+        Transcription
+            Transcription of the segments
+        """
+        transcription = cls(None)
+        transcription._ids = array('H', ids)
+        return transcription
 
     def with_word_boundaries(self):
         """
@@ -252,45 +422,57 @@ class Transcription(object):
         """
         if not isinstance(environment, EnvironmentFilter):
             return None
+        return self._find(environment, self.with_word_boundaries(), self.encoded())
+
+    def find_all(self, environments):
+        """
+        Find instances of several EnvironmentFilters in the Transcription,
+        encoding the Transcription only once
+
+        Parameters
+        ----------
+        environments : list
+            EnvironmentFilters to search for
+
+        Returns
+        -------
+        list
+            For each EnvironmentFilter, the list of Environments that fit
+            it, or None if there were none
+        """
+        word = self.with_word_boundaries()
+        encoded = self.encoded()
+        return [self._find(env, word, encoded)
+                    if isinstance(env, EnvironmentFilter) else None
+                    for env in environments]
+
+    def _find(self, environment, word, encoded):
         if all(m not in self for m in environment._middle):
             return None
         num_segs = len(environment)
-
-        possibles = zip(*[self.with_word_boundaries()[i:] for i in range(num_segs)])
-
-        lhs_num = environment.lhs_count()
-        middle_num = lhs_num
+        middle_num = environment.lhs_count()
         rhs_num = middle_num + 1
-        envs = []
+        pattern, zeroes_pattern, _ = environment.compile_re_pattern()
 
-        for i, p in enumerate(possibles):
-            if p in environment:
-                lhs = p[:lhs_num]
-                middle = p[middle_num]
-                rhs = p[rhs_num:]
-                envs.append(Environment(middle, i + middle_num, lhs, rhs))
+        def matches(word, encoded, pattern):
+            for m in pattern.finditer(encoded):
+                i = m.start()
+                yield Environment(word[i + middle_num], i + middle_num,
+                                tuple(word[i:i + middle_num]),
+                                tuple(word[i + rhs_num:i + num_segs]))
 
-        lhsZeroes, rhsZeroes = environment.zeroPositions
-        if lhsZeroes:
-            word = [seg for pos,seg in enumerate(self.with_word_boundaries()) if pos not in lhsZeroes]
-            possibles = zip(*[word[i:] for i in range(num_segs)])
-            for i, p in enumerate(possibles):
-                if environment.without_zeroes_contains(p):
-                    lhs = p[:lhs_num]
-                    middle = p[middle_num]
-                    rhs = p[rhs_num:]
-                    envs.append(Environment(middle, i + middle_num, lhs, rhs))
+        envs = list(matches(word, encoded, pattern))
 
+        lhsZeroes, rhsZeroes = environment.zeroPositions
         if rhsZeroes:
             rhsZeroes = [rz+middle_num+1 for rz in rhsZeroes]
-            word = [seg for pos, seg in enumerate(self.with_word_boundaries()) if pos not in rhsZeroes]
-            possibles = zip(*[word[i:] for i in range(num_segs)])
-            for i, p in enumerate(possibles):
-                if environment.without_zeroes_contains(p):
-                    lhs = p[:lhs_num]
-                    middle = p[middle_num]
-                    rhs = p[rhs_num:]
-                    envs.append(Environment(middle, i + middle_num, lhs, rhs))
+        for zeroes in (lhsZeroes, rhsZeroes):
+            if not zeroes:
+                continue
+            keep = [pos for pos in range(len(word)) if pos not in zeroes]
+            envs.extend(matches([word[pos] for pos in keep],
+                                ''.join([encoded[pos] for pos in keep]),
+                                zeroes_pattern))
 
         if not envs:
             return None
@@ -357,43 +539,50 @@ class Transcription(object):
 
     def __contains__(self, other):
         if isinstance(other, Segment):
-            if other.symbol in self._list:
-                return True
-        elif isinstance(other, str):
-            if other in self._list:
-                return True
-        return False
+            other = other.symbol
+        elif not isinstance(other, str):
+            return False
+        i = _segment_ids.get(other)
+        return i is not None and i in self._ids
+
+    def __getstate__(self):
+        return {'_list': self._list, 'stress_pattern': self._stress_pattern or {},
+                'boundaries': self._boundaries or {}}
 
     def __setstate__(self, state):
-        if 'stress_pattern' not in state:
-            state['stress_pattern'] = {}
-        if 'boundaries' not in state:
-            state['boundaries'] = {}
-        self.__dict__.update(state)
+        self._list = state['_list']
+        self._stress_pattern = state.get('stress_pattern') or None
+        self._boundaries = state.get('boundaries') or None
 
     def __hash__(self):
-        return hash(str(self))
+        if self._hash is None:
+            self._hash = hash(str(self))
+        return self._hash
 
     def __getitem__(self, key):
-        if isinstance(key,int) or isinstance(key,slice):
-            return self._list[key]
+        if isinstance(key,int):
+            return _segment_symbols[self._ids[key]]
+        elif isinstance(key,slice):
+            return [_segment_symbols[i] for i in self._ids[key]]
         raise(KeyError)
 
     def __repr__(self):
         return self.__str__()
 
     def __str__(self):
+        stress_pattern = self._stress_pattern or {}
+        boundaries = self._boundaries or {}
         temp_list = []
         for i,s in enumerate(self._list):
-            if self.stress_pattern and i in self.stress_pattern:
-                s += self.stress_pattern[i]
-            if 'tone' in self.boundaries and i in self.boundaries['tone']:
-                s += self.boundaries['tone'][i]
+            if stress_pattern and i in stress_pattern:
+                s += stress_pattern[i]
+            if 'tone' in boundaries and i in boundaries['tone']:
+                s += boundaries['tone'][i]
             temp_list.append(s)
-        if 'morpheme' in self.boundaries:
+        if 'morpheme' in boundaries:
             beg = 0
             bound_list = []
-            for i in self.boundaries['morpheme']:
+            for i in boundaries['morpheme']:
                 bound_list.append('.'.join(temp_list[beg:i]))
             bound_list.append('.'.join(temp_list[i:]))
             return '-'.join(bound_list)
@@ -401,8 +590,8 @@ class Transcription(object):
             return '.'.join(temp_list)
 
     def __iter__(self):
-        for s in self._list:
-            yield s
+        for i in self._ids:
+            yield _segment_symbols[i]
 
     def __add__(self, other):
         """
@@ -422,11 +611,11 @@ class Transcription(object):
             return True
         if not isinstance(other, Transcription):
             return False
-        if self._list != other._list:
+        if self._ids != other._ids:
             return False
-        if self.stress_pattern != other.stress_pattern:
+        if (self._stress_pattern or {}) != (other._stress_pattern or {}):
             return False
-        if self.boundaries != other.boundaries:
+        if (self._boundaries or {}) != (other._boundaries or {}):
             return False
         return True
 
@@ -479,7 +668,7 @@ class Transcription(object):
         return not self.__eq__(other)
 
     def __len__(self):
-        return len(self._list)
+        return len(self._ids)
 
 
 class FeatureMatrix(object):
@@ -540,6 +729,7 @@ class FeatureMatrix(object):
         self.possible_values = set()
         self.matrix = {}
         self._default_value = 'n'
+        self._distances = {}
         if isinstance(feature_entries, FeatureMatrix):
             for attr in self.attributes:
                 if hasattr(feature_entries, attr):
@@ -567,6 +757,56 @@ class FeatureMatrix(object):
     def default_fill(self, seg_list):
         for seg in seg_list:
             self.matrix[seg] = {feature: self.default_value for feature in self._features}
+        self.invalidate_distances()
+
+    def segment_distances(self, underspec_cost = 0.25):
+        """
+        Get (and cache) the feature distances between all pairs of
+        segments in the feature system, and between each segment and an
+        empty segment (for insertions and deletions)
+
+        Two segments are 1 apart for every feature where they have
+        different values, or `underspec_cost` apart if one of the values
+        is '0'. An empty segment has '0' for every feature.
+
+        Parameters
+        ----------
+        underspec_cost : float
+            Distance for a feature that is unspecified ('0') in only one
+            of the segments, defaults to 0.25
+
+        Returns
+        -------
+        dict
+            Keys are segment symbols and values are their row (and
+            column) in the matrix; row 0 is the empty segment
+        numpy.ndarray
+            Square matrix of distances
+        """
+        if underspec_cost not in self._distances:
+            symbols = sorted(self.matrix.keys())
+            rows = {symbol: i for i, symbol in enumerate(symbols, start = 1)}
+            distances = np.zeros((len(symbols) + 1, len(symbols) + 1))
+            for feature in self.features:
+                values = ['0'] + [self.matrix[symbol].get(feature) for symbol in symbols]
+                codes = {v: i for i, v in enumerate(sorted(set(values), key = str))}
+                column = np.array([codes[v] for v in values])
+                missing = np.array([v is None for v in values])
+                unspecified = np.array([v == '0' for v in values])
+                different = column[:, None] != column[None, :]
+                either_unspecified = unspecified[:, None] | unspecified[None, :]
+                cost = np.where(either_unspecified, underspec_cost, 1.0)
+                cost[~different | missing[:, None] | missing[None, :]] = 0
+                distances += cost
+            self._distances[underspec_cost] = (rows, distances)
+        return self._distances[underspec_cost]
+
+    def invalidate_distances(self):
+        """
+        Clear the cached segment distances (see `segment_distances`),
+        after the feature specifications have been changed
+        """
+        self._distances = {}
 
     @property
     def trans_name(self):
@@ -621,10 +861,16 @@ class FeatureMatrix(object):
             return True
 
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_distances', None)
+        return state
+
     def __setstate__(self,state):
         if 'features' not in state:
             state['features'] = state['_features']
         self.__dict__.update(state)
+        self._distances = {}
 
         #Backwards compatability
         if '_default_value' not in state:
@@ -658,6 +904,7 @@ class FeatureMatrix(object):
             for f in self._features:
                 if f not in v:
                     self.matrix[k][f] = self._default_value
+        self.invalidate_distances()
 
     def set_major_class_features(self, source):
         self.vowel_feature = source.vowel_feature
@@ -702,6 +949,7 @@ class FeatureMatrix(object):
         # s.set_features(feat_spec)
         # self.matrix[seg] = s._features
         self.matrix[seg] = feat_spec
+        self.invalidate_distances()
 
     def add_feature(self,feature, default = None):
         """
@@ -727,6 +975,7 @@ class FeatureMatrix(object):
                 for f in self._features:
                     if f not in features:
                         self.matrix[seg][f] = default
+            self.invalidate_distances()
 
 
     def valid_feature_strings(self):
@@ -871,6 +1120,7 @@ class FeatureMatrix(object):
             if assign_defaults:
                 self.matrix[symbol] = {feature:'n' for feature in self.features}
                 features = self.matrix[symbol]
+                self.invalidate_distances()
             else:
                 raise KeyError(symbol)
         return features
@@ -887,6 +1137,7 @@ class FeatureMatrix(object):
 
     def __delitem__(self,item):
         del self.matrix[item]
+        self.invalidate_distances()
 
     def __contains__(self,item):
         return item in list(self.matrix.keys())
@@ -896,10 +1147,19 @@ class FeatureMatrix(object):
             self.matrix[key] = value
         if isinstance(key, Segment):
             self.matrix[key.symbol] = value
+        self.invalidate_distances()
 
     def __len__(self):
         return len(self.matrix)
 
+_descriptor_tuples = {}
+
+def _shared_descriptors(descriptors):
+    # Words of a corpus almost always have the same descriptors, so they
+    # share one tuple instead of holding a list each
+    descriptors = tuple(descriptors)
+    return _descriptor_tuples.setdefault(descriptors, descriptors)
+
 class Word(object):
     """An object representing a word in a corpus
 
@@ -922,6 +1182,10 @@ class Word(object):
                        'alt_transcriptions': list(), 'alt_spellings': list(),
                        '_frequency':0, 'wordtokens':list(),
                        'descriptors':list()}
+    # The fixed attributes live in slots, and only the corpus' own
+    # attributes (Spelling, Transcription, Frequency, etc.) go into the
+    # instance dictionary
+    __slots__ = tuple(word_attributes) + ('__dict__', '__weakref__')
     _freq_names = ['abs_freq', 'freq_per_mil','sfreq', 'lowercase_freq', 'log10_freq', 'freq', 'frequency']
 
     def __init__(self, **kwargs):
@@ -1021,6 +1285,10 @@ class Word(object):
             else:
                 self._transcription = None
 
+        self.descriptors = _shared_descriptors(self.descriptors)
+        self.alt_transcriptions = tuple(self.alt_transcriptions)
+        self.alt_spellings = tuple(self.alt_spellings)
+
     def initDefaults(self):
         for attribute, default_value in Word.word_attributes.items():
             if isinstance(default_value, list):
@@ -1098,6 +1366,7 @@ class Word(object):
             for wt in old_word.wordtokens:
                 self.wordtokens.append(copy.copy(wt))
 
+        self.descriptors = list(self.descriptors)
         self.descriptors.extend([att for att in Word.word_attributes if not att.startswith('_')])
 
         if not self._transcription:
@@ -1140,7 +1409,7 @@ class Word(object):
             pass
         self.descriptors.append('Frequency')
 
-        self.descriptors = list(set(self.descriptors))
+        self.descriptors = _shared_descriptors(set(self.descriptors))
 
     def get_len(self, tier_name):
         return len(getattr(self, tier_name))
@@ -1161,6 +1430,14 @@ class Word(object):
 
     def __getstate__(self):
         state = self.__dict__.copy()
+        for attribute, default_value in Word.word_attributes.items():
+            try:
+                value = getattr(self, attribute)
+            except AttributeError:
+                continue
+            if isinstance(default_value, list) and isinstance(value, tuple):
+                value = list(value)
+            state[attribute] = value
         # state['wordtokens'] = []
         # state['_corpus'] = None
         # for k,v in state.items():
@@ -1176,6 +1453,7 @@ class Word(object):
             state['wordtokens'] = []
         if 'descriptors' not in state:
             state['descriptors'] = ['_spelling','_transcription', '_frequency']
+        state['descriptors'] = list(state['descriptors'])
         if '_frequency' not in state['descriptors']:
             state['descriptors'].append('_frequency')
         try:
@@ -1184,6 +1462,13 @@ class Word(object):
                 state['descriptors'].append(t)
         except KeyError:
             pass
+        state['descriptors'] = _shared_descriptors(state['descriptors'])
+        for attribute in ['alt_transcriptions', 'alt_spellings']:
+            if attribute in state:
+                state[attribute] = tuple(state[attribute])
+        for attribute in Word.word_attributes:
+            if attribute in state:
+                setattr(self, attribute, state.pop(attribute))
         self.__dict__.update(state)
 
     def add_abstract_tier(self, tier_name, tier_segments):
@@ -1457,6 +1742,7 @@ class EnvironmentFilter(object):
                 self._middle.add(m)
             elif isinstance(m, (list, tuple, set)):
                 self._middle.update(m)
+        self._compiled = None
 
     def is_applicable(self, sequence):
         """
@@ -1479,8 +1765,67 @@ class EnvironmentFilter(object):
             return False
         return True
 
+    def _position_re(self, segments):
+        if self.special_match_symbol in segments:
+            return '.'
+        if not segments:
+            return '(?!)'
+        return '[' + ''.join(re.escape(segment_code(s)) for s in segments) + ']'
+
     def compile_re_pattern(self):
-        pass
+        """
+        Compile the EnvironmentFilter into regular expressions over
+        sequences encoded with `encode_segments` (word boundaries included)
+
+        The patterns are cached until the filter is changed, and are not
+        pickled, since segment codes are only valid within one process.
+
+        Returns
+        -------
+        tuple
+            A pattern whose (overlapping) matches start at each window
+            that fits the filter, the same for the filter without its zero
+            positions (None if it has none), and a pattern that checks
+            only the left and right hand sides, with any middle segment
+        """
+        if getattr(self, '_compiled', None) is not None:
+            return self._compiled
+        lhs = [self._position_re(s) for s in self.lhs] if self.lhs is not None else []
+        rhs = [self._position_re(s) for s in self.rhs] if self.rhs is not None else []
+        middle = self._position_re(self._middle)
+        pattern = re.compile('(?=' + ''.join(lhs) + middle + ''.join(rhs) + ')', re.DOTALL)
+        if any(self.zeroPositions):
+            positions = [self._position_re(s) for s in self.without_zero_positions()]
+            zeroes_pattern = re.compile('(?=' + ''.join(positions) +
+                                        '.{{{}}})'.format(len(self) - len(positions)), re.DOTALL)
+        else:
+            zeroes_pattern = None
+        context_pattern = re.compile(''.join(lhs) + '.' + ''.join(rhs), re.DOTALL)
+        self._compiled = (pattern, zeroes_pattern, context_pattern)
+        return self._compiled
+
+    def context_matches(self, encoded, position):
+        """
+        Check whether the left and right hand sides of the filter fit
+        around a position, whatever the segment at that position is
+
+        Parameters
+        ----------
+        encoded : str
+            Sequence encoded with `encode_segments`, including word
+            boundaries
+        position : int
+            Position of the middle segment in `encoded`
+
+        Returns
+        -------
+        bool
+            True if the environment around `position` fits the filter
+        """
+        start = position - self.lhs_count()
+        if start < 0:
+            return False
+        return self.compile_re_pattern()[2].match(encoded, start) is not None
 
     def lhs_count(self):
         """
@@ -1510,12 +1855,19 @@ class EnvironmentFilter(object):
 
     def set_lhs(self, lhs):
         self.lhs = lhs
+        self._compiled = None
         self.compile_re_pattern()
 
     def set_rhs(self, rhs):
         self.rhs = rhs
+        self._compiled = None
         self.compile_re_pattern()
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_compiled'] = None
+        return state
+
     def __iter__(self):
         if self.lhs is not None:
             for s in self.lhs:
@@ -2277,19 +2629,29 @@ class Corpus(object):
         new_corpus._attributes = [Attribute(x.name, x.att_type, x.display_name)
                     for x in self.attributes]
 
-        for word in self:
-            for f in filters:
-                if f[0].att_type == 'numeric':
-                    op = f[1]
-                    if not op(getattr(word,f[0].name), f[2]):
-                        break
-                elif f[0].att_type == 'factor':
-                    if getattr(word,f[0].name) not in f[1]:
-                        break
-            else:
-                new_corpus.add_word(word)
+        store = self.columnar([f[0] for f in filters])
+        for i in np.flatnonzero(store.mask(filters)):
+            new_corpus.add_word(self.wordlist[store.keys[i]])
         return new_corpus
 
+    def columnar(self, attributes = None):
+        """
+        Get a column-oriented snapshot of the corpus for vectorised
+        operations over all words (see ``ColumnarCorpus``)
+
+        Parameters
+        ----------
+        attributes : list of Attribute, optional
+            Attributes to include, defaults to all attributes
+
+        Returns
+        -------
+        ColumnarCorpus
+            Snapshot of the current words in the corpus
+        """
+        from .columnar import ColumnarCorpus
+        return ColumnarCorpus(self, attributes)
+
     @property
     def attributes(self):
         #'transcription', 'spelling' and 'frequency' are special attributes which are acually
@@ -2443,10 +2805,14 @@ class Corpus(object):
             tier_segs = self.features_to_segments(spec)
         else:
             tier_segs = spec
-        for word in self:
-            v = sum([1 for x in getattr(word, sequence_type) if x in tier_segs])
+        from .columnar import TierColumn
+        column = TierColumn.from_sequences(getattr(word, sequence_type) for word in self)
+        counts = column.count(tier_segs).tolist()
+        for word, v in zip(self, counts):
             setattr(word, attribute.name, v)
-            attribute.update_range(v)
+        if counts:
+            attribute.update_range(min(counts))
+            attribute.update_range(max(counts))
 
     def add_tier(self, attribute, spec):
         """
@@ -2748,8 +3114,8 @@ class Corpus(object):
                         added_default = True
                     self.inventory.segs[s].features = self.specifier[s]
 
-        if transcription.stress_pattern:
-            for k,v in transcription.stress_pattern.items():
+        if transcription._stress_pattern:
+            for k,v in transcription._stress_pattern.items():
                 self.inventory.stresses[v].add(transcription[k])
 
         return added_default
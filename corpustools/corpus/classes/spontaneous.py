@@ -429,7 +429,13 @@ class WordToken():
 
     """
     wordtoken_attributes = {'wordtype': None, 'discourse': None, 'speaker': None, 'wavpath': None, 'begin': None,
-                            'end': None, '_spelling': None, '_transcription': None, '_freq_names': None}
+                            'end': None, '_spelling': None, '_transcription': None}
+    # The fixed attributes live in slots, and only the corpus' own
+    # attributes go into the instance dictionary
+    slot_attributes = tuple(wordtoken_attributes) + ('begins', 'ends', '_frequency')
+    __slots__ = slot_attributes + ('__dict__', '__weakref__')
+    _freq_names = ['abs_freq', 'freq_per_mil', 'sfreq', 'lowercase_freq', 'log10_freq']
+
     def __init__(self,update=False,**kwargs):
 
         if update:
@@ -446,7 +452,6 @@ class WordToken():
         self.ends = self.end
         self._spelling = None
         self._transcription = None
-        self._freq_names = ['abs_freq', 'freq_per_mil', 'sfreq', 'lowercase_freq', 'log10_freq']
 
         for key, value in kwargs.items():
             if not all([letter.isupper() for letter in key]):
@@ -511,6 +516,12 @@ class WordToken():
             if not hasattr(self, attribute):
                 setattr(self, attribute, value)
 
+        for attribute in WordToken.slot_attributes:
+            try:
+                setattr(self, attribute, getattr(old_token, attribute))
+            except AttributeError:
+                pass
+
         for attribute, default_value in WordToken.wordtoken_attributes.items():
             if hasattr(old_token, attribute):
                 setattr(self, attribute, getattr(old_token, attribute))
@@ -519,10 +530,20 @@ class WordToken():
 
     def __getstate__(self):
         state = self.__dict__.copy()
+        for attribute in WordToken.slot_attributes:
+            try:
+                state[attribute] = getattr(self, attribute)
+            except AttributeError:
+                pass
         state['wavpath'] = None
         return state
 
     def __setstate__(self, state):
+        state = state.copy()
+        state.pop('_freq_names', None)
+        for attribute in WordToken.slot_attributes:
+            if attribute in state:
+                setattr(self, attribute, state.pop(attribute))
         self.__dict__.update(state)
 
     def __eq__(self, other):
@@ -1,7 +1,36 @@
 
 from urllib.request import urlretrieve
 import pickle
+import struct
+import mmap
+import io
 import os
+import hashlib
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from corpustools.corpus.classes import Corpus, Word
+
+# Start of files in the sectioned binary format, as opposed to plain pickles
+MAGIC = b'PCTBIN\r\n'
+
+# Version of the sectioned format written by save_binary
+FORMAT_VERSION = 1
+
+# Number of words pickled together in one section of a Corpus file
+WORDS_PER_SECTION = 10000
+
+SECTION_OBJECT = 0
+SECTION_WORDS = 1
+SECTION_INDEX = 2
+
+_header = struct.Struct('<8sHI')
+_section_header = struct.Struct('<BQI')
+
+# Attributes of a Word outside its instance dictionary, apart from its corpus
+_word_slots = [a for a in Word.__slots__ if a not in ('_corpus', '__dict__', '__weakref__')]
+
 
 def download_binary(name, path, call_back = None):
     """
@@ -87,27 +116,365 @@ def download_binary(name, path, call_back = None):
     filename, headers = urlretrieve(download_link, path, reporthook=report)
     return True
 
-def load_binary(path):
+class _LoadCancelled(Exception):
+    pass
+
+
+class _ProgressReader(object):
+    """
+    File wrapper for the C unpickler that reports how far through the
+    file it has read and cancels the load when asked to
+    """
+    def __init__(self, f, call_back = None, stop_check = None):
+        self.f = f
+        self.call_back = call_back
+        self.stop_check = stop_check
+
+    def _check(self):
+        if self.stop_check is not None and self.stop_check():
+            raise _LoadCancelled()
+        if self.call_back is not None:
+            self.call_back(self.f.tell())
+
+    def read(self, n = -1):
+        self._check()
+        return self.f.read(n)
+
+    def readinto(self, b):
+        self._check()
+        return self.f.readinto(b)
+
+    def readline(self):
+        return self.f.readline()
+
+    def peek(self, n = 0):
+        return self.f.peek(n)
+
+
+class _CorpusPickler(pickle.Pickler):
+    """
+    Pickler that writes named references in place of some objects (the
+    Corpus being saved or its wordlist), so that the words of a Corpus
+    can be split across sections
     """
-    Unpickle a binary file
+    def __init__(self, f, references):
+        super().__init__(f, protocol = pickle.HIGHEST_PROTOCOL)
+        self.references = references
+
+    def persistent_id(self, obj):
+        return self.references.get(id(obj))
+
+
+class _CorpusUnpickler(pickle.Unpickler):
+    def __init__(self, f, references):
+        super().__init__(f)
+        self.references = references
+
+    def persistent_load(self, pid):
+        return self.references[pid]
+
+
+def _write_section(f, kind, count, write):
+    start = f.tell()
+    f.write(_section_header.pack(kind, 0, count))
+    write(f)
+    end = f.tell()
+    f.seek(start)
+    f.write(_section_header.pack(kind, end - start - _section_header.size, count))
+    f.seek(end)
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class _BufferReader(object):
+    """
+    Read-only file interface to a buffer, for unpickling straight from a
+    memory-mapped file without copying the whole pickle first
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.position = 0
+
+    def read(self, n = -1):
+        start = self.position
+        if n is None or n < 0:
+            self.position = len(self.buffer)
+        else:
+            self.position = min(start + n, len(self.buffer))
+        return self.buffer[start:self.position].tobytes()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        start = self.position
+        while self.position < len(self.buffer) and self.buffer[self.position] != 10:
+            self.position += 1
+        self.position = min(self.position + 1, len(self.buffer))
+        return self.buffer[start:self.position].tobytes()
+
+
+class LazyWordlist(MutableMapping):
+    """
+    Wordlist of a Corpus loaded with ``load_binary(path, lazy = True)``
+
+    The corpus file is memory-mapped and each section of words is
+    unpickled from the mapping when one of its words is accessed. Only
+    the ``max_sections`` most recently used sections are kept, so a pass
+    over a large corpus does not hold all of its words, but every pass
+    unpickles them again. The attributes of a section's words are hashed
+    when it is unpickled and again when it is dropped: a section whose
+    words have changed is kept in memory for good, and so are words
+    that are still referenced elsewhere, so changes to words are never
+    lost and a word stays the same object while it is in use. Words that
+    are added or replaced are kept in memory. The mapping is closed once
+    no words are left to read from it.
+
+    Parameters
+    ----------
+    path : str
+        Full path of the corpus file
+    references : dict
+        Objects that the pickled words refer to (the Corpus)
+    max_sections : int
+        Number of unchanged sections to keep unpickled; corpora with no
+        more sections than this are kept in memory once loaded
+    """
+    def __init__(self, path, references, max_sections = 5):
+        self.path = path
+        self.references = references
+        self.max_sections = max_sections
+        self._sections = []
+        self._keys = {}
+        self._words = {}
+        self._loaded = OrderedDict()
+        self._held = {}
+        self._fingerprints = {}
+        self._buffer = None
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+    def _keep(self, index, words):
+        """Keep the words of a section in memory for good"""
+        for k, word in words.items():
+            if self._keys.get(k) == index:
+                self._keys[k] = None
+                self._words[k] = word
+        self._sections[index] = None
+        self._fingerprints.pop(index, None)
+
+    def _close(self):
+        """Close the mapping if no words are left to read from it"""
+        if self._buffer is None:
+            return
+        unread = set(self._keys.values()) - set([None])
+        if unread - set(self._loaded):
+            return
+        for index in list(self._loaded):
+            if self._changed(index):
+                self._keep(index, self._loaded.pop(index))
+        if all(index is None for index in self._keys.values()):
+            self._buffer.close()
+            self._buffer = None
+
+    def _changed(self, index):
+        """Check whether the words of an unpickled section have changed
+        since it was loaded"""
+        saved = self._fingerprints.get(index)
+        return saved is None or self._fingerprint(self._loaded[index]) != saved
+
+    def _fingerprint(self, words):
+        """Hash the attributes of words (other than their corpus)"""
+        states = [(word.__dict__, [getattr(word, a, None) for a in _word_slots])
+                  for word in words.values()]
+        try:
+            return hashlib.sha1(pickle.dumps(states, protocol = pickle.HIGHEST_PROTOCOL)).digest()
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return None
+
+    def add_section(self, start, length, keys):
+        """
+        Register a section of words that has not been unpickled
+
+        Parameters
+        ----------
+        start : int
+            Offset of the pickled words in the file
+        length : int
+            Length of the pickled words in bytes
+        keys : list
+            Keys of the words in the section
+        """
+        index = len(self._sections)
+        self._sections.append((start, length))
+        for k in keys:
+            self._keys[k] = index
+
+    def _section(self, index):
+        """Get all words pickled in a section, unpickling it if needed"""
+        if index in self._loaded:
+            self._loaded.move_to_end(index)
+            return self._loaded[index]
+        if self._buffer is None:
+            self._open()
+        start, length = self._sections[index]
+        with memoryview(self._buffer)[start:start + length] as buffer:
+            words = _CorpusUnpickler(_BufferReader(buffer), self.references).load()
+        if len(self._sections) > self.max_sections:
+            self._fingerprints[index] = self._fingerprint(words)
+        # Words that were in use when the section was last dropped, which
+        # count as changes if they were edited since
+        words.update(self._held.pop(index, {}))
+        self._loaded[index] = words
+        while len(self._loaded) > self.max_sections:
+            self._drop(next(iter(self._loaded)))
+        return words
+
+    def _drop(self, index):
+        """Stop keeping the words of an unpickled section, unless they
+        have changed since they were loaded"""
+        changed = self._changed(index)
+        words = self._loaded.pop(index)
+        self._fingerprints.pop(index, None)
+        if changed:
+            self._keep(index, words)
+            self._close()
+            return
+        # Keep the words that are still referenced, so that they are not
+        # replaced by new copies (or lose changes made to them) later
+        refs = {k: weakref.ref(word) for k, word in words.items()}
+        del words
+        held = {k: ref() for k, ref in refs.items() if ref() is not None}
+        if held:
+            self._held[index] = held
+
+    def __getitem__(self, key):
+        index = self._keys[key]
+        if index is None:
+            return self._words[key]
+        return self._section(index)[key]
+
+    def __setitem__(self, key, word):
+        self._keys[key] = None
+        self._words[key] = word
+
+    def __delitem__(self, key):
+        del self._keys[key]
+        self._words.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        self._close()
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __reduce__(self):
+        return (dict, (dict(self.items()),))
+
+
+def load_binary(path, call_back = None, stop_check = None, convert = False,
+                lazy = False):
+    """
+    Load a Corpus, FeatureMatrix or other object saved by ``save_binary``
+
+    Files saved by older versions of PCT (plain pickles) are also
+    loaded, and can be converted to the current format.
 
     Parameters
     ----------
     path : str
         Full path of binary file to load
+    call_back : callable, optional
+        Function that can handle strings (text updates of progress),
+        tuples of two integers (0, total number of bytes) and an integer
+        for updating progress out of the total set by a tuple
+    stop_check : callable, optional
+        Function that returns True when loading should be cancelled
+    convert : bool
+        If True, files in the old format are saved again in the current
+        format after loading
+    lazy : bool
+        If True, the words of a Corpus are only unpickled when they are
+        first accessed (see ``LazyWordlist``); Corpora with word tokens
+        and files in the old format are always loaded in full
 
     Returns
     -------
     Object
-        Object generated from the text file
+        Object saved in the file, or None if loading was cancelled
     """
-    with open(path,'rb') as f:
-        obj = pickle.load(f)
+    if call_back is not None:
+        call_back('Loading...')
+        call_back(0, os.path.getsize(path))
+    with open(path, 'rb') as f:
+        reader = _ProgressReader(f, call_back, stop_check)
+        try:
+            if f.peek(len(MAGIC))[:len(MAGIC)] != MAGIC:
+                obj = pickle.Unpickler(reader).load()
+                old_format = True
+            else:
+                obj = _load_sections(f, reader, lazy)
+                old_format = False
+        except _LoadCancelled:
+            return None
+    if old_format and convert:
+        try:
+            save_binary(obj, path)
+        except OSError:
+            pass
     return obj
 
+
+def _load_sections(f, reader, lazy = False):
+    magic, version, num_sections = _header.unpack(f.read(_header.size))
+    if version > FORMAT_VERSION:
+        raise pickle.UnpicklingError('{} was saved by a newer version of PCT '
+                    '(format version {}).'.format(f.name, version))
+    references = {'wordlist': {}}
+    obj = None
+    index = None
+    for i in range(num_sections):
+        kind, length, count = _section_header.unpack(f.read(_section_header.size))
+        start = f.tell()
+        if kind == SECTION_INDEX and lazy:
+            index = _CorpusUnpickler(reader, references).load()
+            wordlist = LazyWordlist(f.name, references)
+            wordlist.update(obj.wordlist)
+            obj.wordlist = references['wordlist'] = wordlist
+        elif kind == SECTION_WORDS and index is not None:
+            references['wordlist'].add_section(start, length, index.pop(0))
+        elif kind == SECTION_OBJECT:
+            obj = _CorpusUnpickler(reader, references).load()
+            references['corpus'] = obj
+        elif kind == SECTION_WORDS:
+            references['wordlist'].update(_CorpusUnpickler(reader, references).load())
+        f.seek(start + length)
+    return obj
+
+
 def save_binary(obj, path):
     """
-    Pickle a Corpus or FeatureMatrix object for later loading
+    Save a Corpus, FeatureMatrix or other object for later loading
+
+    The file starts with a header (``MAGIC``, the format version and the
+    number of sections), followed by sections that are each a header
+    (kind, length in bytes and number of items) and a pickle. A Corpus
+    is saved as one section for the Corpus itself, one for the keys of
+    the words in each following section, and sections of
+    ``WORDS_PER_SECTION`` words; other objects are saved as a single
+    section. The file is written to a temporary file first, so that an
+    existing file is only replaced once saving has succeeded.
 
     Parameters
     ----------
@@ -118,62 +485,18 @@ def save_binary(obj, path):
         Full path for where to save object
 
     """
-    with open(path,'wb') as f:
-        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
-
-
-class PCTUnpickler(pickle._Unpickler):
-
-    def __init__(self, path, call_back = None, stop_check = None):
-        self.path = path
-        self.file = open(path, mode='rb')
-        self.call_back = call_back
-        self.stop_check = stop_check
-        super().__init__(self.file)
-
-    def __del__(self):
-        self.file.close()
-
-    def load(self):
-        """Read a pickled object representation from the open file.
-
-        Return the reconstituted object hierarchy specified in the file.
-        """
-        # Check whether Unpickler was initialized correctly. This is
-        # only needed to mimic the behavior of _pickle.Unpickler.dump().
-        if not hasattr(self, "_file_read"):
-            raise pickle.UnpicklingError("Unpickler.__init__() was not called by "
-                                  "%s.__init__()" % (self.__class__.__name__,))
-        self._unframer = pickle._Unframer(self._file_read, self._file_readline)
-        self.read = self._unframer.read
-        self.readline = self._unframer.readline
-        self.mark = object()  # any new unique object
-        self.metastack = [] # for compatability with Python 3.6
-        self.stack = []
-        self.append = self.stack.append
-        self.proto = 0
-        read = self.read
-        dispatch = self.dispatch
-        if self.call_back is not None:
-            self.call_back('Loading...')
-            self.call_back(0, os.path.getsize(self.path))
-            cur = 0
-        n = 0
-        try:
-            while True:
-                n+=1
-                if n == 1024:
-                    n = 0
-                    if self.stop_check is not None and self.stop_check():
-                        self.file.close()
-                        raise pickle._Stop(None)
-                    if self.call_back is not None:
-                        cur += 1
-                        self.call_back(cur)
-                key = read(1)
-                if not key:
-                    raise EOFError
-                assert isinstance(key, (bytes, bytearray))
-                dispatch[key[0]](self)
-        except pickle._Stop as stopinst:
-            return stopinst.value
\ No newline at end of file
+    sections = [(SECTION_OBJECT, 1, obj, {})]
+    if isinstance(obj, Corpus) and not obj.has_wordtokens:
+        sections[0][3][id(obj.wordlist)] = 'wordlist'
+        words = list(obj.wordlist.items())
+        keys = [[k for k, w in chunk] for chunk in _chunks(words, WORDS_PER_SECTION)]
+        sections.append((SECTION_INDEX, len(keys), keys, {}))
+        sections.extend((SECTION_WORDS, len(chunk), dict(chunk), {id(obj): 'corpus'})
+                        for chunk in _chunks(words, WORDS_PER_SECTION))
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(_header.pack(MAGIC, FORMAT_VERSION, len(sections)))
+        for kind, count, section, references in sections:
+            _write_section(f, kind, count,
+                           lambda f: _CorpusPickler(f, references).dump(section))
+    os.replace(temp_path, path)
@@ -1,16 +1,18 @@
-import re
 from collections import defaultdict
 from math import *
 import itertools
 from math import factorial
+from functools import partial
 import time
 
 from corpustools.exceptions import FuncLoadError 
 from corpustools.funcload.io import save_minimal_pairs 
-from corpustools.corpus.classes.lexicon import EnvironmentFilter
+from corpustools.corpus.classes.lexicon import EnvironmentFilter, encode_segments
+from corpustools.multiprocessing import context_map
 
 
-def is_minpair(first, second, corpus_context, segment_pairs, environment_filter): 
+def is_minpair(first, second, corpus_context, segment_pairs, environment_filter,
+                environment_bitmaps = None):
     """Return True iff first/second are a minimal pair.
     Checks that all segments in those words are identical OR a valid segment pair
     (from segment_pairs) and fit the environment_filter, and that there is at least
@@ -27,18 +29,27 @@ def is_minpair(first, second, corpus_context, segment_pairs, environment_filter)
         list of length-2 tuples of str
     environment_filter: Environment
         The environment in which words should be evaluated for being a minimal pair.
+    environment_bitmaps: tuple of int, optional
+        The `environment_bitmap` of first and second, if already calculated.
     
     """
     first = getattr(first, corpus_context.sequence_type)
     second = getattr(second, corpus_context.sequence_type)
     if len(first) != len(second):
         return False
+    if not environment_filter:
+        fits = -1
+    elif environment_bitmaps is not None:
+        fits = environment_bitmaps[0] & environment_bitmaps[1]
+    else:
+        fits = (environment_bitmap(first, environment_filter)
+                & environment_bitmap(second, environment_filter))
     has_difference = False
     for i in range(len(first)):
         if first[i] == second[i]:
             continue
         elif (conflateable(first[i], second[i], segment_pairs) 
-            and fits_environment(first, second, i, environment_filter)): 
+            and fits >> i & 1): 
             has_difference = True
             continue
         else:
@@ -77,44 +88,111 @@ def fits_environment(w1, w2, index, environment_filter):
     if not environment_filter:
         return True
 
-    def ready_for_re(word, index):
-        w = [str(seg) for seg in word]
-        w[index] = '_'
-        return ' '.join(w)
-
-    w1 = ready_for_re(w1, index)
-    w2 = ready_for_re(w2, index)
+    w1 = encode_segments(['#'] + [str(seg) for seg in w1] + ['#'])
+    w2 = encode_segments(['#'] + [str(seg) for seg in w2] + ['#'])
     for env in environment_filter:
-        env_re = make_environment_re(env)
-        if not (bool(re.search(env_re, w1)) and bool(re.search(env_re, w2))):
+        if not (env.context_matches(w1, index + 1) and env.context_matches(w2, index + 1)):
             return False
     return True
 
-def ready_for_re(word, index):
-        w = [str(seg) for seg in word]
-        w[index] = '_'
-        return ' '.join(w)
+def environment_bitmap(tier, environment_filter):
+    """Return an int whose i'th bit is set iff the environment of the
+    i'th element of tier passes every filter in environment_filter.
 
-def make_environment_re(environment_filter): 
-    if environment_filter.lhs:
-        re_lhs = ' '.join(['('+('|'.join([seg for seg in position])+')') for position in environment_filter.lhs])
-        re_lhs = re_lhs.replace('#', '^')
-    else:
-        re_lhs = ''
+    Computing this once per word replaces a `fits_environment` call for
+    every position at which two candidate words differ.
 
-    if environment_filter.rhs:
-        re_rhs = ' '.join(['('+('|'.join([seg for seg in position])+')') for position in environment_filter.rhs])
-        re_rhs = re_rhs.replace('#', '$')
-    else:
-        re_rhs = ''
+    """
+    encoded = encode_segments(['#'] + [str(seg) for seg in tier] + ['#'])
+    bitmap = 0
+    for i in range(len(tier)):
+        if all(env.context_matches(encoded, i + 1) for env in environment_filter):
+            bitmap |= 1 << i
+    return bitmap
+
+def conflation_classes(segment_pairs):
+    """Group the segments of segment_pairs into classes of segments that
+    can be conflated with one another, either directly or through other
+    pairs.
+
+    Parameters
+    ----------
+    segment_pairs: List
+        list of length-2 tuples of str
 
-    if re_lhs and not re_lhs.endswith('^)'):
-        re_lhs += ' '
-    if re_rhs and not re_rhs.endswith('($'):
-        re_rhs = ' ' + re_rhs
-    return re_lhs + '_' + re_rhs
+    Returns
+    -------
+    dict
+        Mapping from each segment symbol to the integer label of its class
+    """
+    classes = {}
+    for segment_pair in segment_pairs:
+        labels = set(classes[s] for s in segment_pair if s in classes)
+        if labels:
+            label = min(labels)
+        else:
+            label = len(segment_pairs) + len(classes)
+        for s, l in list(classes.items()):
+            if l in labels:
+                classes[s] = label
+        for s in segment_pair:
+            classes[s] = label
+    return classes
 
 
+def masked_key(tier, classes):
+    """Return the tier with every segment that belongs to a conflation class
+    replaced by that class' label, so that words that can only differ in
+    conflatable segments share a key.
+
+    Parameters
+    ----------
+    tier: Transcription or str
+        The sequence to mask
+    classes: dict
+        Mapping from segment symbols to class labels, see `conflation_classes`
+
+    Returns
+    -------
+    tuple
+        The masked sequence
+    """
+    return tuple(classes.get(seg, seg) for seg in tier)
+
+
+def minpair_candidates(words, sequence_type, segment_pairs):
+    """Find the pairs of words that can be minimal pairs for segment_pairs
+    by bucketing the words under their masked keys.
+
+    Every minimal pair shares a bucket, so the returned candidates are a
+    superset of the minimal pairs and still have to be checked with
+    `is_minpair`.
+
+    Parameters
+    ----------
+    words: list of Word
+        The words to search
+    sequence_type: str
+        The tier of the words to compare
+    segment_pairs: List
+        list of length-2 tuples of str
+
+    Returns
+    -------
+    list of tuple(int, int)
+        Index pairs into `words`, in the order that
+        ``itertools.combinations(range(len(words)), 2)`` would produce them
+    """
+    classes = conflation_classes(segment_pairs)
+    buckets = defaultdict(list)
+    for i, w in enumerate(words):
+        buckets[masked_key(getattr(w, sequence_type), classes)].append(i)
+    candidates = []
+    for bucket in buckets.values():
+        candidates.extend(itertools.combinations(bucket, 2))
+    candidates.sort()
+    return candidates
+
 # This is the function I really edited
 # I changed the parameter called 'relative_count' to 'relative_count_to_relevant_sounds' and changed its default value.
 # I added a new parameter, 'relative_count_to_whole_corpus', and set its default to true.
@@ -194,33 +272,83 @@ def minpair_fl(corpus_context, segment_pairs,
     if stop_check is not None and stop_check():
         return
 
+    ## With an environment filter, work out once per word which of its
+    ## positions are in the environment; words with no such positions
+    ## cannot be part of a minimal pair
+    if environment_filter:
+        for env in environment_filter:
+            env.compile_re_pattern()
+        bitmaps = [environment_bitmap(getattr(w, corpus_context.sequence_type),
+                                      environment_filter)
+                    for w in contain_target_segment]
+        eligible = [i for i, b in enumerate(bitmaps) if b]
+    else:
+        bitmaps = None
+        eligible = list(range(len(contain_target_segment)))
+
     ## Find minimal pairs
+    ## Only words that share a masked key can be minimal pairs, so each
+    ## candidate pair comes from a bucket collision instead of a comparison
+    ## of every word with every other word
+    candidates = minpair_candidates([contain_target_segment[i] for i in eligible],
+                                    corpus_context.sequence_type, segment_pairs)
     minpairs = []
     if call_back is not None:
         call_back('Finding minimal pairs...')
-        if len(contain_target_segment) >= 2:
-            call_back(0,factorial(len(contain_target_segment))/(factorial(len(contain_target_segment)-2)*2))
+        call_back(0, len(candidates))
         cur = 0
-    for first, second in itertools.combinations(contain_target_segment, 2):
+    for i, j in candidates:
         if stop_check is not None and stop_check():
             return
         if call_back is not None:
             cur += 1
             if cur % 100 == 0:
                 call_back(cur)
-        if is_minpair(first, second, corpus_context, segment_pairs, environment_filter):
+        i, j = eligible[i], eligible[j]
+        first = contain_target_segment[i]
+        second = contain_target_segment[j]
+        if is_minpair(first, second, corpus_context, segment_pairs, environment_filter,
+                environment_bitmaps = (bitmaps[i], bitmaps[j]) if bitmaps else None):
             ordered_pair = sorted([(first, getattr(first, corpus_context.sequence_type)),
                                    (second, getattr(second, corpus_context.sequence_type))],
                                    key = lambda x: x[1]) # sort by tier/transcription
             minpairs.append(tuple(ordered_pair))
 
     ## Generate output 
+    if stop_check is not None and stop_check():
+        return
+    result = count_minpairs(minpairs, distinguish_homophones)
+
+    if relative_count_to_relevant_sounds and len(contain_target_segment) > 0:
+        result /= sum(x.frequency for x in contain_target_segment)
+        
+    elif relative_count_to_whole_corpus:
+        result = result / num_words_in_corpus
+    
+    return (result, minpairs)
+
+
+def count_minpairs(minpairs, distinguish_homophones):
+    """Count minimal pairs, weighting each pair by the average frequency
+    of its two words.
+
+    Parameters
+    ----------
+    minpairs : list
+        Minimal pairs as returned by `minpair_fl`
+    distinguish_homophones : bool
+        If False, pairs with the same two transcriptions are counted once,
+        using the most frequent such pair
+
+    Returns
+    -------
+    int or float
+        The (frequency-weighted) count of minimal pairs
+    """
     if not distinguish_homophones:
         actual_minpairs = {}
 
         for pair in minpairs:
-            if stop_check is not None and stop_check():
-                return
             key = (pair[0][1], pair[1][1]) # Keys are tuples of transcriptions
             if key not in actual_minpairs:
                 actual_minpairs[key] = (pair[0][0], pair[1][0]) # Values are words
@@ -230,18 +358,9 @@ def minpair_fl(corpus_context, segment_pairs,
                                 actual_minpairs[key][1].frequency
                 if pair_freq > existing_freq:
                     actual_minpairs[key] = (pair[0][0], pair[1][0])
-        result = sum((x[0].frequency + x[1].frequency)/2
+        return sum((x[0].frequency + x[1].frequency)/2
                     for x in actual_minpairs.values())
-    else:
-        result = sum((x[0][0].frequency + x[1][0].frequency)/2 for x in minpairs)
-
-    if relative_count_to_relevant_sounds and len(contain_target_segment) > 0:
-        result /= sum(x.frequency for x in contain_target_segment)
-        
-    elif relative_count_to_whole_corpus:
-        result = result / num_words_in_corpus
-    
-    return (result, minpairs)
+    return sum((x[0][0].frequency + x[1][0].frequency)/2 for x in minpairs)
 
 
 def deltah_fl(corpus_context, segment_pairs, environment_filter = None, prevent_normalization = False,
@@ -272,10 +391,10 @@ def deltah_fl(corpus_context, segment_pairs, environment_filter = None, prevent_
     """
     if call_back is not None:
         call_back('Finding instances of segments...')
-        call_back(0, len(corpus_context))
-        cur = 0
-    freq_sum = 0
-    original_probs = defaultdict(float)
+    ## The frequency table and the pre-merger entropy are cached by the
+    ## context, so that only words containing a merged segment are visited
+    original_probs, segment_index = corpus_context.get_sequence_probs()
+    preneutr_h = corpus_context.get_sequence_entropy()
 
     all_target_segments = list(itertools.chain.from_iterable(segment_pairs))
     if environment_filter:
@@ -283,31 +402,32 @@ def deltah_fl(corpus_context, segment_pairs, environment_filter = None, prevent_
                                                environment_filter.lhs,
                                                environment_filter.rhs)
 
-    for w in corpus_context:
-        if stop_check is not None and stop_check():
-            return
-        if call_back is not None:
-            cur += 1
-            if cur % 20 == 0:
-                call_back(cur)
-
-        f = w.frequency
-
-        original_probs[getattr(w, corpus_context.sequence_type)] += f
-        freq_sum += f
-
-    original_probs = {k:v/freq_sum for k,v in original_probs.items()}
+    affected = []
+    seen = set()
+    for s in all_target_segments:
+        for k in segment_index.get(str(s), []):
+            if k not in seen:
+                seen.add(k)
+                affected.append(k)
 
     if stop_check is not None and stop_check():
         return
-    preneutr_h = entropy(original_probs.values())
 
+    ## Words without a merged segment are unchanged by the merger, except
+    ## that sequences with the same segments (e.g., differing only in
+    ## stress) collapse. Words outside of the environment are left out
+    ## of the post-merger distribution altogether.
+    if environment_filter:
+        unaffected_h = 0.0
+    else:
+        unaffected_h = corpus_context.get_sequence_entropy(segments_only = True)
+    affected_probs = defaultdict(float)
     neutralized_probs = defaultdict(float)
     if call_back is not None:
         call_back('Neutralizing instances of segments...')
-        call_back(0, len(list(original_probs.keys())))
+        call_back(0, len(affected))
         cur = 0
-    for k,v in original_probs.items():
+    for k in affected:
         if stop_check is not None and stop_check():
             return
         if call_back is not None:
@@ -315,10 +435,14 @@ def deltah_fl(corpus_context, segment_pairs, environment_filter = None, prevent_
             if cur % 100 == 0:
                 call_back(cur)
         if not environment_filter or k.find(filled_environment):
+            v = original_probs[k]
+            affected_probs[tuple(k)] += v
             n = [neutralize_segment(seg, segment_pairs)
                     for seg in k]
             neutralized_probs['.'.join(n)] += v
-    postneutr_h = entropy(neutralized_probs.values())
+    if not environment_filter:
+        unaffected_h -= entropy(affected_probs.values())
+    postneutr_h = unaffected_h + entropy(neutralized_probs.values())
 
     if stop_check is not None and stop_check():
         return
@@ -342,7 +466,7 @@ def deltah_fl(corpus_context, segment_pairs, environment_filter = None, prevent_
 def relative_minpair_fl(corpus_context, segment,
             relative_count_to_relevant_sounds = False, relative_count_to_whole_corpus = True, 
             distinguish_homophones = False, output_filename = None, environment_filter = None,
-            prevent_normalization = False, stop_check = None, call_back = None):
+            prevent_normalization = False, num_cores = -1, stop_check = None, call_back = None):
     """Calculate the average functional load of the contrasts between a
     segment and all other segments, as a count of minimal pairs.
 
@@ -367,6 +491,9 @@ def relative_minpair_fl(corpus_context, segment,
     environment_filter : EnvironmentFilter
         Allows the user to restrict the neutralization process to segments in
         particular segmental contexts
+    num_cores : int, optional
+        Number of processes to spread the segment pairs over; -1 or 1
+        (the default) calculates them one at a time in this process
     stop_check : callable, optional
         Optional function to check whether to gracefully terminate early
     call_back : callable, optional
@@ -388,25 +515,42 @@ def relative_minpair_fl(corpus_context, segment,
 
     results = []
     to_output = []
-    for sp in segment_pairs:
-        res = minpair_fl(corpus_context, [sp],
+    if num_cores == -1 or num_cores == 1:
+        for sp in segment_pairs:
+            res = minpair_fl(corpus_context, [sp],
+                relative_count_to_relevant_sounds = relative_count_to_relevant_sounds,
+                relative_count_to_whole_corpus = relative_count_to_whole_corpus, 
+                distinguish_homophones = distinguish_homophones,
+                environment_filter = environment_filter,
+                prevent_normalization = prevent_normalization,
+                stop_check = stop_check, call_back = call_back)
+            results.append(res[0])
+
+            if output_filename is not None:
+                to_output.append((sp, res[1]))
+    else:
+        if call_back is not None:
+            call_back('Calculating functional loads...')
+        function = partial(minpair_fl,
             relative_count_to_relevant_sounds = relative_count_to_relevant_sounds,
-            relative_count_to_whole_corpus = relative_count_to_whole_corpus, 
+            relative_count_to_whole_corpus = relative_count_to_whole_corpus,
             distinguish_homophones = distinguish_homophones,
             environment_filter = environment_filter,
-            prevent_normalization = prevent_normalization,
-            stop_check = stop_check, call_back = call_back)
-        results.append(res[0])
-
+            prevent_normalization = prevent_normalization)
+        res = context_map(function, [[sp] for sp in segment_pairs], corpus_context,
+                        num_cores, call_back = call_back, stop_check = stop_check)
+        if res is None:
+            return
+        results = [r[0] for r in res]
         if output_filename is not None:
-            to_output.append((sp, res[1]))
+            to_output = [(sp, r[1]) for sp, r in zip(segment_pairs, res)]
     if output_filename is not None:
         save_minimal_pairs(output_filename, to_output)
     return sum(results)/len(segment_pairs)
 
 def relative_deltah_fl(corpus_context, segment,
                 environment_filter = None, prevent_normalization=False,
-                stop_check = None, call_back = None):
+                num_cores = -1, stop_check = None, call_back = None):
     """Calculate the average functional load of the contrasts between a
     segment and all other segments, as the decrease in corpus entropy
     caused by a merger.
@@ -417,6 +561,9 @@ def relative_deltah_fl(corpus_context, segment,
         Context manager for a corpus
     segment : str
         The target segment.
+    num_cores : int, optional
+        Number of processes to spread the segment pairs over; -1 or 1
+        (the default) calculates them one at a time in this process
     stop_check : callable, optional
         Optional function to check whether to gracefully terminate early
     call_back : callable, optional
@@ -433,11 +580,21 @@ def relative_deltah_fl(corpus_context, segment,
     segment_pairs = [(segment,other.symbol) for other in all_segments
                         if other.symbol != segment and other.symbol != '#']
 
-    results = []
-    for sp in segment_pairs:
-        results.append(deltah_fl(corpus_context, [sp], prevent_normalization=prevent_normalization,
-                environment_filter=environment_filter,
-                stop_check = stop_check, call_back = call_back))
+    if num_cores == -1 or num_cores == 1:
+        results = []
+        for sp in segment_pairs:
+            results.append(deltah_fl(corpus_context, [sp], prevent_normalization=prevent_normalization,
+                    environment_filter=environment_filter,
+                    stop_check = stop_check, call_back = call_back))
+    else:
+        if call_back is not None:
+            call_back('Calculating functional loads...')
+        function = partial(deltah_fl, prevent_normalization = prevent_normalization,
+                        environment_filter = environment_filter)
+        results = context_map(function, [[sp] for sp in segment_pairs], corpus_context,
+                        num_cores, call_back = call_back, stop_check = stop_check)
+        if results is None:
+            return
     return sum(results)/len(segment_pairs)
 
 
@@ -499,13 +656,188 @@ def neutralize_segment(segment, segment_pairs):
     return s
 
 
+def pairwise_minpairs(corpus_context, environment_filter = None,
+                    stop_check = None, call_back = None):
+    """Find the minimal pairs for every pair of segments with a single scan
+    of the corpus.
+
+    Every word is indexed under one key for each segment and each pair of
+    segments that it contains, in which the positions of those segments
+    are replaced by a wildcard. Two words that share a key and whose
+    wildcarded segments together make up exactly two segments are a
+    minimal pair for those two segments.
+
+    Parameters
+    ----------
+    corpus_context : CorpusContext
+        Context manager for a corpus
+    environment_filter : EnvironmentFilter
+        Allows the user to restrict the neutralization process to segments in
+        particular segmental contexts
+    stop_check : callable, optional
+        Optional function to check whether to gracefully terminate early
+    call_back : callable, optional
+        Optional function to supply progress information during the function
+
+    Returns
+    -------
+    dict
+        Mapping from alphabetically ordered segment pairs to their minimal
+        pairs, formatted and ordered as in `minpair_fl`
+    dict
+        Mapping from segments and alphabetically ordered segment pairs to
+        the number of words containing them and the sum of their frequencies
+    """
+    sequence_type = corpus_context.sequence_type
+    if call_back is not None:
+        call_back('Indexing words...')
+        call_back(0, len(corpus_context))
+        cur = 0
+    words = []
+    bitmaps = []
+    buckets = defaultdict(list)
+    containing = defaultdict(lambda: [0, 0.0])
+    for i, w in enumerate(corpus_context):
+        if stop_check is not None and stop_check():
+            return
+        if call_back is not None:
+            cur += 1
+            if cur % 100 == 0:
+                call_back(cur)
+        words.append(w)
+        tier = getattr(w, sequence_type)
+        if environment_filter:
+            bitmaps.append(environment_bitmap(tier, environment_filter))
+        present = sorted(set(tier))
+        for masked in itertools.chain(itertools.combinations(present, 1),
+                                      itertools.combinations(present, 2)):
+            key = tuple(None if seg in masked else seg for seg in tier)
+            buckets[key].append((i, masked))
+            counts = containing[masked if len(masked) == 2 else masked[0]]
+            counts[0] += 1
+            counts[1] += w.frequency
+
+    if call_back is not None:
+        call_back('Finding minimal pairs...')
+        call_back(0, len(buckets))
+        cur = 0
+    found = defaultdict(list)
+    for bucket in buckets.values():
+        if stop_check is not None and stop_check():
+            return
+        if call_back is not None:
+            cur += 1
+            if cur % 100 == 0:
+                call_back(cur)
+        for (i, first_masked), (j, second_masked) in itertools.combinations(bucket, 2):
+            pair = tuple(sorted(set(first_masked) | set(second_masked)))
+            if len(pair) != 2:
+                continue
+            if first_masked == second_masked and \
+                    getattr(words[i], sequence_type) == getattr(words[j], sequence_type):
+                continue
+            if environment_filter and not is_minpair(words[i], words[j],
+                                corpus_context, [pair], environment_filter,
+                                environment_bitmaps = (bitmaps[i], bitmaps[j])):
+                continue
+            found[pair].append((i, j))
+
+    minpairs = {}
+    for pair, indices in found.items():
+        minpairs[pair] = []
+        for i, j in sorted(indices):
+            ordered_pair = sorted([(words[i], getattr(words[i], sequence_type)),
+                                   (words[j], getattr(words[j], sequence_type))],
+                                   key = lambda x: x[1]) # sort by tier/transcription
+            minpairs[pair].append(tuple(ordered_pair))
+    return minpairs, containing
+
+
+def pairwise_deltahs(corpus_context, prevent_normalization = False,
+                    stop_check = None, call_back = None):
+    """Calculate the change in entropy for the merger of every pair of
+    segments with a single scan of the corpus.
+
+    Only transcriptions that contain one of the merged segments change
+    when two segments are merged, so the entropy after each merger is
+    derived from the entropy of the unmerged corpus and the probabilities
+    of the transcriptions that collapse into one another.
+
+    Parameters
+    ----------
+    corpus_context : CorpusContext
+        Context manager for a corpus
+    prevent_normalization : bool
+        If True, do not divide the difference in entropy by the entropy
+        before the merger
+    stop_check : callable, optional
+        Optional function to check whether to gracefully terminate early
+    call_back : callable, optional
+        Optional function to supply progress information during the function
+
+    Returns
+    -------
+    dict
+        Mapping from alphabetically ordered segment pairs to the values
+        `deltah_fl` returns for them, for every pair whose merger changes
+        the entropy of the corpus
+    float
+        The value `deltah_fl` returns for pairs whose merger does not
+        change any transcription
+    """
+    if call_back is not None:
+        call_back('Finding instances of segments...')
+    original_probs, segment_index = corpus_context.get_sequence_probs()
+    preneutr_h = corpus_context.get_sequence_entropy()
+
+    # Transcriptions that only differ outside of their segments (i.e., in
+    # stress or tone) are collapsed by any merger
+    unmerged_h = corpus_context.get_sequence_entropy(segments_only = True)
+    segment_probs = defaultdict(float)
+    for k,v in original_probs.items():
+        segment_probs[tuple(k)] += v
+
+    buckets = defaultdict(lambda: defaultdict(list))
+    for k,v in segment_probs.items():
+        present = sorted(set(k))
+        for masked in itertools.chain(itertools.combinations(present, 1),
+                                      itertools.combinations(present, 2)):
+            key = tuple(None if seg in masked else seg for seg in k)
+            buckets[key][masked].append(v)
+
+    if stop_check is not None and stop_check():
+        return
+    entropy_changes = defaultdict(float)
+    for bucket in buckets.values():
+        pairs = set(masked for masked in bucket if len(masked) == 2)
+        singles = sorted(masked[0] for masked in bucket if len(masked) == 1)
+        pairs.update(itertools.combinations(singles, 2))
+        for pair in pairs:
+            probs = bucket.get(pair, []) + bucket.get(pair[:1], []) + bucket.get(pair[1:], [])
+            if len(probs) < 2:
+                continue
+            entropy_changes[pair] += entropy([sum(probs)]) - entropy(probs)
+
+    def normalize(postneutr_h):
+        result = preneutr_h - postneutr_h
+        if result < 1e-10:
+            result = 0.0
+        if not prevent_normalization and preneutr_h > 0.0:
+            result = result / preneutr_h
+        return result
+
+    deltahs = {pair: normalize(unmerged_h + change)
+                for pair, change in entropy_changes.items()}
+    return deltahs, normalize(unmerged_h)
+
+
 # This one also now has two different "relative count" options.
 def all_pairwise_fls(corpus_context, relative_fl = False,
                     algorithm = 'minpair',
                     relative_count_to_relevant_sounds = False, relative_count_to_whole_corpus = True,
                     distinguish_homophones = False,
-                    environment_filter = None,
-                    call_back = None, stop_check=None):
+                    environment_filter = None, prevent_normalization = False,
+                    batched = True, num_cores = -1, call_back = None, stop_check=None):
     """Calculate the functional load of the contrast between two segments as a count of minimal pairs.
     This version calculates the functional load for ALL pairs of segments in the inventory,
     which could be useful for visually mapping out phoneme inventories.
@@ -535,6 +867,23 @@ def all_pairwise_fls(corpus_context, relative_fl = False,
     environment_filter : EnvironmentFilter
         Allows the user to restrict the neutralization process to segments in
         particular segmental contexts
+    prevent_normalization : bool, optional
+        For delta-H, if True, do not divide the difference in entropy by
+        the entropy before the merger
+    batched : bool, optional
+        If True (the default), scan the corpus once and derive the functional
+        load of every segment pair from that scan (see `pairwise_minpairs`
+        and `pairwise_deltahs`) instead of calling `minpair_fl` or `deltah_fl`
+        once per pair. Delta-H with an environment filter is always
+        calculated one pair at a time.
+    num_cores : int, optional
+        Number of processes to spread the segment pairs over when they are
+        calculated one pair at a time; -1 or 1 (the default) calculates
+        them in this process
+    stop_check : callable, optional
+        Optional function to check whether to gracefully terminate early
+    call_back : callable, optional
+        Optional function to supply progress information during the function
 
     Returns
     -------
@@ -545,26 +894,66 @@ def all_pairwise_fls(corpus_context, relative_fl = False,
         If calculating relative FL (i.e., average FL for a segment), returns a dictionary of each segment and its relative (average) FL, with entries ordered by FL.
     """
     fls = {}
-    total_calculations = ((((len(corpus_context.inventory)-1)**2)-len(corpus_context.inventory)-1)/2)+1
-    ct = 1
-    t = time.time()
     if '' in corpus_context.inventory:
         raise Exception('Warning: Calculation of functional load for all segment pairs requires that all items in corpus have a non-null transcription.')
     
     # Count the number of words in the corpus (needed if relative_count_to_whole_corpus is True)
     num_words_in_corpus = len(corpus_context.corpus)
-    
-    for i, s1 in enumerate(corpus_context.inventory[:-1]):
-        for s2 in corpus_context.inventory[i+1:]:
-            if s1 != '#' and s2 != '#':
-                print('Performing FL calculation {} out of {} possible'.format(str(ct), str(total_calculations)))
-                ct += 1
-                print('Duration of last calculation: {}'.format(str(time.time() - t)))
-                t = time.time()
-                if type(s1) != str:
-                    s1 = s1.symbol
-                if type(s2) != str:
-                    s2 = s2.symbol
+
+    if batched and algorithm == 'minpair':
+        res = pairwise_minpairs(corpus_context, environment_filter = environment_filter,
+                                stop_check = stop_check, call_back = call_back)
+        if res is None:
+            return
+        minpairs, containing = res
+    elif batched and algorithm == 'deltah' and not environment_filter:
+        res = pairwise_deltahs(corpus_context, prevent_normalization = prevent_normalization,
+                                stop_check = stop_check, call_back = call_back)
+        if res is None:
+            return
+        deltahs, unchanged_deltah = res
+    else:
+        batched = False
+
+    segments = [s for s in corpus_context.inventory[:] if s != '#']
+    pair_fls = None
+    if not batched and not (num_cores == -1 or num_cores == 1):
+        if call_back is not None:
+            call_back('Calculating functional loads...')
+        if algorithm == 'minpair':
+            function = partial(minpair_fl,
+                    relative_count_to_relevant_sounds=relative_count_to_relevant_sounds,
+                    relative_count_to_whole_corpus=relative_count_to_whole_corpus,
+                    distinguish_homophones=distinguish_homophones,
+                    environment_filter=environment_filter)
+        elif algorithm == 'deltah':
+            function = partial(deltah_fl,
+                    environment_filter=environment_filter,
+                    prevent_normalization=prevent_normalization)
+        pairs = list(itertools.combinations(segments, 2))
+        res = context_map(function, [[pair] for pair in pairs], corpus_context,
+                        num_cores, call_back = call_back, stop_check = stop_check)
+        if res is None:
+            return
+        if algorithm == 'minpair':
+            res = [r[0] for r in res]
+        pair_fls = dict(zip(pairs, res))
+
+    if call_back is not None:
+        call_back('Calculating functional loads...')
+        call_back(0, len(segments) * (len(segments) - 1) // 2)
+        cur = 0
+    for i, s1 in enumerate(segments[:-1]):
+        for s2 in segments[i+1:]:
+            if stop_check is not None and stop_check():
+                return
+            if call_back is not None:
+                cur += 1
+                call_back(cur)
+            pair = tuple(sorted((s1, s2)))
+            if pair_fls is not None:
+                fl = pair_fls[(s1, s2)]
+            elif not batched:
                 if algorithm == 'minpair':
                     fl = minpair_fl(corpus_context, [(s1, s2)],
                             relative_count_to_relevant_sounds=relative_count_to_relevant_sounds,
@@ -573,8 +962,20 @@ def all_pairwise_fls(corpus_context, relative_fl = False,
                             environment_filter=environment_filter)[0]
                 elif algorithm == 'deltah':
                     fl = deltah_fl(corpus_context, [(s1, s2)],
-                    environment_filter=environment_filter)
-                fls[(s1, s2)] = fl
+                            environment_filter=environment_filter,
+                            prevent_normalization=prevent_normalization)
+            elif algorithm == 'minpair':
+                fl = count_minpairs(minpairs.get(pair, []), distinguish_homophones)
+                num_words = (containing[s1][0] + containing[s2][0]
+                            - (containing[pair][0] if pair in containing else 0))
+                if relative_count_to_relevant_sounds and num_words > 0:
+                    fl /= (containing[s1][1] + containing[s2][1]
+                            - (containing[pair][1] if pair in containing else 0))
+                elif relative_count_to_whole_corpus:
+                    fl = fl / num_words_in_corpus
+            elif algorithm == 'deltah':
+                fl = deltahs.get(pair, unchanged_deltah)
+            fls[(s1, s2)] = fl
     if not relative_fl:
         ordered_fls = sorted([(pair, fls[pair]) for pair in fls], key=lambda p: p[1], reverse=True)
         return ordered_fls
@@ -591,76 +992,3 @@ def all_pairwise_fls(corpus_context, relative_fl = False,
                 rel_fls[s] = total / (len(corpus_context.inventory) - 1)
         ordered_rel_fls = sorted([(s, rel_fls[s]) for s in rel_fls], key=lambda p: p[1], reverse=True)
         return ordered_rel_fls
-
-    
-    ## Filter out words that have none of the target segments
-    ## (for relative_count_to_relevant_sounds as well as improving runtime)
-    contain_target_segment = []
-    if call_back is not None:
-        call_back('Finding words with the specified segments...')
-        call_back(0, len(corpus_context))
-        cur = 0
-
-    all_target_segments = list(itertools.chain.from_iterable(segment_pairs)) # creates a list of target segments from the list of tuples
-    for w in corpus_context: # loops through the words in the context manager
-        if stop_check is not None and stop_check():
-            return
-        if call_back is not None:
-            cur += 1
-            if cur % 100 == 0:
-                call_back(cur)
-        tier = getattr(w, corpus_context.sequence_type)
-        if any([s in tier for s in all_target_segments]):
-                contain_target_segment.append(w)
-    if stop_check is not None and stop_check():
-        return
-
-    ## Find minimal pairs
-    minpairs = []
-    if call_back is not None:
-        call_back('Finding minimal pairs...')
-        if len(contain_target_segment) >= 2:
-            call_back(0,factorial(len(contain_target_segment))/(factorial(len(contain_target_segment)-2)*2))
-        cur = 0
-    for first, second in itertools.combinations(contain_target_segment, 2):
-        if stop_check is not None and stop_check():
-            return
-        if call_back is not None:
-            cur += 1
-            if cur % 100 == 0:
-                call_back(cur)
-        if is_minpair(first, second, corpus_context, segment_pairs, environment_filter):
-            ordered_pair = sorted([(first, getattr(first, corpus_context.sequence_type)),
-                                   (second, getattr(second, corpus_context.sequence_type))],
-                                   key = lambda x: x[1]) # sort by tier/transcription
-            minpairs.append(tuple(ordered_pair))
-
-    ## Generate output 
-    if not distinguish_homophones:
-        actual_minpairs = {}
-
-        for pair in minpairs:
-            if stop_check is not None and stop_check():
-                return
-            key = (pair[0][1], pair[1][1]) # Keys are tuples of transcriptions
-            if key not in actual_minpairs:
-                actual_minpairs[key] = (pair[0][0], pair[1][0]) # Values are words
-            else:
-                pair_freq = pair[0][0].frequency + pair[1][0].frequency
-                existing_freq = actual_minpairs[key][0].frequency + \
-                                actual_minpairs[key][1].frequency
-                if pair_freq > existing_freq:
-                    actual_minpairs[key] = (pair[0][0], pair[1][0])
-        result = sum((x[0].frequency + x[1].frequency)/2
-                    for x in actual_minpairs.values())
-    else:
-        result = sum((x[0][0].frequency + x[1][0].frequency)/2 for x in minpairs)
-
-    if relative_count_to_relevant_sounds and len(contain_target_segment) > 0:
-        result /= sum(x.frequency for x in contain_target_segment)
-
-    # added what to do if the relative count to the whole corpus is true, namely, divide by the number of words in the corpus    
-    elif relative_count_to_whole_corpus:
-        result = result / num_words_in_corpus
-    
-    return (result, minpairs)
\ No newline at end of file
@@ -39,6 +39,7 @@ class FLWorker(FunctionWorker):
             try:
                 pairs = kwargs.pop('segment_pairs')
                 output_filename = kwargs.pop('output_filename', None)
+                num_cores = kwargs.pop('num_cores', -1)
                 if output_filename is not None:
                     to_output = []
                     outf = open(output_filename, mode='w', encoding='utf-8-sig')
@@ -47,7 +48,7 @@ class FLWorker(FunctionWorker):
                     outf = None
                 for pair in pairs:
                     if len(pair) == 1:
-                        res = rel_func(c, pair[0], **kwargs)
+                        res = rel_func(c, pair[0], num_cores = num_cores, **kwargs)
                             #output_filename = outf, **kwargs)
                     else:
                         if isinstance(pair[0], (list, tuple)):
@@ -347,7 +348,8 @@ class FLDialog(FunctionDialog):
                 'type_token':self.typeTokenWidget.value(),
                 'algorithm': alg,
                 'prevent_normalization': self.preventNormalizationWidget.isChecked(),
-                'environment_filter': self.envWidget.value()}
+                'environment_filter': self.envWidget.value(),
+                'num_cores':self.settings['num_cores']}
         if alg == 'min_pairs':
             out_file = self.saveFileWidget.value()
             if out_file == '':
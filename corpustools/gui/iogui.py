@@ -6,7 +6,7 @@ from collections import OrderedDict, defaultdict
 from .imports import *
 from corpustools.exceptions import PCTError, PCTPythonError
 from corpustools.decorators import check_for_errors
-from corpustools.corpus.io.binary import load_binary, save_binary, PCTUnpickler
+from corpustools.corpus.io.binary import load_binary, save_binary
 from corpustools.corpus.io.csv import (inspect_csv, load_corpus_csv,
                                     export_corpus_csv)
 from corpustools.corpus.io.pct_textgrid import (inspect_discourse_textgrid,
@@ -43,8 +43,8 @@ class LoadBinaryWorker(FunctionWorker):
         if self.stopCheck():
             return
         try:
-            unpickler = PCTUnpickler(self.kwargs['path'], self.kwargs['call_back'], self.kwargs['stop_check'])
-            results = unpickler.load()
+            results = load_binary(self.kwargs['path'], self.kwargs['call_back'],
+                                  self.kwargs['stop_check'], convert = True)
         except PCTError as e:
             self.errorEncountered.emit(e)
             return
@@ -1,12 +1,15 @@
 import os
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict
 
 from .imports import *
 from corpustools.neighdens.neighborhood_density import (neighborhood_density,
                             neighborhood_density_all_words,
                             find_mutation_minpairs_all_words,
                             find_mutation_minpairs,
+                            neighbor_graph,
                             ensure_query_is_word)
+from corpustools.neighdens.neighbor_graph import WEIGHTINGS
+from corpustools.neighdens.graph_cache import NeighborGraphCache
 from corpustools.neighdens.io import *
 from corpustools.corpus.classes import Attribute
 from corpustools.exceptions import PCTError, PCTPythonError
@@ -33,36 +36,16 @@ class NDWorker(FunctionWorker):
 
         with cm(corpus, st, tt, attribute=att, frequency_threshold = ft) as c:
             try:
-                tierdict = defaultdict(list)
-                # Create a dict with sequence_type keys for constant-time lookup
-                for entry in c:
-                    w = getattr(entry, kwargs['sequence_type'])
-                    key = str(w)
-                    tierdict[key].append(entry)
                 if 'query' in kwargs:#this will be true when searching for a single word (in the corpus or not)
-                    last_value_removed = None
-                    last_key_removed = None
                     for q in kwargs['query']:
                         q = ensure_query_is_word(q, c, c.sequence_type, kwargs['tier_type'])
-                        #the following code for adding/removing keys is to ensure that homophones are counted later in
-                        #the ND algorithm (if the user wants to), but that words are not considered their own neighbours
-                        #however, we only do this when comparing inside a corpus. when using a list of external words
-                        #we don't want to do this, since it's possible for the external list to contain words that
-                        #are in the corpus, and removing them gives the wrong ND value in this case
-                        if kwargs['in_corpus']:
-                            if last_value_removed:
-                                tierdict[last_key_removed].append(last_value_removed)
-                            w = getattr(q, kwargs['sequence_type'])
-                            last_key_removed = str(w)
-                            #last_value_removed = tierdict[last_key_removed].pop()
-                            for i, item in enumerate(tierdict[last_key_removed]):
-                                if str(item) == str(q):
-                                    last_value_removed = tierdict[last_key_removed].pop(i)
-                                    break
-
+                        #words are not considered their own neighbours, but homophones are counted (if the user
+                        #wants to). however, we only leave the query out when comparing inside a corpus. when using
+                        #a list of external words we don't want to do this, since it's possible for the external list
+                        #to contain words that are in the corpus, and removing them gives the wrong ND value in this case
                         #now we call the actual ND algorithms
                         if kwargs['algorithm'] != 'substitution':
-                            res = neighborhood_density(c, q, tierdict,
+                            res = neighborhood_density(c, q,
                                                 algorithm = kwargs['algorithm'],
                                                 max_distance = kwargs['max_distance'],
                                                 force_quadratic=kwargs['force_quadratic'],
@@ -70,6 +53,7 @@ class NDWorker(FunctionWorker):
                                                 file_type = kwargs['file_type'],
                                                 tier_type = kwargs['tier_type'],
                                                 sequence_type = kwargs['sequence_type'],
+                                                exclude_query = kwargs['in_corpus'],
                                                 stop_check = kwargs['stop_check'],
                                                 call_back = kwargs['call_back'])
                         else:
@@ -87,28 +71,57 @@ class NDWorker(FunctionWorker):
                         self.results.append([q,res[0]])
                 else:#this will be the case if searching the entire corpus
                     end = kwargs['corpusModel'].beginAddColumn(att)
-                    if kwargs['algorithm'] != 'substitution':
-                        results = neighborhood_density_all_words(c, tierdict,
-                                                tier_type = kwargs['tier_type'],
-                                                algorithm = kwargs['algorithm'],
-                                                output_format = kwargs['output_format'],
-                                                max_distance = kwargs['max_distance'],
-                                                num_cores = kwargs['num_cores'],
-                                                call_back = kwargs['call_back'],
-                                                stop_check = kwargs['stop_check'],
-                                                settable_attr = kwargs['attribute'],
-                                                collapse_homophones = kwargs['collapse_homophones']
-                                                )
-                    else:
-                        results = find_mutation_minpairs_all_words(c, tierdict,
-                                                tier_type = kwargs['tier_type'],
-                                                collapse_homophones = kwargs['collapse_homophones'],
-                                                num_cores = kwargs['num_cores'],
-                                                stop_check = kwargs['stop_check'],
-                                                call_back = kwargs['call_back'])
-                    end = kwargs['corpusModel'].endAddColumn(end)
+                    writer = None
                     if 'output_filename' in kwargs and kwargs['output_filename'] is not None:
-                        print_all_neighden_results(kwargs['output_filename'], results)
+                        #results are written out as they are calculated rather than collected
+                        writer = NeighborhoodDensityWriter(kwargs['output_filename'])
+                    try:
+                        if kwargs['algorithm'] != 'substitution' and kwargs['weighted_attributes']:
+                            #find all neighbours first, then calculate every density from them at once
+                            graph = neighbor_graph(c,
+                                                    tier_type = kwargs['tier_type'],
+                                                    algorithm = kwargs['algorithm'],
+                                                    max_distance = kwargs['max_distance'],
+                                                    num_cores = kwargs['num_cores'],
+                                                    call_back = kwargs['call_back'],
+                                                    stop_check = kwargs['stop_check'],
+                                                    collapse_homophones = kwargs['collapse_homophones'],
+                                                    cache = kwargs['graph_cache'])
+                            if graph is not None:
+                                densities = graph.densities()
+                                graph.set_attribute(corpus, att, densities['density'])
+                                for name, attribute in kwargs['weighted_attributes'].items():
+                                    added = kwargs['corpusModel'].beginAddColumn(attribute)
+                                    graph.set_attribute(corpus, attribute, densities[name])
+                                    kwargs['corpusModel'].endAddColumn(added)
+                                if writer is not None:
+                                    graph.write(writer, kwargs['output_format'])
+                        elif kwargs['algorithm'] != 'substitution':
+                            results = neighborhood_density_all_words(c,
+                                                    tier_type = kwargs['tier_type'],
+                                                    algorithm = kwargs['algorithm'],
+                                                    output_format = kwargs['output_format'],
+                                                    max_distance = kwargs['max_distance'],
+                                                    num_cores = kwargs['num_cores'],
+                                                    call_back = kwargs['call_back'],
+                                                    stop_check = kwargs['stop_check'],
+                                                    settable_attr = kwargs['attribute'],
+                                                    collapse_homophones = kwargs['collapse_homophones'],
+                                                    writer = writer,
+                                                    cache = kwargs['graph_cache']
+                                                    )
+                        else:
+                            results = find_mutation_minpairs_all_words(c,
+                                                    tier_type = kwargs['tier_type'],
+                                                    collapse_homophones = kwargs['collapse_homophones'],
+                                                    num_cores = kwargs['num_cores'],
+                                                    stop_check = kwargs['stop_check'],
+                                                    call_back = kwargs['call_back'],
+                                                    writer = writer)
+                    finally:
+                        if writer is not None:
+                            writer.close()
+                    end = kwargs['corpusModel'].endAddColumn(end)
             except PCTError as e:
                 self.errorEncountered.emit(e)
                 return
@@ -246,6 +259,9 @@ class NDDialog(FunctionDialog):
         self.collapseHomophones = QCheckBox('Collapse homophones before calculating')
         optionLayout.addWidget(self.collapseHomophones)
 
+        self.weightedDensity = QCheckBox('Also add frequency-weighted densities')
+        optionLayout.addWidget(self.weightedDensity)
+
         self.tierWidget = TierWidget(self.corpusModel.corpus,include_spelling=True)
 
         optionLayout.addWidget(self.tierWidget)
@@ -336,6 +352,10 @@ class NDDialog(FunctionDialog):
             'This algorithm may be faster than the general-purpose algorithm, '
             'especially on very large corpora.</FONT>'))
 
+            self.weightedDensity.setToolTip(('<FONT COLOR=black>If this box is checked when calculating '
+            'for all words in the corpus, PCT also adds columns with the summed token frequency, the summed '
+            'log frequency and the mean frequency of each word\'s neighbours.</FONT>'))
+
             self.algorithmWidget.setToolTip(("<FONT COLOR=black>"
             'Select which algorithm'
                                         ' to use for calculating similarity. For Khorsi,'
@@ -439,7 +459,9 @@ class NDDialog(FunctionDialog):
                 'file_type': self.fileOptions.currentText().split()[-1],
                 'collapse_homophones': self.collapseHomophones.isChecked(),
                 'output_format': self.saveFileFormat.currentText().split(' ')[-1].lower(),\
-                'in_corpus': True}
+                'in_corpus': True,
+                'weighted_attributes': OrderedDict(),
+                'graph_cache': NeighborGraphCache.in_storage(self.settings['storage'])}
 
         out_file = self.saveFileWidget.value()
         if out_file == '':
@@ -513,6 +535,12 @@ class NDDialog(FunctionDialog):
                 if msgBox.exec_() != QMessageBox.AcceptRole:
                     return
             kwargs['attribute'] = attribute
+            if self.weightedDensity.isChecked() and alg != 'substitution':
+                for name, label in WEIGHTINGS.items():
+                    if name == 'density':
+                        continue
+                    kwargs['weighted_attributes'][name] = Attribute('{}_{}'.format(colName, name), 'numeric',
+                                                                    '{} ({})'.format(column, label))
         return kwargs
 
     def setResults(self, results):
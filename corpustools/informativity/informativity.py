@@ -293,13 +293,12 @@ if __name__ == '__main__':
     # ------------------------------------------------------------------#
 
     # Additional imports for testing purposes
-    import pickle
     from corpustools.corpus.classes import Segment
+    from corpustools.corpus.io.binary import load_binary
 
     # Load the corpus
     corpus_path = "lemurian.corpus"
-    with open(corpus_path, 'rb') as file:
-        corpus_in = pickle.load(file)
+    corpus_in = load_binary(corpus_path)
 
     # Corpus information
     print("Corpus: ", corpus_in.name)
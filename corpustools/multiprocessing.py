@@ -1,281 +1,460 @@
+from multiprocessing import Process, Queue, cpu_count, Pool
+from queue import Empty
+from functools import partial
+from itertools import islice
+import pickle
+import time
+import traceback
 
-from multiprocessing import Process, process, Manager, Queue, cpu_count, Value, Lock, Pool, JoinableQueue
-from queue import Empty, Full
+from corpustools.exceptions import PCTError
 
-import time
+# Number of chunks of work kept queued for each worker
+CHUNKS_PER_WORKER = 2
+
+# Time in seconds that the items of one chunk should take when chunk sizes
+# are adapted to the measured time per item
+TARGET_CHUNK_TIME = 0.5
+
+MAX_CHUNK_SIZE = 10000
+
+# How long to wait for a result before checking whether to stop and
+# whether the workers are still alive
+POLL_INTERVAL = 0.1
 
 
 def pool_filter(func, candidates, num_cores):
     pool = Pool(num_cores)
     return [c for c, keep in zip(candidates,pool.map(func,candidates)) if keep]
 
-class Counter(object):
-    def __init__(self, initval=0):
-        self.val = Value('i', initval)
-        self.lock = Lock()
-
-    def increment(self):
-        with self.lock:
-            self.val.value += 1
-
-    def value(self):
-        with self.lock:
-            return self.val.value
-
-class Stopped(object):
-    def __init__(self, initval=False):
-        self.val = Value('i', initval)
-        self.lock = Lock()
-
-    def stop(self):
-        with self.lock:
-            self.val.value = True
-
-    def stop_check(self):
-        with self.lock:
-            return self.val.value
-
-class QueueAdder(Process):
-    def __init__(self, iterable, queue, stopped):
-        Process.__init__(self)
-        self.iterable = iterable
-        self.queue = queue
-        self.stopped = stopped
-
-    def run(self):
-        for item in self.iterable:
-            if self.stopped.stop_check():
-                break
-            while True:
-                if self.stopped.stop_check():
-                    break
-                try:
-                    self.queue.put(item,False)
-                    break
-                except Full:
-                    pass
-        self.queue.close()
-        print('queue adder worker returning!')
-        return
+def _executor_worker(function, initializer, initargs, job_q, result_q):
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        job = job_q.get()
+        if job is None:
+            break
+        key, data = job
+        begin = time.perf_counter()
+        try:
+            result = function(pickle.loads(data))
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = PCTError(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+            result_q.put((key, None, None, e))
+            continue
+        result_q.put((key, result, time.perf_counter() - begin, None))
+
+class _ChunkSizer(object):
+    """Choose chunk sizes from how long earlier chunks took
+
+    The time a chunk takes (to pickle, unpickle and run) is fitted by
+    least squares as a fixed cost per chunk plus a cost per item, and
+    chunks are sized so that the per-item costs add up to
+    ``TARGET_CHUNK_TIME``. Sizes at most double from one chunk to the
+    next, and keep doubling while the per-item cost cannot be told apart
+    from the fixed cost.
+    """
+    def __init__(self):
+        self.size = 1
+        self.n = 0
+        self.sum_count = 0.0
+        self.sum_cost = 0.0
+        self.sum_count_sq = 0.0
+        self.sum_count_cost = 0.0
+
+    def add(self, count, cost):
+        self.n += 1
+        self.sum_count += count
+        self.sum_cost += cost
+        self.sum_count_sq += count * count
+        self.sum_count_cost += count * cost
+        spread = self.n * self.sum_count_sq - self.sum_count ** 2
+        per_item = 0
+        if spread > 0:
+            per_item = (self.n * self.sum_count_cost - self.sum_count * self.sum_cost) / spread
+        if per_item > 0:
+            size = int(TARGET_CHUNK_TIME / per_item)
+        else:
+            size = MAX_CHUNK_SIZE
+        self.size = max(1, min(size, 2 * self.size, MAX_CHUNK_SIZE))
+
+def execute(function, take, num_procs, initializer = None, initargs = (),
+            chunk_size = None, ordered = True, call_back = None, stop_check = None):
+    """Run a function over chunks of work in a set of worker processes,
+    yielding the result for each chunk as it becomes available.
 
-class FilterWorker(Process):
-    def __init__(self, job_q, filtered_q, filter_function, counter, stopped):
-        Process.__init__(self)
-        self.job_q = job_q
-        self.filtered_q = filtered_q
-        self.filter_function = filter_function
-        self.counter = counter
-        self.stopped = stopped
-
-    def run(self):
-        results = list()
+    Workers are handed `function` (and run `initializer`) once when they
+    start, and are shut down with a sentinel once all the work is done,
+    so no time is spent waiting on timeouts. Unless `chunk_size` is
+    given, chunks start with a single item and are then sized so that the
+    work on each item takes about ``TARGET_CHUNK_TIME`` seconds per chunk
+    (see `_ChunkSizer`).
+
+    Parameters
+    ----------
+    function : callable
+        Module-level function (or ``functools.partial`` of one) that
+        takes a chunk of work and returns its result
+    take : callable
+        Function that takes a number of items and returns the next chunk
+        of work with (at most) that many items, as a tuple of the chunk
+        and the number of items in it, or None when there is no more work
+    num_procs : int
+        Number of worker processes; 0 uses 3/4 of the available cores
+    initializer : callable, optional
+        Function to call in each worker process when it starts
+    initargs : tuple, optional
+        Arguments for `initializer`
+    chunk_size : int, optional
+        Fixed number of items for each chunk, defaults to adapting chunk
+        sizes as work is done
+    ordered : bool
+        If True (the default), yield results in the order that their
+        chunks were taken, otherwise as soon as each one is done
+    stop_check : callable, optional
+        Optional function to check whether to gracefully terminate early
+    call_back : callable, optional
+        Optional function to supply progress information during the
+        function, called with the number of items done so far
+
+    Yields
+    ------
+    tuple
+        Chunk of work and the result of `function` for it
+
+    Raises
+    ------
+    PCTError
+        If a worker process exits unexpectedly
+    """
+    if num_procs == 0:
+        num_procs = max(1, int(cpu_count() * 0.75))
+    sizer = _ChunkSizer() if chunk_size is None else None
+
+    job_q = Queue()
+    result_q = Queue()
+    procs = [Process(target = _executor_worker,
+                     args = (function, initializer, initargs, job_q, result_q))
+                for i in range(num_procs)]
+    for p in procs:
+        p.daemon = True
+        p.start()
+
+    pending = {}
+    finished = {}
+    next_key = 0
+    next_yield = 0
+    done = 0
+    exhausted = False
+    completed = False
+    try:
         while True:
-            self.counter.increment()
-            try:
-                args = self.job_q.get(timeout=1)
-            except Empty:
+            while not exhausted and len(pending) < num_procs * CHUNKS_PER_WORKER:
+                chunk = take(sizer.size if sizer is not None else chunk_size)
+                if chunk is None:
+                    exhausted = True
+                    break
+                # Chunks are pickled here and unpickled by the worker as
+                # part of its timed work, so that the cost of moving items
+                # between processes counts towards the chunk sizes
+                begin = time.perf_counter()
+                data = pickle.dumps(chunk[0], pickle.HIGHEST_PROTOCOL)
+                pending[next_key] = chunk + (time.perf_counter() - begin,)
+                job_q.put((next_key, data))
+                next_key += 1
+            if not pending:
                 break
+            if stop_check is not None and stop_check():
+                return
             try:
-                for a in args:
-                    if self.filter_function(*a):
-                        results.append(a)
-            except Exception as e:
-                self.stopped.stop()
-                self.filtered_q.put(e)
-                break
-            self.job_q.task_done()
-        if self.stopped.stop_check():
-            return
-        if len(results) > 0:
-            self.filtered_q.put(results)
+                key, result, elapsed, error = result_q.get(timeout = POLL_INTERVAL)
+            except Empty:
+                if any(p.exitcode is not None for p in procs):
+                    raise PCTError('A worker process stopped unexpectedly.')
+                continue
+            if error is not None:
+                raise error
+            payload, count, pickling = pending.pop(key)
+            done += count
+            if sizer is not None:
+                sizer.add(count, pickling + elapsed)
+            if call_back is not None:
+                call_back(done)
+            if not ordered:
+                yield payload, result
+                continue
+            finished[key] = (payload, result)
+            while next_yield in finished:
+                yield finished.pop(next_yield)
+                next_yield += 1
+        completed = True
+    finally:
+        if completed:
+            for p in procs:
+                job_q.put(None)
+            for p in procs:
+                p.join()
+        else:
+            job_q.cancel_join_thread()
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                p.join()
+
+def take_items(iterable):
+    """Make a `take` function for `execute` that takes chunks of items
+    from an iterable.
+
+    Parameters
+    ----------
+    iterable : iterable
+        Items to split into chunks
+
+    Returns
+    -------
+    callable
+        Function returning lists of items
+    """
+    iterator = iter(iterable)
+    def take(size):
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return None
+        return chunk, len(chunk)
+    return take
+
+def take_ranges(total):
+    """Make a `take` function for `execute` that takes chunks of indices
+    from 0 up to a total.
+
+    Parameters
+    ----------
+    total : int
+        Number of indices
+
+    Returns
+    -------
+    callable
+        Function returning (start, stop) tuples
+    """
+    position = [0]
+    def take(size):
+        start = position[0]
+        if start >= total:
+            return None
+        stop = min(start + size, total)
+        position[0] = stop
+        return (start, stop), stop - start
+    return take
+
+def _call_each(function, chunk):
+    return [function(*item) for item in chunk]
+
+_worker_context = None
+_worker_words = None
+
+def _set_worker_context(corpus_context):
+    global _worker_context
+    _worker_context = corpus_context
+
+def _set_worker_words(corpus_context):
+    global _worker_context, _worker_words
+    _worker_context = corpus_context
+    _worker_words = list(corpus_context)
+
+def _apply_in_context(function, chunk):
+    return [function(_worker_context, item) for item in chunk]
+
+def _apply_to_range(function, task):
+    start, stop = task
+    return [function(_worker_context, w) for w in _worker_words[start:stop]]
 
+def context_map(function, items, corpus_context, num_procs, call_back = None, stop_check = None):
+    """Apply ``function(corpus_context, item)`` to every item in a set
+    of worker processes.
 
-        print('filter worker returning!')
+    The corpus context is handed to each worker once, when the worker
+    starts, rather than being pickled into every task.
+
+    Parameters
+    ----------
+    function : callable
+        Module-level function (or ``functools.partial`` of one) taking the
+        corpus context and an item
+    items : list
+        Items to apply `function` to
+    corpus_context : CorpusContext
+        Context manager for a corpus, shared by all the workers
+    num_procs : int
+        Number of worker processes; 0 uses 3/4 of the available cores
+    stop_check : callable, optional
+        Optional function to check whether to gracefully terminate early
+    call_back : callable, optional
+        Optional function to supply progress information during the function
+
+    Returns
+    -------
+    list
+        The results, in the same order as `items`, or None if stopped
+    """
+    items = list(items)
+    if call_back is not None:
+        call_back(0, len(items))
+    results = []
+    for chunk, chunk_results in execute(partial(_apply_in_context, function),
+                                        take_items(items), num_procs,
+                                        initializer = _set_worker_context,
+                                        initargs = (corpus_context,),
+                                        call_back = call_back, stop_check = stop_check):
+        results.extend(chunk_results)
+    if stop_check is not None and stop_check():
+        return
+    return results
+
+def iter_word_map(function, corpus_context, num_procs, chunk_size = None,
+                call_back = None, stop_check = None):
+    """Apply ``function(corpus_context, word)`` to every word of a corpus
+    context in a set of worker processes, yielding each result as soon
+    as it is available.
+
+    The corpus context is handed to each worker once, when the worker
+    starts (where processes are forked, it is inherited rather than
+    pickled), and each worker lists the words of the context itself.
+    Tasks are ranges of word indices and results come back keyed by
+    word index, so neither words nor the context are pickled per task.
+
+    Parameters
+    ----------
+    function : callable
+        Module-level function (or ``functools.partial`` of one) taking the
+        corpus context and a word
+    corpus_context : CorpusContext
+        Context manager for a corpus, shared by all the workers
+    num_procs : int
+        Number of worker processes; 0 uses 3/4 of the available cores
+    chunk_size : int, optional
+        Fixed number of words in each task, defaults to adapting the
+        number of words to how long they take
+    stop_check : callable, optional
+        Optional function to check whether to gracefully terminate early
+    call_back : callable, optional
+        Optional function to supply progress information during the function
+
+    Yields
+    ------
+    tuple
+        Index of a word (in the order that the corpus context iterates
+        over its words) and its result, in no particular order
+    """
+    num_words = len(corpus_context)
+    if call_back is not None:
+        call_back(0, num_words)
+    for (start, stop), chunk_results in execute(partial(_apply_to_range, function),
+                                                take_ranges(num_words), num_procs,
+                                                initializer = _set_worker_words,
+                                                initargs = (corpus_context,),
+                                                chunk_size = chunk_size, ordered = False,
+                                                call_back = call_back, stop_check = stop_check):
+        for i, result in enumerate(chunk_results, start = start):
+            yield i, result
+
+def word_map(function, corpus_context, num_procs, chunk_size = None,
+                call_back = None, stop_check = None):
+    """Apply ``function(corpus_context, word)`` to every word of a corpus
+    context in a set of worker processes (see `iter_word_map`).
+
+    Returns
+    -------
+    list
+        The results, in the order that the corpus context iterates over
+        its words, or None if stopped
+    """
+    results = [None] * len(corpus_context)
+    for i, result in iter_word_map(function, corpus_context, num_procs,
+                                chunk_size = chunk_size, call_back = call_back,
+                                stop_check = stop_check):
+        results[i] = result
+    if stop_check is not None and stop_check():
         return
+    return results
 
 def chunks(l, n):
     for i in range(0,len(l), n):
         yield l[i:i+n]
 
 
-def filter_mp(iterable, filter_function, num_procs, call_back, stop_check, debug = False):
-    job_queue = JoinableQueue(100)
-    filtered_queue = Queue()
-    stopped = Stopped()
-    done = False
-    while not done:
-        chunk = []
-        while len(chunk) < 500:
-            try:
-                item = next(iterable)
-            except StopIteration:
-                done = True
-                break
-            chunk.append(item)
-        try:
-            job_queue.put(chunk,False)
-        except Full:
-            break
-    procs = []
+def filter_mp(iterable, filter_function, num_procs, call_back, stop_check, chunk_size = None):
+    """Keep the items of an iterable (tuples of arguments) for which
+    ``filter_function(*item)`` is true, checking them in a set of worker
+    processes
 
-    counter = Counter()
-    for i in range(num_procs):
-        p = FilterWorker(job_queue, filtered_queue, filter_function, counter, stopped)
-        procs.append(p)
-        p.start()
-    val = 0
-    done = False
-    while not done:
-        if stop_check is None:
-            break
-        if stop_check is not None and stop_check():
-            stopped.stop()
-            time.sleep(1)
-            break
-        chunk = []
-        while len(chunk) < 500:
-            try:
-                item = next(iterable)
-            except StopIteration:
-                done = True
-                break
-            chunk.append(item)
-        job_queue.put(chunk)
-
-        if call_back is not None:
-            value = counter.value()
-            call_back(value)
-    job_queue.join()
-    if debug:
-        print('queueadder joined!')
-    return_list = list()
-    error = None
-    while True:
-        try:
-            l = filtered_queue.get(timeout=2)
-        except Empty:
-            break
-        if isinstance(l, Exception):
-            error = l
-        else:
-            return_list.extend(l)
-    if debug:
-        print('emptied result queue')
-    for p in procs:
-        p.join()
-    if error is not None:
-        raise(error)
-    if debug:
-        print('joined')
-        print(len(return_list))
-    return return_list
-
-class ScoreWorker(Process):
-    def __init__(self, job_q, scored_q, function, counter, stopped):
-        Process.__init__(self)
-        self.job_q = job_q
-        self.scored_q = scored_q
-        self.function = function
-        self.counter = counter
-        self.stopped = stopped
-
-    def run(self):
-        while True:
-            self.counter.increment()
-            try:
-                args = self.job_q.get(timeout=1)
-            except Empty:
-                break
-            results = list()
-            for a in args:
-                try:
-                    score = self.function(*a)
-                    if score is None:
-                        continue
-                    return_value = tuple([x for x in a] + [score])
-                    results.append(return_value)
-                except Exception as e:
-                    self.scored_q.put(e)
-                    self.stopped.stop()
-                    break
-            self.job_q.task_done()
-            if self.stopped.stop_check():
-                continue
-            self.scored_q.put(results)
+    Parameters
+    ----------
+    iterable : iterable
+        Tuples of arguments for `filter_function`
+    filter_function : callable
+        Module-level function (or ``functools.partial`` of one)
+    num_procs : int
+        Number of worker processes; 0 uses 3/4 of the available cores
+    call_back : callable or None
+        Optional function to supply progress information during the
+        function, called with the number of items done so far
+    stop_check : callable or None
+        Optional function to check whether to gracefully terminate early
+    chunk_size : int, optional
+        Fixed number of items for each chunk, defaults to adapting chunk
+        sizes to how long items take
 
+    Returns
+    -------
+    list
+        Items that passed the filter, in their original order, or None
+        if stopped
+    """
+    results = []
+    for chunk, keep in execute(partial(_call_each, filter_function), take_items(iterable),
+                                num_procs, chunk_size = chunk_size,
+                                call_back = call_back, stop_check = stop_check):
+        results.extend(item for item, k in zip(chunk, keep) if k)
+    if stop_check is not None and stop_check():
         return
+    return results
 
+def score_mp(iterable, function, num_procs, call_back, stop_check, chunk_size = None):
+    """Score the items of an iterable (tuples of arguments) with
+    ``function(*item)`` in a set of worker processes
 
-def score_mp(iterable, function, num_procs, call_back, stop_check, debug = False, chunk_size = 500):
-    job_queue = JoinableQueue(100)
-    scored_queue = Queue()
-    stopped = Stopped()
-    done = False
-    while not done:
-        chunk = []
-        while len(chunk) < chunk_size:
-            try:
-                item = next(iterable)
-            except StopIteration:
-                done = True
-                break
-            chunk.append(item)
-        try:
-            job_queue.put(chunk,False)
-        except Full:
-            break
-    procs = []
-
-    counter = Counter()
-    for i in range(num_procs):
-        p = ScoreWorker(job_queue, scored_queue, function, counter, stopped)
-        procs.append(p)
-        p.start()
-    val = 0
-    done = False
-    while not done:
-        if stop_check is None:
-            break
-        if stop_check is not None and stop_check():
-            stopped.stop()
-            time.sleep(1)
-            break
-        chunk = []
-        while len(chunk) < chunk_size:
-            try:
-                item = next(iterable)
-            except StopIteration:
-                done = True
-                break
-            chunk.append(item)
-        job_queue.put(chunk)
-
-        if call_back is not None:
-            value = counter.value()
-            call_back(value)
-    job_queue.join()
-    time.sleep(2)
-    if debug:
-        print('queueadder joined!')
-    return_list = list()
-    error = None
-    while True:
-        try:
-            l = scored_queue.get(timeout=2)
-        except Empty:
-            break
-        if isinstance(l, Exception):
-            error = l
-        else:
-            return_list.extend(l)
-    if debug:
-        print('emptied result queue')
-    for p in procs:
-        p.join()
-    if error is not None:
-        raise(error)
-    if debug:
-        print('joined')
-        print(len(return_list))
-    return return_list
+    Parameters
+    ----------
+    iterable : iterable
+        Tuples of arguments for `function`
+    function : callable
+        Module-level function (or ``functools.partial`` of one)
+    num_procs : int
+        Number of worker processes; 0 uses 3/4 of the available cores
+    call_back : callable or None
+        Optional function to supply progress information during the
+        function, called with the number of items done so far
+    stop_check : callable or None
+        Optional function to check whether to gracefully terminate early
+    chunk_size : int, optional
+        Fixed number of items for each chunk, defaults to adapting chunk
+        sizes to how long items take
 
+    Returns
+    -------
+    list
+        Items with their score appended, in their original order and
+        leaving out items scored as None, or None if stopped
+    """
+    results = []
+    for chunk, scores in execute(partial(_call_each, function), take_items(iterable),
+                                num_procs, chunk_size = chunk_size,
+                                call_back = call_back, stop_check = stop_check):
+        results.extend(tuple(item) + (score,) for item, score in zip(chunk, scores)
+                        if score is not None)
+    if stop_check is not None and stop_check():
+        return
+    return results
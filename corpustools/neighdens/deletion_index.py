@@ -0,0 +1,201 @@
+from collections import defaultdict
+from itertools import combinations
+
+from corpustools.corpus.classes.lexicon import Transcription, encode_segments, decode_segments
+from corpustools.symbolsim.edit_distance import bounded_levenshtein
+
+
+def encode_sequence(sequence):
+    """
+    Encode a tier value (Transcription or spelling) as a string with one
+    character per segment (see ``lexicon.encode_segments``)
+
+    Parameters
+    ----------
+    sequence : Transcription or str
+        Sequence to encode
+
+    Returns
+    -------
+    str
+        Encoded sequence
+    """
+    if isinstance(sequence, Transcription):
+        return sequence.encoded(word_boundaries = False)
+    return encode_segments([str(s) for s in sequence])
+
+
+def portable_codes(sequences):
+    """
+    Get the segment symbols behind the codes in encoded sequences, so
+    that they can be encoded again in another process, where segments
+    may have different codes
+
+    Parameters
+    ----------
+    sequences : list
+        Encoded sequences
+
+    Returns
+    -------
+    tuple(str, list)
+        The codes that occur in the sequences, and their symbols
+    """
+    codes = ''.join(sorted(set(''.join(sequences))))
+    return codes, decode_segments(codes)
+
+
+def recoding_table(codes, symbols):
+    """
+    Get a table for ``str.translate`` that changes codes from another
+    process (see `portable_codes`) into the codes of this process
+
+    Parameters
+    ----------
+    codes : str
+        Codes in the other process
+    symbols : list
+        Segment symbols of the codes
+
+    Returns
+    -------
+    dict
+        Translation table, or None if the codes are the same
+    """
+    local = encode_segments(symbols)
+    if local == codes:
+        return None
+    return str.maketrans(codes, local)
+
+
+def deletion_variants(encoded, max_deletions):
+    """
+    Generate the strings obtained by deleting up to `max_deletions`
+    segments from an encoded sequence
+
+    Parameters
+    ----------
+    encoded : str
+        Encoded sequence
+    max_deletions : int
+        Maximum number of segments to delete
+
+    Returns
+    -------
+    set
+        Encoded sequences, including `encoded` itself
+    """
+    variants = set()
+    length = len(encoded)
+    for n in range(min(max_deletions, length) + 1):
+        for kept in combinations(range(length), length - n):
+            variants.add(''.join([encoded[i] for i in kept]))
+    return variants
+
+
+class DeletionIndex(object):
+    """
+    Symmetric deletion index of the words in a corpus context, for finding
+    all words within an edit distance of a query without comparing the
+    query to every word
+
+    Every word is indexed under each string obtained by deleting up to
+    `max_distance` of its segments. Two sequences within edit distance
+    `max_distance` of each other always share one of these strings, so
+    looking up the deletions of a query gives every possible neighbour,
+    which are then checked with a bounded edit distance.
+
+    Parameters
+    ----------
+    corpus_context : CorpusContext
+        Context manager for a corpus
+    max_distance : int
+        Largest edit distance that the index can be queried for
+
+    Attributes
+    ----------
+    words : list
+        Words of the corpus context, in the order they were indexed
+    sequences : list
+        Encoded sequences of the words
+    """
+    def __init__(self, corpus_context, max_distance):
+        self.sequence_type = corpus_context.sequence_type
+        self.max_distance = int(max_distance)
+        self.words = []
+        self.sequences = []
+        self._index = defaultdict(list)
+        for i, word in enumerate(corpus_context):
+            encoded = encode_sequence(getattr(word, self.sequence_type))
+            self.words.append(word)
+            self.sequences.append(encoded)
+            for variant in deletion_variants(encoded, self.max_distance):
+                self._index[variant].append(i)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_index'] = dict(self._index)
+        # Segment codes are only valid within one process
+        state['_codes'] = portable_codes(self.sequences)
+        return state
+
+    def __setstate__(self, state):
+        table = recoding_table(*state.pop('_codes'))
+        self.__dict__.update(state)
+        if table is not None:
+            self.sequences = [s.translate(table) for s in self.sequences]
+            self._index = {k.translate(table): v for k, v in self._index.items()}
+        self._index = defaultdict(list, self._index)
+
+    def candidates(self, encoded, max_distance = None):
+        """
+        Find the indices of words that share a deletion variant with an
+        encoded sequence
+
+        Parameters
+        ----------
+        encoded : str
+            Encoded query sequence
+        max_distance : int, optional
+            Edit distance to find candidates for, defaults to the
+            distance that the index was built for
+
+        Returns
+        -------
+        set
+            Indices into `words`
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        found = set()
+        for variant in deletion_variants(encoded, max_distance):
+            found.update(self._index.get(variant, ()))
+        return found
+
+    def neighbors(self, query, max_distance = None):
+        """
+        Find all words within an edit distance of a query word
+
+        Parameters
+        ----------
+        query : Word
+            Word to find the neighbours of
+        max_distance : int, optional
+            Maximum edit distance, must not be larger than the distance
+            that the index was built for
+
+        Returns
+        -------
+        list
+            Words within `max_distance` of the query (including any that
+            are identical to it), in corpus order
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        max_distance = int(max_distance)
+        if max_distance > self.max_distance:
+            raise ValueError('The index only supports distances up to {}.'.format(self.max_distance))
+        encoded = encode_sequence(getattr(query, self.sequence_type))
+        found = [i for i in sorted(self.candidates(encoded, max_distance))
+                    if bounded_levenshtein(encoded, self.sequences[i], max_distance) <= max_distance]
+        return [self.words[i] for i in found]
@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from corpustools.neighdens.neighbor_graph import NeighborGraph
+
+# Folder of the PCT storage directory that the cache is kept in, next
+# to CORPUS and FEATURE
+CACHE_DIRECTORY = 'NEIGHBORS'
+
+CACHE_VERSION = 1
+
+# Algorithms whose neighbour relation depends only on the two sequences
+# compared (and is symmetric), so that a graph can be updated by
+# comparing only the sequences that changed
+CACHED_ALGORITHMS = ('edit_distance', 'phono_edit_distance')
+
+
+def content_hash(sequences):
+    """
+    Hash the distinct sequences of a corpus tier
+
+    Parameters
+    ----------
+    sequences : iterable
+        String forms of the sequences
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-1 digest, which does not depend on the order or
+        repetition of the sequences
+    """
+    digest = hashlib.sha1()
+    for s in sorted(set(sequences)):
+        digest.update(s.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class SequenceGraph(object):
+    """
+    Neighbours of the distinct sequences of a corpus tier, in compressed
+    sparse row form (see `NeighborGraph`)
+
+    The neighbours of a sequence do not include the sequence itself, so
+    words that share a sequence are each other's neighbours implicitly.
+
+    Parameters
+    ----------
+    sequences : list
+        Distinct sequences, sorted
+    indptr : numpy.ndarray
+        Start of each sequence's neighbours in `indices`, followed by the
+        total number of neighbours
+    indices : numpy.ndarray
+        Positions in `sequences` of the neighbours of all sequences
+
+    Attributes
+    ----------
+    sequences : list
+        Distinct sequences, sorted
+    content_hash : str
+        Hash of the sequences (see `content_hash`)
+    """
+    def __init__(self, sequences, indptr, indices):
+        self.sequences = sequences
+        self.indptr = indptr
+        self.indices = indices
+        self.content_hash = content_hash(sequences)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build a SequenceGraph from the neighbours of each sequence
+
+        Parameters
+        ----------
+        rows : dict
+            Lists of neighbouring sequences, keyed by sequence
+
+        Returns
+        -------
+        SequenceGraph
+            Graph of the sequences
+        """
+        sequences = sorted(rows)
+        positions = {s: i for i, s in enumerate(sequences)}
+        indptr = np.zeros(len(sequences) + 1, dtype = np.int64)
+        np.cumsum([len(rows[s]) for s in sequences], out = indptr[1:])
+        indices = np.zeros(indptr[-1], dtype = np.int32)
+        for i, s in enumerate(sequences):
+            indices[indptr[i]:indptr[i + 1]] = sorted(positions[n] for n in rows[s])
+        return cls(sequences, indptr, indices)
+
+    def rows(self):
+        """
+        Get the neighbours of each sequence
+
+        Returns
+        -------
+        dict
+            Lists of neighbouring sequences, keyed by sequence
+        """
+        sequences = self.sequences
+        indices = self.indices.tolist()
+        indptr = self.indptr.tolist()
+        return {s: [sequences[j] for j in indices[indptr[i]:indptr[i + 1]]]
+                    for i, s in enumerate(sequences)}
+
+    def expand(self, words, sequence_type, collapse_homophones = False):
+        """
+        Get the neighbours of words from the neighbours of their sequences
+
+        Parameters
+        ----------
+        words : list
+            Words whose sequences are all in the graph
+        sequence_type : str
+            Sequence of the words that the graph was built from
+        collapse_homophones : bool
+            If True, only the first word with each neighbouring sequence
+            is a neighbour
+
+        Returns
+        -------
+        NeighborGraph
+            Neighbours of each word, not including the word itself
+        """
+        positions = {s: i for i, s in enumerate(self.sequences)}
+        nodes = [positions[str(getattr(w, sequence_type))] for w in words]
+        buckets = [[] for _ in self.sequences]
+        for i, node in enumerate(nodes):
+            buckets[node].append(i)
+        indices = self.indices.tolist()
+        indptr = self.indptr.tolist()
+        rows = []
+        for i, node in enumerate(nodes):
+            homophones = [j for j in buckets[node] if j != i]
+            if collapse_homophones:
+                row = homophones[:1] + [buckets[n][0] for n in indices[indptr[node]:indptr[node + 1]]
+                                            if buckets[n]]
+            else:
+                row = homophones
+                for n in indices[indptr[node]:indptr[node + 1]]:
+                    row.extend(buckets[n])
+            rows.append(sorted(row))
+        return NeighborGraph.from_rows(words, rows)
+
+    def save(self, path):
+        """
+        Save the graph to a binary file, replacing it at once so that a
+        partly written file is never read
+
+        Parameters
+        ----------
+        path : str
+            Path of the file
+        """
+        meta = {'version': CACHE_VERSION, 'content_hash': self.content_hash,
+                'num_sequences': len(self.sequences)}
+        blob = '\n'.join(self.sequences).encode('utf-8')
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, meta = np.array(json.dumps(meta)),
+                    sequences = np.frombuffer(blob, dtype = np.uint8),
+                    indptr = self.indptr, indices = self.indices)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a graph saved with `save`
+
+        Parameters
+        ----------
+        path : str
+            Path of the file
+
+        Returns
+        -------
+        SequenceGraph
+            The graph, or None if the file is missing, unreadable or from
+            another version of the cache
+        """
+        try:
+            with np.load(path, allow_pickle = False) as data:
+                meta = json.loads(str(data['meta']))
+                if meta.get('version') != CACHE_VERSION:
+                    return None
+                if meta['num_sequences'] == 0:
+                    sequences = []
+                else:
+                    sequences = data['sequences'].tobytes().decode('utf-8').split('\n')
+                graph = cls(sequences, data['indptr'], data['indices'])
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return None
+        if graph.content_hash != meta['content_hash']:
+            return None
+        return graph
+
+
+class NeighborGraphCache(object):
+    """
+    Cache of neighbour graphs on disk, with one file per corpus, tier,
+    algorithm and threshold
+
+    Each file holds the neighbours of the distinct sequences of the tier
+    (see `SequenceGraph`) and the hash of those sequences, so that an
+    unchanged corpus reuses the graph as it is and a changed corpus only
+    needs its new sequences compared.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to keep the cache in, created when needed
+
+    Attributes
+    ----------
+    directory : str
+        Directory of the cache
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def in_storage(cls, storage_directory):
+        """
+        Get the cache in a PCT storage directory
+
+        Parameters
+        ----------
+        storage_directory : str
+            PCT storage directory (which contains CORPUS)
+
+        Returns
+        -------
+        NeighborGraphCache
+            Cache in the NEIGHBORS folder of the storage directory
+        """
+        return cls(os.path.join(storage_directory, CACHE_DIRECTORY))
+
+    def key(self, corpus_context, algorithm, max_distance):
+        """
+        Get the key of the graph of a corpus context
+
+        Parameters
+        ----------
+        corpus_context : CorpusContext
+            Context manager for a corpus
+        algorithm : str
+            The algorithm used to determine distance
+        max_distance : float
+            Maximum distance from a word to consider a word a neighbor
+
+        Returns
+        -------
+        str
+            Key of the graph
+        """
+        params = {'corpus': corpus_context.name,
+                'sequence_type': corpus_context.sequence_type,
+                'algorithm': algorithm,
+                'max_distance': float(max_distance)}
+        if algorithm == 'phono_edit_distance':
+            matrix = corpus_context.specifier.matrix
+            params['features'] = sorted((str(s), sorted(matrix[s].items())) for s in matrix)
+        return hashlib.sha1(json.dumps(params, sort_keys = True).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, key):
+        """
+        Load a graph from the cache
+
+        Parameters
+        ----------
+        key : str
+            Key of the graph (see `key`)
+
+        Returns
+        -------
+        SequenceGraph
+            The cached graph, or None if there is none
+        """
+        return SequenceGraph.load(self.path(key))
+
+    def save(self, key, graph):
+        """
+        Save a graph to the cache
+
+        Parameters
+        ----------
+        key : str
+            Key of the graph (see `key`)
+        graph : SequenceGraph
+            Graph to save
+        """
+        os.makedirs(self.directory, exist_ok = True)
+        graph.save(self.path(key))
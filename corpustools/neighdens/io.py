@@ -1,4 +1,6 @@
 import csv
+import json
+import os
 from corpustools.corpus.classes import Word
 
 def load_words_neighden(path, file_sequence_type='spelling'):
@@ -16,16 +18,67 @@ def print_neighden_results(output_filename, neighbors, output_format):
             output = str(getattr(n, output_format)).replace('.','')
             writer.writerow([output])
 
+class NeighborhoodDensityWriter(object):
+    """
+    Writer for the neighborhood densities and neighbors of many words,
+    one word at a time, so that results can be written out as they are
+    calculated instead of being collected first
+
+    Parameters
+    ----------
+    output_filename : str
+        Path of the file to write
+    file_format : str, optional
+        'tsv' for a header line followed by one tab-separated line per
+        word (word, density and comma-separated neighbors), or 'jsonl'
+        for one JSON object per line; defaults to 'jsonl' for files
+        ending in '.jsonl' or '.json' and 'tsv' otherwise
+    """
+    def __init__(self, output_filename, file_format = None):
+        if file_format is None:
+            ext = os.path.splitext(output_filename)[1].lower()
+            file_format = 'jsonl' if ext in ('.jsonl', '.json') else 'tsv'
+        if file_format not in ('tsv', 'jsonl'):
+            raise ValueError('Unknown file format: {}'.format(file_format))
+        self.file_format = file_format
+        if file_format == 'tsv':
+            self.file = open(output_filename, mode='w', encoding='utf-8-sig')
+            print('Word\tDensity\tNeighbours', file=self.file)
+        else:
+            self.file = open(output_filename, mode='w', encoding='utf-8')
+
+    def write(self, word, density, neighbors):
+        """
+        Write the result for one word
+
+        Parameters
+        ----------
+        word : str
+            The word
+        density : int or float
+            Its neighborhood density
+        neighbors : list
+            Its neighbors
+        """
+        if self.file_format == 'tsv':
+            print('\t'.join([str(word), str(density),
+                             ','.join([str(n).replace('.', '') for n in neighbors])]),
+                  file=self.file)
+        else:
+            print(json.dumps({'word': str(word), 'density': density,
+                              'neighbors': [str(n) for n in neighbors]},
+                             ensure_ascii=False), file=self.file)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb):
+        self.close()
+
 def print_all_neighden_results(output_filename, neighors_dict):
-    with open(output_filename, mode='w', encoding='utf-8-sig') as outf:
-        print('Word\tDensity\tNeighbours', file=outf)
-        for word,neighbors in neighors_dict.items():
-            if not neighbors:
-                print('\t'.join([word, '0', '']), file=outf)
-            else:
-                line = '\t'.join([word,
-                                  str(len(neighbors)-1),
-                                  ','.join([str(n).replace('.', '') for n in neighbors[1:]])])
-                #the -1 and the [1:] slice are to account for words being considered their own neighbours
-                #it's easier to fix this here than to mess with the ND algorithm
-                print(line, file=outf)
\ No newline at end of file
+    with NeighborhoodDensityWriter(output_filename, 'tsv') as writer:
+        for word, neighbors in neighors_dict.items():
+            writer.write(word, len(neighbors), neighbors)
@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from corpustools.neighdens.deletion_index import (encode_sequence, portable_codes,
+                                                recoding_table)
+
+
+def wildcard_keys(encoded):
+    """
+    Generate the keys of an encoded sequence with one position replaced
+    by a wildcard
+
+    Parameters
+    ----------
+    encoded : str
+        Encoded sequence
+
+    Returns
+    -------
+    list
+        Tuples of the wildcarded position and the sequence without the
+        segment at that position
+    """
+    return [(i, encoded[:i] + encoded[i+1:]) for i in range(len(encoded))]
+
+
+class MutationIndex(object):
+    """
+    Index of the words in a corpus context by their single-position
+    wildcard keys, for finding the words that differ from a query by
+    exactly one segment substitution (mutation minimal pairs)
+
+    A word of length L is stored under L keys, one for each position
+    with that position left out. Two sequences share a key exactly when
+    they have the same length and are identical at every other position.
+
+    Parameters
+    ----------
+    corpus_context : CorpusContext
+        Context manager for a corpus
+
+    Attributes
+    ----------
+    words : list
+        Words of the corpus context, in the order they were indexed
+    sequences : list
+        Encoded sequences of the words
+    """
+    def __init__(self, corpus_context):
+        self.sequence_type = corpus_context.sequence_type
+        self.words = []
+        self.sequences = []
+        self._index = defaultdict(list)
+        for i, word in enumerate(corpus_context):
+            encoded = encode_sequence(getattr(word, self.sequence_type))
+            self.words.append(word)
+            self.sequences.append(encoded)
+            for key in wildcard_keys(encoded):
+                self._index[key].append(i)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_index'] = dict(self._index)
+        # Segment codes are only valid within one process
+        state['_codes'] = portable_codes(self.sequences)
+        return state
+
+    def __setstate__(self, state):
+        table = recoding_table(*state.pop('_codes'))
+        self.__dict__.update(state)
+        if table is not None:
+            self.sequences = [s.translate(table) for s in self.sequences]
+            self._index = {(i, k.translate(table)): v for (i, k), v in self._index.items()}
+        self._index = defaultdict(list, self._index)
+
+    def neighbors(self, query):
+        """
+        Find all words that differ from a query word by exactly one
+        substituted segment
+
+        Parameters
+        ----------
+        query : Word
+            Word to find the mutation neighbours of
+
+        Returns
+        -------
+        list
+            Words that differ from the query at exactly one position, in
+            corpus order
+        """
+        encoded = encode_sequence(getattr(query, self.sequence_type))
+        found = set()
+        for key in wildcard_keys(encoded):
+            found.update(self._index.get(key, ()))
+        return [self.words[i] for i in sorted(found)
+                    if self.sequences[i] != encoded]
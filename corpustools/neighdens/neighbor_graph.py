@@ -0,0 +1,170 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# Densities that NeighborGraph.densities calculates, with the text that
+# is added to the display name of the column each one is saved to
+WEIGHTINGS = OrderedDict([('density', ''),
+                        ('token_frequency', 'token frequency'),
+                        ('log_frequency', 'log frequency'),
+                        ('mean_frequency', 'mean frequency')])
+
+
+class NeighborGraph(object):
+    """
+    Neighbours of every word in a corpus context, stored as a sparse
+    adjacency in compressed sparse row (CSR) form: the neighbours of word
+    ``i`` are ``words[j]`` for each ``j`` in
+    ``indices[indptr[i]:indptr[i+1]]``
+
+    Parameters
+    ----------
+    words : list
+        Words of the corpus context
+    indptr : numpy.ndarray
+        Start of each word's neighbours in `indices`, followed by the
+        total number of neighbours
+    indices : numpy.ndarray
+        Positions in `words` of the neighbours of all words, one word
+        after the other
+
+    Attributes
+    ----------
+    words : list
+        Words of the corpus context
+    indptr : numpy.ndarray
+        Start of each word's neighbours in `indices`
+    indices : numpy.ndarray
+        Positions of the neighbours of all words
+    """
+    def __init__(self, words, indptr, indices):
+        self.words = words
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_rows(cls, words, rows):
+        """
+        Build a NeighborGraph from the neighbour positions of each word
+
+        Parameters
+        ----------
+        words : list
+            Words of the corpus context
+        rows : list
+            List of neighbour positions for each word
+
+        Returns
+        -------
+        NeighborGraph
+            Graph of the neighbours
+        """
+        indptr = np.zeros(len(rows) + 1, dtype = np.int64)
+        np.cumsum([len(r) for r in rows], out = indptr[1:])
+        indices = np.zeros(indptr[-1], dtype = np.int64)
+        for i, r in enumerate(rows):
+            indices[indptr[i]:indptr[i + 1]] = r
+        return cls(words, indptr, indices)
+
+    def __len__(self):
+        return len(self.words)
+
+    def neighbors(self, index):
+        """
+        Get the neighbours of a word
+
+        Parameters
+        ----------
+        index : int
+            Position of the word
+
+        Returns
+        -------
+        list
+            Neighbouring Words
+        """
+        return [self.words[j] for j in self.indices[self.indptr[index]:self.indptr[index + 1]]]
+
+    def frequencies(self):
+        """
+        Get the corpus frequency of every word (the frequency of the word
+        in the corpus, even if the corpus context counts types)
+
+        Returns
+        -------
+        numpy.ndarray
+            Frequency of each word, with missing frequencies as 0
+        """
+        freqs = np.array([getattr(w, 'original', w).frequency for w in self.words],
+                        dtype = float)
+        return np.nan_to_num(freqs)
+
+    def densities(self, frequencies = None):
+        """
+        Calculate the neighbourhood density of every word, both as the
+        number of neighbours and weighted by their frequencies
+
+        Log frequencies are natural logarithms, with frequencies of 1 or
+        less counted as 1.00001, as for phonotactic probability.
+
+        Parameters
+        ----------
+        frequencies : numpy.ndarray, optional
+            Frequency of each word, defaults to their corpus frequencies
+
+        Returns
+        -------
+        OrderedDict
+            Arrays of the densities of all words, keyed by the names in
+            `WEIGHTINGS`: the number of neighbours, their summed
+            frequency, their summed log frequency and their mean
+            frequency (0 for words without neighbours)
+        """
+        if frequencies is None:
+            frequencies = self.frequencies()
+        num_words = len(self)
+        counts = np.diff(self.indptr)
+        rows = np.repeat(np.arange(num_words), counts)
+        neighbor_freqs = frequencies[self.indices]
+        log_freqs = np.log(np.where(neighbor_freqs > 1, neighbor_freqs, 1.00001))
+        token = np.bincount(rows, weights = neighbor_freqs, minlength = num_words)
+        densities = OrderedDict()
+        densities['density'] = counts
+        densities['token_frequency'] = token
+        densities['log_frequency'] = np.bincount(rows, weights = log_freqs, minlength = num_words)
+        densities['mean_frequency'] = np.divide(token, counts, out = np.zeros(num_words),
+                                                where = counts > 0)
+        return densities
+
+    def set_attribute(self, corpus, attribute, values):
+        """
+        Add a numeric attribute to a corpus and set its value for every
+        word of the graph
+
+        Parameters
+        ----------
+        corpus : Corpus
+            Corpus that the words belong to
+        attribute : Attribute
+            Attribute to add
+        values : numpy.ndarray
+            Value of each word
+        """
+        corpus.add_attribute(attribute, initialize_defaults = False)
+        for w, value in zip(self.words, values.tolist()):
+            setattr(getattr(w, 'original', w), attribute.name, value)
+
+    def write(self, writer, output_format = 'spelling'):
+        """
+        Write the density and neighbours of every word
+
+        Parameters
+        ----------
+        writer : NeighborhoodDensityWriter
+            Writer to write to
+        output_format : str
+            Attribute of the neighbours to write
+        """
+        for i, w in enumerate(self.words):
+            neighbors = self.neighbors(i)
+            writer.write(str(w), len(neighbors), [getattr(n, output_format) for n in neighbors])
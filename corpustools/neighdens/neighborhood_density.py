@@ -1,12 +1,19 @@
 from functools import partial
 
 from corpustools.corpus.classes import Word
-from corpustools.symbolsim.edit_distance import edit_distance
+from corpustools.symbolsim.edit_distance import edit_distance, edit_distances
 from corpustools.symbolsim.khorsi import khorsi
 from corpustools.symbolsim.phono_edit_distance import phono_edit_distance
 from corpustools.symbolsim.phono_align import Aligner
-from corpustools.multiprocessing import filter_mp, score_mp
+from corpustools.multiprocessing import iter_word_map, context_map
+from corpustools.neighdens.tier_index import same_word
+from corpustools.neighdens.neighbor_graph import NeighborGraph, WEIGHTINGS
+from corpustools.neighdens.graph_cache import (SequenceGraph, CACHED_ALGORITHMS,
+                                                content_hash)
 
+# Above this edit distance, the deletion index grows too quickly with word
+# length, and queries compare the query to every word at once instead
+DELETION_INDEX_MAX_DISTANCE = 2
 
 def _is_edit_distance_neighbor(w, query, sequence_type, max_distance):
     w_len = len(getattr(w, sequence_type))
@@ -23,10 +30,10 @@ def _is_phono_edit_distance_neighbor(w, query, sequence_type, specifier, max_dis
 def _is_khorsi_neighbor(w, query, freq_base, sequence_type, max_distance):
     return khorsi(w, query, freq_base, sequence_type, max_distance) >= max_distance
 
-def neighborhood_density_all_words(corpus_context, tierdict, tier_type = None, sequence_type = None,
+def neighborhood_density_all_words(corpus_context, tierdict = None, tier_type = None, sequence_type = None,
             algorithm = 'edit_distance', max_distance = 1, output_format = 'spelling',
             num_cores = -1, settable_attr = None, collapse_homophones = False,
-            stop_check = None, call_back = None):
+            writer = None, cache = None, stop_check = None, call_back = None):
     """Calculate the neighborhood density of all words in the corpus and
     adds them as attributes of the words.
 
@@ -34,6 +41,9 @@ def neighborhood_density_all_words(corpus_context, tierdict, tier_type = None, s
     ----------
     corpus_context : CorpusContext
         Context manager for a corpus
+    tierdict : dict, optional
+        Words keyed by the string form of their sequence, defaults to the
+        corpus context's tier index (see `BaseCorpusContext.get_tier_index`)
     algorithm : str
         The algorithm used to determine distance
     max_distance : float, optional
@@ -44,71 +54,292 @@ def neighborhood_density_all_words(corpus_context, tierdict, tier_type = None, s
         Optional function to supply progress information during the function
     settable_attr: string
         Name of attribute that neighbourhood density results will be assigned to
+    writer : NeighborhoodDensityWriter, optional
+        If given, each word's density and neighbors are written out as
+        soon as they are calculated, and are not collected in the returned
+        dictionary
+    cache : NeighborGraphCache, optional
+        If given, the neighbors are taken from (and saved to) this cache
+        of neighbor graphs (see `neighbor_graph`)
+
+    Returns
+    -------
+    dict
+        Neighbors of each word (in `output_format`), keyed by word; empty
+        if `writer` is given, and None if stopped
     """
-    function = partial(neighborhood_density, corpus_context,
+    function = partial(_neighborhood_density_in_format,
                         tierdict = tierdict,
+                        output_format = output_format,
                         tier_type = tier_type,
                         sequence_type = sequence_type,
                         algorithm = algorithm,
                         max_distance = max_distance,
                         collapse_homophones = collapse_homophones)
+    if cache is not None:
+        graph = neighbor_graph(corpus_context, tier_type = tier_type, algorithm = algorithm,
+                            max_distance = max_distance, collapse_homophones = collapse_homophones,
+                            num_cores = num_cores, cache = cache,
+                            stop_check = stop_check, call_back = call_back)
+        if graph is None:
+            return
+        results = dict()
+        for i, w in enumerate(graph.words):
+            neighbors = [getattr(n, output_format) for n in graph.neighbors(i)]
+            setattr(w.original, settable_attr.name, len(neighbors))
+            if writer is not None:
+                writer.write(str(w), len(neighbors), neighbors)
+            else:
+                results[str(w)] = neighbors
+        return results
+
     if call_back is not None:
         call_back('Calculating neighborhood densities...')
         call_back(0,len(corpus_context))
         cur = 0
 
-    results = dict()
-    last_value_removed = None
-    last_key_removed = None
-    if num_cores == -1 or num_cores == 1:
+    if not (num_cores == -1 or num_cores == 1):
+        # Build the index once, so the workers receive it with the context
+        if algorithm == 'edit_distance' and max_distance == 1 and tierdict is None:
+            corpus_context.get_tier_index()
+        elif algorithm == 'edit_distance' and 1 < max_distance <= DELETION_INDEX_MAX_DISTANCE:
+            corpus_context.get_deletion_index(max_distance)
+    return _all_words(function, corpus_context, settable_attr.name, num_cores,
+                        writer, stop_check, call_back)
 
-        for w in corpus_context:
-            if stop_check is not None and stop_check():
-                return
-            if last_value_removed:
-                tierdict[last_key_removed].append(last_value_removed)
-            w_sequence = getattr(w, corpus_context.sequence_type)
-            last_key_removed = str(w_sequence)
-            for i, item in enumerate(tierdict[last_key_removed]):
-                if str(item) == str(w):
-                    last_value_removed = tierdict[last_key_removed].pop(i)
-                    break
-            res = neighborhood_density(corpus_context, w, tierdict,
+def weighted_neighborhood_density_all_words(corpus_context, attributes, tier_type = None,
+            algorithm = 'edit_distance', max_distance = 1, output_format = 'spelling',
+            num_cores = -1, collapse_homophones = False, writer = None, cache = None,
+            stop_check = None, call_back = None):
+    """Calculate the neighborhood density of all words in the corpus, both
+    as the number of neighbors and weighted by their frequencies, and add
+    the densities as attributes of the words.
+
+    Parameters
+    ----------
+    corpus_context : CorpusContext
+        Context manager for a corpus
+    attributes : dict
+        Attributes to save densities to, keyed by the names of the
+        densities in `neighbor_graph.WEIGHTINGS` ('density',
+        'token_frequency', 'log_frequency' and 'mean_frequency'); the
+        densities without an attribute are not saved
+    algorithm : str
+        The algorithm used to determine distance
+    max_distance : float, optional
+        Maximum edit distance from the queried word to consider a word a neighbor.
+    writer : NeighborhoodDensityWriter, optional
+        If given, each word's density and neighbors are written out
+    cache : NeighborGraphCache, optional
+        If given, the neighbors are taken from (and saved to) this cache
+        of neighbor graphs (see `neighbor_graph`)
+    stop_check : callable, optional
+        Optional function to check whether to gracefully terminate early
+    call_back : callable, optional
+        Optional function to supply progress information during the function
+
+    Returns
+    -------
+    NeighborGraph
+        Neighbors of every word, or None if stopped
+    """
+    graph = neighbor_graph(corpus_context, tier_type = tier_type, algorithm = algorithm,
+                            max_distance = max_distance, collapse_homophones = collapse_homophones,
+                            num_cores = num_cores, cache = cache,
+                            stop_check = stop_check, call_back = call_back)
+    if graph is None:
+        return
+    densities = graph.densities()
+    for name in WEIGHTINGS:
+        if name in attributes:
+            graph.set_attribute(corpus_context.corpus, attributes[name], densities[name])
+    if writer is not None:
+        graph.write(writer, output_format)
+    return graph
+
+def neighbor_graph(corpus_context, tier_type = None, algorithm = 'edit_distance',
+            max_distance = 1, collapse_homophones = False, num_cores = -1,
+            cache = None, stop_check = None, call_back = None):
+    """Find the neighbors of all words in the corpus, as a sparse graph.
+
+    Parameters
+    ----------
+    corpus_context : CorpusContext
+        Context manager for a corpus
+    algorithm : str
+        The algorithm used to determine distance
+    max_distance : float, optional
+        Maximum edit distance from the queried word to consider a word a neighbor.
+    cache : NeighborGraphCache, optional
+        Cache of neighbor graphs on disk. For the edit distance algorithms,
+        the graph of the distinct sequences of the corpus is loaded from
+        it, only the sequences that are not in the cached graph are
+        compared with the corpus, and the updated graph is saved back
+    stop_check : callable, optional
+        Optional function to check whether to gracefully terminate early
+    call_back : callable, optional
+        Optional function to supply progress information during the function
+
+    Returns
+    -------
+    NeighborGraph
+        Neighbors of every word (not including the word itself), or None
+        if stopped
+    """
+    if cache is not None and algorithm in CACHED_ALGORITHMS:
+        graph = _cached_sequence_graph(corpus_context, cache, tier_type, algorithm,
+                                        max_distance, num_cores, stop_check, call_back)
+        if graph is None:
+            return
+        # As in neighborhood_density, homophones are only collapsed when
+        # searching for edit distance 1 neighbours
+        collapse = collapse_homophones and algorithm == 'edit_distance' and max_distance == 1
+        return graph.expand(corpus_context.get_tier_index().words,
+                            corpus_context.sequence_type, collapse)
+
+    function = partial(_neighbor_positions,
                         tier_type = tier_type,
-                        sequence_type = sequence_type,
                         algorithm = algorithm,
                         max_distance = max_distance,
                         collapse_homophones = collapse_homophones)
-            results[str(w)] = [getattr(r, output_format) for r in res[1]]
-            setattr(w.original, settable_attr.name, res[0])
-
-
-        # for w in corpus_context:
-        #     if stop_check is not None and stop_check():
-        #         return
-        #     cur += 1
-        #     call_back(cur)
-        #     res = function(w)
-        #     results[str(w)] = [getattr(r, output_format) for r in res[1]]
-        #     setattr(w.original, settable_attr.name, res[0]-1)
-        #     #the -1 is to account for the fact that words are counted as their own neighbour, and this is incorrect
-        #     #subtracting 1 here is easier than fixing the neighbourhood density algorithm
+    index = corpus_context.get_tier_index()
+    words = index.words
+    if call_back is not None:
+        call_back('Calculating neighborhood densities...')
+        call_back(0,len(words))
+
+    rows = [None] * len(words)
+    if num_cores == -1 or num_cores == 1:
+        for i, w in enumerate(words):
+            if stop_check is not None and stop_check():
+                return
+            if call_back is not None and i % 100 == 0:
+                call_back(i)
+            rows[i] = function(corpus_context, w)
     else:
-        iterable = ((w,) for w in corpus_context)
-        neighbors = score_mp(iterable, function, num_cores, call_back, stop_check, chunk_size = 1)
-        for n in neighbors:
-            #Have to look up the key, then look up the object due to how
-            #multiprocessing pickles objects
-            setattr(corpus_context.corpus.find(corpus_context.corpus.key(n[0])),
-                    #corpus_context.attribute.name, n[1][0])
-                    settable_attr.name, n[1][0])
+        # Build the index once, so the workers receive it with the context
+        if algorithm == 'edit_distance' and 1 < max_distance <= DELETION_INDEX_MAX_DISTANCE:
+            corpus_context.get_deletion_index(max_distance)
+        for i, res in iter_word_map(function, corpus_context, num_cores,
+                                    call_back = call_back, stop_check = stop_check):
+            rows[i] = res
+        if stop_check is not None and stop_check():
+            return
+    return NeighborGraph.from_rows(words, rows)
+
+def _cached_sequence_graph(corpus_context, cache, tier_type, algorithm, max_distance,
+                            num_cores, stop_check, call_back):
+    """Get the graph of the distinct sequences of a corpus context from a
+    cache, comparing only the sequences that it does not have yet, and
+    save the graph back if it changed"""
+    index = corpus_context.get_tier_index()
+    positions = {}
+    for i, w in enumerate(index.words):
+        positions.setdefault(str(getattr(w, corpus_context.sequence_type)), i)
+    key = cache.key(corpus_context, algorithm, max_distance)
+    cached = cache.load(key)
+    if cached is not None and cached.content_hash == content_hash(positions):
+        return cached
+
+    rows = dict()
+    if cached is None:
+        todo = list(positions)
+    else:
+        # Neighbours depend only on the two sequences, so the neighbours
+        # of the remaining sequences stay valid
+        for s, neighbors in cached.rows().items():
+            if s in positions:
+                rows[s] = [n for n in neighbors if n in positions]
+        todo = [s for s in positions if s not in rows]
+
+    function = partial(_neighbor_sequences,
+                        tier_type = tier_type,
+                        algorithm = algorithm,
+                        max_distance = max_distance)
+    items = [positions[s] for s in todo]
+    if call_back is not None:
+        call_back('Finding neighbors of {} new sequences...'.format(len(items)))
+        call_back(0, len(items))
+    if num_cores == -1 or num_cores == 1:
+        found = []
+        for i, item in enumerate(items):
+            if stop_check is not None and stop_check():
+                return
+            if call_back is not None and i % 100 == 0:
+                call_back(i)
+            found.append(function(corpus_context, item))
+    else:
+        found = context_map(function, items, corpus_context, num_cores,
+                            call_back = call_back, stop_check = stop_check)
+        if found is None:
+            return
 
+    new = set(todo)
+    for s, neighbors in zip(todo, found):
+        rows[s] = neighbors
+        for n in neighbors:
+            if n not in new:
+                rows[n].append(s)
+    graph = SequenceGraph.from_rows(rows)
+    cache.save(key, graph)
+    return graph
+
+def _neighbor_sequences(corpus_context, position, **kwargs):
+    """Find the sequences of the neighbors of a word of the corpus
+    context's tier index, other than the word's own sequence"""
+    w = corpus_context.get_tier_index().words[position]
+    res = neighborhood_density(corpus_context, w, exclude_query = True, **kwargs)
+    own = str(getattr(w, corpus_context.sequence_type))
+    return sorted(set(str(getattr(n, corpus_context.sequence_type)) for n in res[1]) - set([own]))
+
+def _neighbor_positions(corpus_context, w, **kwargs):
+    """Find the neighbors of a word of the corpus, as their positions in
+    the corpus context's tier index"""
+    index = corpus_context.get_tier_index()
+    res = neighborhood_density(corpus_context, w, index, exclude_query = True, **kwargs)
+    return sorted(index.position(n) for n in res[1])
+
+def _all_words(function, corpus_context, attribute_name, num_cores, writer,
+                stop_check, call_back):
+    """Apply a neighbor function to every word of a corpus context, set
+    the number of neighbors as an attribute of each word, and either
+    collect the neighbors or write them out with `writer` as soon as each
+    word is done"""
+    results = dict()
+    for w, res in _iter_all_words(function, corpus_context, num_cores,
+                                    stop_check, call_back):
+        setattr(w.original, attribute_name, res[0])
+        if writer is not None:
+            writer.write(str(w), res[0], res[1])
+        else:
+            results[str(w)] = res[1]
+    if stop_check is not None and stop_check():
+        return
     return results
 
-def neighborhood_density(corpus_context, query, tierdict,
+def _iter_all_words(function, corpus_context, num_cores, stop_check, call_back):
+    if num_cores == -1 or num_cores == 1:
+        for w in corpus_context:
+            if stop_check is not None and stop_check():
+                return
+            yield w, function(corpus_context, w)
+    else:
+        words = list(corpus_context)
+        for i, res in iter_word_map(function, corpus_context, num_cores,
+                                    call_back = call_back, stop_check = stop_check):
+            yield words[i], res
+
+def _neighborhood_density_in_format(corpus_context, w, output_format, **kwargs):
+    """Calculate the neighborhood density of a word of the corpus, which
+    is not counted as its own neighbor, and return the neighbors in
+    `output_format`"""
+    res = neighborhood_density(corpus_context, w, exclude_query = True, **kwargs)
+    return res[0], [getattr(r, output_format) for r in res[1]]
+
+def neighborhood_density(corpus_context, query, tierdict = None,
             algorithm = 'edit_distance', max_distance = 1, collapse_homophones = False,
             force_quadratic = False, file_type = None, tier_type=None, sequence_type = None,
-            stop_check = None, call_back = None):
+            exclude_query = True, stop_check = None, call_back = None):
     """Calculate the neighborhood density of a particular word in the corpus.
 
     Parameters
@@ -117,13 +348,24 @@ def neighborhood_density(corpus_context, query, tierdict,
         Context manager for a corpus
     query : Word
         The word whose neighborhood density to calculate.
+    tierdict : dict, optional
+        Words keyed by the string form of their sequence, for finding
+        edit distance 1 neighbours, defaults to the corpus context's tier
+        index (see `BaseCorpusContext.get_tier_index`)
     algorithm : str
         The algorithm used to determine distance
     max_distance : float, optional
         Maximum edit distance from the queried word to consider a word a neighbor
     force_quadratic : bool
         Force use of the less efficient quadratic algorithm even when finding edit 
-        distance of 1 neighborhoods
+        distance neighborhoods, which otherwise use generated candidates
+        (distance 1), the corpus context's deletion index (distance 2) or
+        a vectorised comparison with all words at once (larger distances)
+    exclude_query : bool
+        Leave the query out of the neighbours found in `tierdict` when it
+        is a word of the corpus (matched by identity, so homophones still
+        count); the other algorithms always leave out words equal to the
+        query
     stop_check : callable, optional
         Optional function to check whether to gracefully terminate early
     call_back : callable, optional
@@ -144,8 +386,22 @@ def neighborhood_density(corpus_context, query, tierdict,
         cur = 0
 
     if algorithm == 'edit_distance' and max_distance == 1 and not force_quadratic:
+        if tierdict is None:
+            tierdict = corpus_context.get_tier_index()
         return fast_neighborhood_density(corpus_context, query, corpus_context.sequence_type, tier_type, tierdict,
-                                         file_type=file_type, collapse_homophones=collapse_homophones)
+                                         file_type=file_type, collapse_homophones=collapse_homophones,
+                                         exclude = query if exclude_query else None)
+
+    if algorithm == 'edit_distance' and not force_quadratic:
+        if max_distance <= DELETION_INDEX_MAX_DISTANCE:
+            index = corpus_context.get_deletion_index(max_distance)
+            matches = index.neighbors(query, max_distance)
+        else:
+            words = list(corpus_context)
+            distances = edit_distances(query, words, corpus_context.sequence_type, max_distance)
+            matches = [w for w, d in zip(words, distances) if d <= max_distance]
+        neighbors = set(matches)-set([query])
+        return (len(neighbors), neighbors)
 
     if algorithm == 'edit_distance':
         is_neighbor = partial(_is_edit_distance_neighbor,
@@ -178,7 +434,8 @@ def neighborhood_density(corpus_context, query, tierdict,
 
 
 def fast_neighborhood_density(corpus_context, query, sequence_type, tier_type,
-                              tierdict, file_type=None, trans_delimiter='.', collapse_homophones = False):
+                              tierdict, file_type=None, trans_delimiter='.', collapse_homophones = False,
+                              exclude = None):
     """Generates all neighbors of edit distance <= 1 and searches 
     for them in corpus_context.
 
@@ -187,88 +444,107 @@ def fast_neighborhood_density(corpus_context, query, sequence_type, tier_type,
     n: number of words in corpus
     m: length of query
     s: size of segment inventory
+
+    If `exclude` is given, that word (matched by identity) is not counted
+    among the words that share the query's sequence.
     """
 
-    neighbors = list()
     query = ensure_query_is_word(query, corpus_context, sequence_type, tier_type, file_type=file_type)
+    if tier_type is not None:
+        is_tier = tier_type.att_type == 'tier'
+    else:
+        is_tier = sequence_type != 'spelling'
+    delimiter = trans_delimiter if is_tier else ''
 
-    for candidate in generate_neighbor_candidates(corpus_context, query, sequence_type):
-        if tier_type.att_type == 'tier':
-            cand_str = trans_delimiter.join(candidate)
+    neighbors = list()
+    found = set()
+    query_str = None
+    for cand_str in generate_neighbor_candidates(corpus_context, query, sequence_type,
+                                                delimiter = delimiter):
+        if query_str is None:
+            query_str = cand_str
+        if cand_str in found or cand_str not in tierdict:
+            continue
+        found.add(cand_str)
+        words = tierdict[cand_str]
+        if exclude is not None and cand_str == query_str:
+            words = [w for w in words if not same_word(w, exclude)]
+        if collapse_homophones:
+            # All the words under one key share a sequence
+            neighbors.extend(words[:1])
         else:
-            cand_str = ''.join(candidate)
-
-        if cand_str in tierdict:
-            for w in tierdict[cand_str]:
-                w_sequence = getattr(w, sequence_type)
-                if collapse_homophones and any(getattr(word, sequence_type) == w_sequence for word in neighbors):
-                    continue
-                else:
-                    neighbors.append(w)
+            neighbors.extend(words)
     return (len(neighbors), neighbors)
 
-def generate_neighbor_candidates(corpus_context, query, sequence_type):
-    sequence = getattr(query, sequence_type)
-    yield [str(c) for c in sequence]
-    for i in range(len(sequence)):
-        yield [str(c) for c in sequence[:i]] + [str(c) for c in sequence[i+1:]] # deletion
-        for char in corpus_context.inventory:
-            if str(char) not in ['#', sequence[i]]:
-                yield [str(c) for c in sequence[:i]] + [str(char)] + [str(c) for c in sequence[i:]] # insertion
-                yield [str(c) for c in sequence[:i]] + [str(char)] + [str(c) for c in sequence[i+1:]] # substitution
-    for char in corpus_context.inventory: # final pass to get insertion at len+1
-        if str(char) not in ['#', sequence[i]]:
-            yield [str(c) for c in sequence[:]] + [str(char)] # insertion
-
-def find_mutation_minpairs_all_words(corpus_context, tierdict, tier_type = None, num_cores = -1, collapse_homophones = False,
-                    stop_check = None, call_back = None):
-
-    function = partial(find_mutation_minpairs, corpus_context, tier_type=tier_type, collapse_homophones = collapse_homophones)
+def generate_neighbor_candidates(corpus_context, query, sequence_type, delimiter = ''):
+    """Generate the sequences that are at most one deletion, insertion or
+    substitution away from the query, as strings of segments joined by
+    `delimiter`
+
+    The strings are built from prefixes and suffixes of the query that
+    are joined once, and the segment symbols of the inventory are
+    looked up once per query.  A candidate can be generated more than
+    once (for instance, deleting either segment of a geminate).
+
+    Parameters
+    ----------
+    corpus_context : CorpusContext
+        Context manager for a corpus
+    query : Word
+        Word to generate the candidates for
+    sequence_type : str
+        Sequence of the query to edit
+    delimiter : str
+        String to join the segments of each candidate with
+
+    Returns
+    -------
+    generator
+        Candidate strings, starting with the query's own sequence
+    """
+    segments = [str(c) for c in getattr(query, sequence_type)]
+    symbols = [str(c) for c in corpus_context.inventory]
+    symbols = [s for s in symbols if s != '#']
+    length = len(segments)
+
+    # heads[i] is the first i segments and tails[i] the segments from i
+    # on, each with the delimiter that joins it to a following/preceding
+    # segment
+    joined = [delimiter.join(segments[:i]) for i in range(length + 1)]
+    heads = [''] + [p + delimiter for p in joined[1:]]
+    rests = [delimiter.join(segments[i:]) for i in range(length + 1)]
+    tails = [delimiter + r for r in rests[:-1]] + ['']
+
+    yield joined[length]
+    for i in range(length):
+        if i == length - 1:
+            yield joined[i] # deletion
+        else:
+            yield heads[i] + rests[i + 1]
+        for s in symbols:
+            if s != segments[i]:
+                yield heads[i] + s + tails[i] # insertion
+                yield heads[i] + s + tails[i + 1] # substitution
+    for s in symbols: # insertion at the end
+        yield heads[length] + s
+
+def find_mutation_minpairs_all_words(corpus_context, tierdict = None, tier_type = None, num_cores = -1, collapse_homophones = False,
+                    writer = None, stop_check = None, call_back = None):
+
+    function = partial(find_mutation_minpairs, tier_type=tier_type, collapse_homophones = collapse_homophones)
     if call_back is not None:
         call_back('Calculating neighborhood densities...')
         call_back(0,len(corpus_context))
         cur = 0
 
-    results = dict()
-    last_value_removed = None
-    last_key_removed = None
-    if num_cores == -1 or num_cores == 1:
-        for w in corpus_context:
-            if stop_check is not None and stop_check():
-                return
-            if last_value_removed:
-                tierdict[last_key_removed].append(last_value_removed)
-            w_sequence = getattr(w, corpus_context.sequence_type)
-            last_key_removed = str(w_sequence)
-            for i, item in enumerate(tierdict[last_key_removed]):
-                if str(item) == str(w):
-                    last_value_removed = tierdict[last_key_removed].pop(i)
-                    break
-            res = find_mutation_minpairs(corpus_context, w,
-                                         tier_type=tier_type, collapse_homophones = collapse_homophones)
-            results[str(w)] = res[1]
-            setattr(w.original, corpus_context.attribute.name, res[0])
-
-        # for w in corpus_context:
-        #     if stop_check is not None and stop_check():
-        #         return
-        #     cur += 1
-        #     call_back(cur)
-        #     res = function(w)
-        #     results[str(w)] = res[1]#[str(r) for r in res[1]]
-        #     setattr(w.original, corpus_context.attribute.name, res[0])
-    else:
-        iterable = ((w,) for w in corpus_context)
-        neighbors = score_mp(iterable, function, num_cores, call_back, stop_check, chunk_size= 1)
-        for n in neighbors:
-            #Have to look up the key, then look up the object due to how
-            #multiprocessing pickles objects
-            setattr(corpus_context.corpus.find(corpus_context.corpus.key(n[0])), corpus_context.attribute.name, n[1][0])
-
-    return results
+    if not (num_cores == -1 or num_cores == 1):
+        # Build the index once, so the workers receive it with the context
+        corpus_context.get_mutation_index()
+    return _all_words(function, corpus_context, corpus_context.attribute.name, num_cores,
+                        writer, stop_check, call_back)
 
 def find_mutation_minpairs(corpus_context, query, tier_type = None, collapse_homophones = False,
-                    stop_check = None, call_back = None):
+                    force_quadratic = False, stop_check = None, call_back = None):
     """Find all minimal pairs of the query word based only on segment
     mutations (not deletions/insertions)
 
@@ -278,6 +554,9 @@ def find_mutation_minpairs(corpus_context, query, tier_type = None, collapse_hom
         Context manager for a corpus
     query : Word
         The word whose minimal pairs to find
+    force_quadratic : bool
+        Force comparing the query to every word, instead of looking up
+        its neighbours in the corpus context's mutation index
     stop_check : callable or None
         Optional function to check whether to gracefully terminate early
     call_back : callable or None
@@ -291,34 +570,41 @@ def find_mutation_minpairs(corpus_context, query, tier_type = None, collapse_hom
     matches = []
     sequence_type = corpus_context.sequence_type
     query = ensure_query_is_word(query, corpus_context, corpus_context.sequence_type, tier_type)
-    if call_back is not None:
-        call_back('Finding neighbors...')
-        call_back(0,len(corpus_context))
-        cur = 0
-    al = Aligner(features_tf=False, ins_penalty=float('inf'), del_penalty=float('inf'), sub_penalty=1)
-    for w in corpus_context:
-        w_sequence = getattr(w, sequence_type)
-        query_sequence = getattr(query, sequence_type)
-        if stop_check is not None and stop_check():
-            return
+    query_sequence = getattr(query, sequence_type)
+    if not force_quadratic:
+        matches = corpus_context.get_mutation_index().neighbors(query)
+    else:
         if call_back is not None:
-            cur += 1
-            if cur % 10 == 0:
-                call_back(cur)
-        if (len(w_sequence) > len(query_sequence)+1 or
-            len(w_sequence) < len(query_sequence)-1):
-            continue
-        m = al.make_similarity_matrix(query_sequence, w_sequence)
-        if m[-1][-1]['f'] != 1:
-            continue
-
-        w_sequence = getattr(w, sequence_type)
-        if collapse_homophones and any(getattr(m, sequence_type) == w_sequence for m in matches):
-            continue
-        else:
-            #matches.append(str(w_sequence))
+            call_back('Finding neighbors...')
+            call_back(0,len(corpus_context))
+            cur = 0
+        al = Aligner(features_tf=False, ins_penalty=float('inf'), del_penalty=float('inf'), sub_penalty=1)
+        for w in corpus_context:
+            w_sequence = getattr(w, sequence_type)
+            if stop_check is not None and stop_check():
+                return
+            if call_back is not None:
+                cur += 1
+                if cur % 10 == 0:
+                    call_back(cur)
+            if (len(w_sequence) > len(query_sequence)+1 or
+                len(w_sequence) < len(query_sequence)-1):
+                continue
+            if al.distance(query_sequence, w_sequence) != 1:
+                continue
             matches.append(w)
 
+    if collapse_homophones:
+        seen = set()
+        collapsed = []
+        for w in matches:
+            w_sequence = getattr(w, sequence_type)
+            if w_sequence in seen:
+                continue
+            seen.add(w_sequence)
+            collapsed.append(w)
+        matches = collapsed
+
     matches = [m.spelling for m in matches]
     neighbors = list(set(matches)-set([str(query_sequence)]))
     return (len(neighbors), neighbors)
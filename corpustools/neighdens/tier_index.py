@@ -0,0 +1,109 @@
+from collections import defaultdict
+
+
+def same_word(word, other):
+    """
+    Check whether two words are the same word of a corpus, by identity
+
+    Corpus contexts yield copies of the words of their corpus, which
+    refer back to the corpus word as ``original``, so copies made by
+    different passes over a context count as the same word.
+
+    Parameters
+    ----------
+    word : Word
+        First word
+    other : Word
+        Second word
+
+    Returns
+    -------
+    bool
+        True if both are (copies of) the same word object
+    """
+    return getattr(word, 'original', word) is getattr(other, 'original', other)
+
+
+class TierIndex(object):
+    """
+    Index of the words in a corpus context by the string form of their
+    sequence (i.e., 'm.ɑ.t.ɑ' for a transcription), for looking up all
+    words with a given sequence in constant time
+
+    The index is a read-only mapping from sequence strings to lists of
+    words; the lists must not be modified.
+
+    Parameters
+    ----------
+    corpus_context : CorpusContext
+        Context manager for a corpus
+
+    Attributes
+    ----------
+    words : list
+        Words of the corpus context, in the order they were indexed
+    """
+    def __init__(self, corpus_context):
+        self.sequence_type = corpus_context.sequence_type
+        self.words = []
+        self._index = defaultdict(list)
+        self._positions = {}
+        for i, word in enumerate(corpus_context):
+            self.words.append(word)
+            self._positions[id(getattr(word, 'original', word))] = i
+            self._index[str(getattr(word, self.sequence_type))].append(word)
+        self._index = dict(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __getitem__(self, key):
+        return self._index[key]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, key, default = None):
+        return self._index.get(key, default)
+
+    def lookup(self, key, exclude = None):
+        """
+        Find the words with a sequence, optionally leaving out one word
+
+        Parameters
+        ----------
+        key : str
+            String form of the sequence
+        exclude : Word, optional
+            Word to leave out, matched by identity (see `same_word`)
+
+        Returns
+        -------
+        list
+            Words with the sequence, in corpus order
+        """
+        words = self._index.get(key, [])
+        if exclude is None:
+            return list(words)
+        return [w for w in words if not same_word(w, exclude)]
+
+    def position(self, word):
+        """
+        Find the position of a word in `words`
+
+        Parameters
+        ----------
+        word : Word
+            Word of the corpus context, matched by identity (see
+            `same_word`), so that duplicate entries with the same spelling
+            and transcription keep their own positions
+
+        Returns
+        -------
+        int
+            Position of the word
+        """
+        return self._positions[id(getattr(word, 'original', word))]
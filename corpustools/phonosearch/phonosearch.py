@@ -47,8 +47,7 @@ def phonological_search(corpus, envs, sequence_type = 'transcription',
                 call_back(cur)
         tier = getattr(word, sequence_type)
         found = []
-        for env in envs:
-            es = tier.find(env)
+        for es in tier.find_all(envs):
             if es is not None:
                 found.extend(es)
         if found:
@@ -30,11 +30,8 @@ def check_envs(corpus_context, envs, stop_check, call_back):
         tier = getattr(word, corpus_context.sequence_type)
         overlaps = defaultdict(list)
         found_env = False
-        for env in envs:
-            a = env.is_applicable(tier.with_word_boundaries())
-            if not a:
-                continue
-            es = tier.find(env)
+        applicable = [env for env in envs if env.is_applicable(tier.with_word_boundaries())]
+        for env, es in zip(applicable, tier.find_all(applicable)):
             if es is not None:
                 found_env = True
                 for e in es:
@@ -1,4 +1,7 @@
-from corpustools.corpus.classes import Word
+import numpy as np
+
+from corpustools.corpus.classes import Word, Transcription
+from corpustools.corpus.classes.lexicon import segment_id
 #from corpustools.symbolsim.phono_align import Aligner
 
 #al = Aligner(features_tf=False)
@@ -59,8 +62,7 @@ from corpustools.corpus.classes import Word
 
 def edit_distance(word1, word2, sequence_type, max_distance = None):
     """Returns the Levenshtein edit distance between a string from
-    two words word1 and word2, code drawn from
-    http://en.wikibooks.org/wiki/Algorithm_Implementation/Strings/Levenshtein_distance#Python.
+    two words word1 and word2.
     The number is the number of operations needed to transform word1 into word2,
     three operations are possible: insert, delete, substitute
 
@@ -73,6 +75,9 @@ def edit_distance(word1, word2, sequence_type, max_distance = None):
     string_type : string
         String specifying what attribute of the Word objects to compare,
         can be "spelling", "transcription" or a tier
+    max_distance : int, optional
+        If specified, only distances up to this are computed exactly, and
+        ``max_distance + 1`` is returned for anything further apart
 
     Returns
     -------
@@ -81,19 +86,195 @@ def edit_distance(word1, word2, sequence_type, max_distance = None):
     """
     s1 = getattr(word1, sequence_type)
     s2 = getattr(word2, sequence_type)
+    if isinstance(s1, Transcription):
+        s1 = s1._ids
+    if isinstance(s2, Transcription):
+        s2 = s2._ids
+    return bounded_levenshtein(s1, s2, max_distance)
+
+def bounded_levenshtein(s1, s2, max_distance = None):
+    """Levenshtein distance between two sequences, computed only within
+    a band of `max_distance` cells around the diagonal (Ukkonen's cutoff)
+    and stopping as soon as every cell in a row exceeds `max_distance`
+
+    Parameters
+    ----------
+    s1 : sequence
+        First sequence
+    s2 : sequence
+        Second sequence
+    max_distance : int, optional
+        Largest distance that needs to be computed exactly, defaults to
+        no limit
 
+    Returns
+    -------
+    int:
+        the edit distance, or ``max_distance + 1`` if it is larger than
+        `max_distance`
+    """
     longer, shorter = (s1,s2) if len(s1) > len(s2) else (s2,s1)
+    n = len(longer)
+    m = len(shorter)
+    if max_distance is None:
+        max_distance = n
+    max_distance = int(max_distance)
+    over = max_distance + 1
+    if n - m > max_distance:
+        return over
 
-    previous_row = range(len(shorter) + 1)
-    for i, c1 in enumerate(longer):
-        current_row = [i + 1]
-        for j, c2 in enumerate(shorter):
-            insertions = previous_row[j + 1] + 1 # j+1 instead of j since previous_row and current_row are one character longer
-            deletions = current_row[j] + 1       # than s2
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
+    previous_row = [j if j <= max_distance else over for j in range(m + 1)]
+    for i in range(1, n + 1):
+        c1 = longer[i-1]
+        current_row = [over] * (m + 1)
+        if i <= max_distance:
+            current_row[0] = i
+        row_min = current_row[0]
+        for j in range(max(1, i - max_distance), min(m, i + max_distance) + 1):
+            value = min(previous_row[j] + 1, current_row[j-1] + 1,
+                        previous_row[j-1] + (c1 != shorter[j-1]))
+            if value > over:
+                value = over
+            elif value < row_min:
+                row_min = value
+            current_row[j] = value
+        if row_min > max_distance:
+            return over
         previous_row = current_row
-        #if max_distance is not None and previous_row[-1] > max_distance:
-        #    break
     return previous_row[-1]
 
+def segment_ids(sequence):
+    """Get the interned segment IDs of a Transcription or spelling as an
+    array
+
+    Parameters
+    ----------
+    sequence : Transcription or str
+        Sequence of segments
+
+    Returns
+    -------
+    numpy.ndarray
+        Segment IDs
+    """
+    if isinstance(sequence, Transcription):
+        return np.frombuffer(sequence._ids, dtype = np.uint16)
+    return np.array([segment_id(str(s)) for s in sequence], dtype = np.uint16)
+
+def edit_distances(query, candidates, sequence_type, max_distance = None):
+    """Returns the Levenshtein edit distances between one word and many
+    others.
+
+    Queries of up to 64 segments use the bit-parallel algorithm of Myers
+    (1999), as formulated for edit distance by Hyyrö (2001): a bitmask of
+    the query positions of each of its segments is built once, and every
+    candidate is then processed at the same time, one segment position
+    at a time, with NumPy operations on 64-bit words. Longer queries are
+    compared to each group of candidates of the same length with a
+    vectorised dynamic programming table instead.
+
+    Parameters
+    ----------
+    query: Word
+        the word to compare all the candidates to
+    candidates: list of Word
+        the words to be compared to the query
+    sequence_type : string
+        String specifying what attribute of the Word objects to compare,
+        can be "spelling", "transcription" or a tier
+    max_distance : int, optional
+        If specified, only distances up to this are computed exactly, and
+        ``max_distance + 1`` is returned for anything further apart
+
+    Returns
+    -------
+    numpy.ndarray
+        the edit distance between the query and each candidate, in the
+        order of `candidates`
+    """
+    q = segment_ids(getattr(query, sequence_type))
+    sequences = [segment_ids(getattr(w, sequence_type)) for w in candidates]
+    if max_distance is not None:
+        max_distance = int(max_distance)
+    if 0 < len(q) <= 64:
+        distances = _bit_parallel_distances(q, sequences)
+    else:
+        distances = _table_distances(q, sequences, max_distance)
+    if max_distance is not None:
+        np.minimum(distances, max_distance + 1, out = distances)
+    return distances
+
+def _bit_parallel_distances(q, sequences):
+    m = len(q)
+    one = np.uint64(1)
+    mask = np.uint64((1 << m) - 1)
+    high_bit = np.uint64(1 << (m - 1))
+
+    # Bitmask of the query positions of each segment, indexed through a
+    # table from segment ID to row; segments not in the query get row 0
+    alphabet = np.unique(q)
+    peq = np.zeros(len(alphabet) + 1, dtype = np.uint64)
+    for i, seg in enumerate(q):
+        peq[np.searchsorted(alphabet, seg) + 1] |= one << np.uint64(i)
+
+    # Process candidates from longest to shortest, so that the ones that
+    # are still being read are always a prefix of the arrays
+    lengths = np.array([len(s) for s in sequences], dtype = np.int64)
+    order = np.argsort(-lengths, kind = 'mergesort')
+    sorted_lengths = lengths[order]
+    longest = int(sorted_lengths[0]) if len(order) else 0
+    flat = np.concatenate([sequences[i] for i in order] + [q])
+    rows = np.zeros(int(flat.max()) + 1, dtype = np.intp)
+    rows[alphabet] = np.arange(1, len(alphabet) + 1)
+    flat = flat[:len(flat) - m]
+    starts = np.cumsum(sorted_lengths) - sorted_lengths
+    text = np.zeros((len(sequences), longest), dtype = np.intp)
+    text[np.repeat(np.arange(len(sequences)), sorted_lengths),
+         np.arange(len(flat)) - np.repeat(starts, sorted_lengths)] = rows[flat]
+
+    pv = np.full(len(sequences), mask, dtype = np.uint64)
+    mv = np.zeros(len(sequences), dtype = np.uint64)
+    score = np.full(len(sequences), m, dtype = np.int64)
+    for t in range(longest):
+        active = int(np.searchsorted(-sorted_lengths, -t, side = 'left'))
+        eq = peq[text[:active, t]]
+        p = pv[:active]
+        n = mv[:active]
+        xv = eq | n
+        xh = (((eq & p) + p) ^ p) | eq
+        ph = n | ~(xh | p)
+        mh = p & xh
+        score[:active] += (ph & high_bit != 0).astype(np.int64)
+        score[:active] -= (mh & high_bit != 0).astype(np.int64)
+        ph = ((ph << one) | one) & mask
+        mh = (mh << one) & mask
+        pv[:active] = (mh | ~(xv | ph)) & mask
+        mv[:active] = ph & xv
+    distances = np.empty(len(sequences), dtype = np.int64)
+    distances[order] = score
+    return distances
+
+def _table_distances(q, sequences, max_distance):
+    lengths = np.array([len(s) for s in sequences], dtype = np.int64)
+    distances = np.empty(len(sequences), dtype = np.int64)
+    for m in np.unique(lengths):
+        group = np.flatnonzero(lengths == m)
+        if max_distance is not None and abs(int(m) - len(q)) > max_distance:
+            distances[group] = max_distance + 1
+            continue
+        if m == 0:
+            distances[group] = len(q)
+            continue
+        batch = np.stack([sequences[i] for i in group])
+        offsets = np.arange(m + 1)
+        previous_row = np.tile(offsets, (len(group), 1))
+        for i, c in enumerate(q, start = 1):
+            best = np.minimum(previous_row[:, :-1] + (batch != c), previous_row[:, 1:] + 1)
+            best = np.concatenate([np.full((len(group), 1), i), best], axis = 1)
+            # Deletions chain along the row: cell j is the minimum over
+            # k <= j of best[k] + (j - k)
+            previous_row = np.minimum.accumulate(best - offsets, axis = 1) + offsets
+            if max_distance is not None and previous_row.min() > max_distance:
+                break
+        distances[group] = previous_row[:, -1]
+    return distances
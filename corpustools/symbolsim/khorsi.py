@@ -2,10 +2,21 @@
 from collections import defaultdict
 from math import log
 
+import numpy as np
+
+from corpustools.corpus.classes.lexicon import _segment_symbols
+from corpustools.symbolsim.edit_distance import segment_ids
+
 def lcs(x1, x2):
     """Returns the longest common sequence of two lists of characters
     and the remainder elements not in the longest common sequence
 
+    The longest common substring is found with dynamic programming over
+    the segments of both lists, keeping the length of the common suffix
+    ending at each pair of positions.  If several substrings are equally
+    long, the one that starts first in the shorter list is returned (the
+    second list counts as shorter if they are the same length).
+
     Parameters
     ----------
     x1: list
@@ -24,50 +35,36 @@ def lcs(x1, x2):
         the longest common sequence
     """
     if len(x1) >= len(x2):
-        longer = x1
-        shorter = x2
+        longer = list(x1)
+        shorter = list(x2)
     else:
-        longer = x2
-        shorter = x1
-    stringMatches = []
-    largestMatch = None
-    for i in range(len(shorter),0,-1):
-        #Get all possible substrings of word x1
-        shorter_strings = substring_set(shorter, i)
-        longer_strings = substring_set(longer, i)
-
-        s = shorter_strings & longer_strings
-
-        if len(s):
-            break
-    else:
-        return [], longer+shorter
-
-    leftover = []
-    for i in range(len(shorter)):
-
-        begin = i
-        for lcs in s:
-            lcs = lcs.split('.') #back to list
-            end = i+len(lcs)
-            if shorter[begin:end] == lcs:
-                break
-        else:
-            lcs = None
-        if lcs is not None:
-            break
-    if lcs is None:
-        lcs = []
-    leftover.extend(shorter[:begin])
-    leftover.extend(shorter[end:])
+        longer = list(x2)
+        shorter = list(x1)
+    length = 0
+    end = 0
+    previous_row = [0] * (len(longer) + 1)
+    for i, seg in enumerate(shorter, start = 1):
+        current_row = [0] * (len(longer) + 1)
+        for j, other in enumerate(longer, start = 1):
+            if seg == other:
+                current_row[j] = previous_row[j - 1] + 1
+        row_max = max(current_row)
+        if row_max > length:
+            length = row_max
+            end = i
+        previous_row = current_row
+    if length == 0:
+        return [], longer + shorter
+
+    begin = end - length
+    lcs = shorter[begin:end]
+    leftover = shorter[:begin] + shorter[end:]
     for i in range(len(longer)):
-        begin = i
-        end = i+len(lcs)
-        if longer[begin:end] == lcs:
+        if longer[i:i + length] == lcs:
             break
-    leftover.extend(longer[:begin])
-    leftover.extend(longer[end:])
-    return lcs,leftover
+    leftover.extend(longer[:i])
+    leftover.extend(longer[i + length:])
+    return lcs, leftover
 
 def substring_set(w, l):
     """Returns all substrings of a word w of length l
@@ -139,3 +136,83 @@ def khorsi(word1, word2, freq_base, sequence_type, max_distance = None):
             break
     return khorsi_sum
 
+def khorsi_scores(query, candidates, freq_base, sequence_type):
+    """Calculate the Khorsi (2012) string similarity between one word and
+    many others, with the same result as ``khorsi(query, candidate)`` for
+    each candidate
+
+    The longest common substrings are found for all candidates of the
+    same length at once, with a NumPy dynamic programming table over
+    their interned segment IDs that is filled one query segment at a
+    time.  The similarity is then the information of the longest common
+    substring, minus that of the rest of both words.
+
+    Parameters
+    ----------
+    query: Word
+        the word to compare all the candidates to
+    candidates: list of Word
+        the words to be compared to the query
+    freq_base: dictionary
+        a dictionary where each segment is mapped to its frequency of
+        occurrence in a corpus
+    sequence_type: string
+        The type of segments to be used ('spelling' = Roman letters,
+        'transcription' = IPA symbols)
+
+    Returns
+    -------
+    numpy.ndarray
+        the similarity of the query and each candidate, in the order of
+        `candidates`
+    """
+    q = segment_ids(getattr(query, sequence_type))
+    sequences = [segment_ids(getattr(w, sequence_type)) for w in candidates]
+    ids = np.unique(np.concatenate([q] + sequences))
+    information = np.zeros(int(ids[-1]) + 1 if len(ids) else 1)
+    for i in ids.tolist():
+        information[i] = log(1/(freq_base[_segment_symbols[i]]/freq_base['total']))
+    query_cumulative = np.concatenate([[0], np.cumsum(information[q])])
+
+    lengths = np.array([len(s) for s in sequences], dtype = np.int64)
+    scores = np.empty(len(sequences))
+    for m in np.unique(lengths).tolist():
+        group = np.flatnonzero(lengths == m)
+        common = np.zeros(len(group))
+        if m == 0 or len(q) == 0:
+            candidate_totals = np.array([information[sequences[i]].sum() for i in group])
+            scores[group] = -query_cumulative[-1] - candidate_totals
+            continue
+        batch = np.stack([sequences[i] for i in group])
+        cumulative = np.zeros((len(group), m + 1))
+        np.cumsum(information[batch], axis = 1, out = cumulative[:, 1:])
+        previous_row = np.zeros((len(group), m + 1), dtype = np.int64)
+        current_row = np.zeros((len(group), m + 1), dtype = np.int64)
+        rows = np.arange(len(group))
+        if len(q) < m:
+            # The query is the shorter word: the substring that ends
+            # first in the query wins ties
+            best = np.zeros(len(group), dtype = np.int64)
+            for i, c in enumerate(q.tolist(), start = 1):
+                current_row[:, 1:] = np.where(batch == c, previous_row[:, :-1] + 1, 0)
+                row_max = current_row.max(axis = 1)
+                better = row_max > best
+                best[better] = row_max[better]
+                common[better] = query_cumulative[i] - query_cumulative[i - row_max[better]]
+                previous_row, current_row = current_row, previous_row
+        else:
+            # The candidate is the shorter word (or as long as the query):
+            # the substring that ends first in the candidate wins ties
+            column_max = np.zeros((len(group), m), dtype = np.int64)
+            for c in q.tolist():
+                current_row[:, 1:] = np.where(batch == c, previous_row[:, :-1] + 1, 0)
+                np.maximum(column_max, current_row[:, 1:], out = column_max)
+                previous_row, current_row = current_row, previous_row
+            best = column_max.max(axis = 1)
+            end = np.argmax(column_max == best[:, None], axis = 1) + 1
+            common = cumulative[rows, end] - cumulative[rows, end - best]
+        # The rest of both words is everything but one copy of the
+        # common substring in each
+        scores[group] = 3 * common - query_cumulative[-1] - cumulative[:, -1]
+    return scores
+
@@ -4,9 +4,86 @@
 ## Based on aligner.js (by Michael Becker and Blake Allen),
 ## which in turn was based on Peter Kleiweg's Levenshtein Demo.
 
+from array import array
 from collections import defaultdict
 from codecs import open
 
+from corpustools.corpus.classes.lexicon import FeatureMatrix
+
+ABOVELEFT = 1
+ABOVE = 2
+LEFT = 4
+
+_directions = (('aboveleft', ABOVELEFT), ('above', ABOVE), ('left', LEFT))
+
+class SimilarityMatrix(object):
+    """
+    Dynamic programming table filled in by ``Aligner.make_similarity_matrix``
+
+    Scores are stored in a flat array of doubles and the backpointers of
+    each cell as bit flags in a flat byte array. Indexing the matrix
+    (``m[x][y]``) gives the dictionary of a cell with the keys 'f',
+    'aboveleft', 'above' and 'left'.
+
+    Parameters
+    ----------
+    height : int
+        Number of rows (length of the first sequence plus one)
+    width : int
+        Number of columns (length of the second sequence plus one)
+
+    Attributes
+    ----------
+    scores : array
+        Score of each cell, row by row
+    trace : bytearray
+        Backpointer flags of each cell, row by row
+    """
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.scores = array('d', bytes(8 * height * width))
+        self.trace = bytearray(height * width)
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.height
+        if not 0 <= x < self.height:
+            raise IndexError('Row index out of range.')
+        return _SimilarityRow(self, x)
+
+    def score(self, x, y):
+        return self.scores[x * self.width + y]
+
+    def flags(self, x, y):
+        return self.trace[x * self.width + y]
+
+
+class _SimilarityRow(object):
+    __slots__ = ('matrix', 'x')
+
+    def __init__(self, matrix, x):
+        self.matrix = matrix
+        self.x = x
+
+    def __len__(self):
+        return self.matrix.width
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.matrix.width
+        if not 0 <= y < self.matrix.width:
+            raise IndexError('Column index out of range.')
+        flags = self.matrix.flags(self.x, y)
+        cell = {name: int(bool(flags & flag)) for name, flag in _directions}
+        cell['trace'] = 0
+        cell['f'] = self.matrix.score(self.x, y)
+        return cell
+
+
 class Aligner(object):
 
     def __init__(self, features_tf=True, ins_penalty=1, del_penalty=1,
@@ -22,8 +99,14 @@ class Aligner(object):
         self.underspec_cost = underspec_cost # should be set to 1.0 to disable underspecification
         self.ins_del_basis = ins_del_basis
 
+        self.segment_rows = None
+        self.segment_costs = None
         if features_tf:
-            if self.ins_del_basis == 'empty':
+            if self.ins_del_basis == 'empty' and isinstance(self.features, FeatureMatrix):
+                # Feature distances between all segments are computed (and
+                # cached) once by the feature matrix
+                self.segment_rows, self.segment_costs = self.features.segment_distances(self.underspec_cost)
+            elif self.ins_del_basis == 'empty':
                 try:
                     self.silence_features = self.features['empty']
                 except (TypeError, KeyError):
@@ -46,58 +129,156 @@ class Aligner(object):
 
 
 
-    def make_similarity_matrix(self, seq1=None, seq2=None):
-
-        d = []
-
+    def segment_costs_for(self, seq1, seq2):
+        """
+        Look up the costs of deleting each segment of one sequence,
+        inserting each segment of another, and substituting between them
+
+        Parameters
+        ----------
+        seq1 : list
+            Segments of the first sequence
+        seq2 : list
+            Segments of the second sequence
+
+        Returns
+        -------
+        tuple
+            Lists of deletion costs (one per segment of `seq1`), insertion
+            costs (one per segment of `seq2`) and substitution costs (a
+            row per segment of `seq1`)
+        """
+        if self.segment_costs is not None:
+            rows1 = [self.segment_rows[self._symbol(seg)] for seg in seq1]
+            rows2 = [self.segment_rows[self._symbol(seg)] for seg in seq2]
+            deletions = (self.segment_costs[rows1, 0] * self.del_penalty).tolist()
+            insertions = (self.segment_costs[0, rows2] * self.ins_penalty).tolist()
+            substitutions = (self.segment_costs[rows1][:, rows2] * self.sub_penalty).tolist()
+        elif not self.features_tf:
+            deletions = [self.del_penalty] * len(seq1)
+            insertions = [self.ins_penalty] * len(seq2)
+            substitutions = [[int(seg1 != seg2) * self.sub_penalty for seg2 in seq2]
+                             for seg1 in seq1]
+        else:
+            deletions = [self.compare_segments(seg, 'empty', self.underspec_cost) for seg in seq1]
+            insertions = [self.compare_segments('empty', seg, self.underspec_cost) for seg in seq2]
+            substitutions = [[self.compare_segments(seg1, seg2, self.underspec_cost) for seg2 in seq2]
+                             for seg1 in seq1]
+        return deletions, insertions, substitutions
+
+    def distance(self, seq1=None, seq2=None):
+        """
+        Calculate the cost of the best alignment of two sequences, without
+        keeping the information needed to generate the alignment
+
+        Only two rows of the dynamic programming table are kept, so this
+        should be used instead of ``make_similarity_matrix`` whenever only
+        the final score (``m[-1][-1]['f']``) is needed.
+
+        Parameters
+        ----------
+        seq1 : iterable
+            First sequence
+        seq2 : iterable
+            Second sequence
+
+        Returns
+        -------
+        float
+            Cost of the best alignment
+        """
         seq1 = list(seq1)
         seq2 = list(seq2)
+        deletions, insertions, substitutions = self.segment_costs_for(seq1, seq2)
+
+        previous = [0]
+        for cost in insertions:
+            previous.append(previous[-1] + cost)
 
-        def compare(x, y):
-            return x - y <= self.tolerance
+        for x in range(len(seq1)):
+            deletion = deletions[x]
+            subs = substitutions[x]
+            left = previous[0] + deletion
+            current = [left]
+            for y in range(len(seq2)):
+                left = min(previous[y] + subs[y], left + insertions[y], previous[y + 1] + deletion)
+                current.append(left)
+            previous = current
 
-        initial_vals = {'aboveleft': 0,
-                        'above': 0,
-                        'left': 0,
-                        'trace': 0,
-                        'f': None}
+        return previous[-1]
+
+    def make_similarity_matrix(self, seq1=None, seq2=None):
+        """
+        Fill in the dynamic programming table for aligning two sequences
+
+        Parameters
+        ----------
+        seq1 : iterable
+            First sequence
+        seq2 : iterable
+            Second sequence
+
+        Returns
+        -------
+        SimilarityMatrix
+            Scores and backpointers of every cell, for use with
+            ``generate_alignment``
+        """
+        seq1 = list(seq1)
+        seq2 = list(seq2)
+        tolerance = self.tolerance
+        deletions, insertions, substitutions = self.segment_costs_for(seq1, seq2)
 
-        d = [[initial_vals.copy() for y in seq2+[' ']] for x in seq1+[' ']]
-        d[0][0]['f'] = 0
+        width = len(seq2) + 1
+        d = SimilarityMatrix(len(seq1) + 1, width)
+        scores = d.scores
+        trace = d.trace
 
         for x in range(1, len(seq1)+1):
-            d[x][0]['f'] = d[x-1][0]['f'] + self.compare_segments(seq1[x-1], 'empty', self.underspec_cost)
-            d[x][0]['left'] = 1
+            scores[x * width] = scores[(x-1) * width] + deletions[x-1]
+            trace[x * width] = LEFT
 
         for y in range(1, len(seq2)+1):
-            d[0][y]['f'] = d[0][y-1]['f'] + self.compare_segments('empty', seq2[y-1], self.underspec_cost)
-            d[0][y]['above'] = 1
+            scores[y] = scores[y-1] + insertions[y-1]
+            trace[y] = ABOVE
 
         for x in range(1, len(seq1)+1):
+            deletion = deletions[x-1]
+            subs = substitutions[x-1]
+            row = x * width
+            previous_row = row - width
             for y in range(1, len(seq2)+1):
-                aboveleft = (d[x - 1][y - 1]['f'] + self.compare_segments(seq1[x-1], seq2[y-1], self.underspec_cost))
-                left = d[x - 1][y]['f'] + self.compare_segments(seq1[x-1], 'empty', self.underspec_cost)
-                above = d[x][y - 1]['f'] + self.compare_segments('empty', seq2[y-1], self.underspec_cost)
-
-                if compare(aboveleft,above) and compare(aboveleft,left):
-                    d[x][y]['f'] = aboveleft
-                    d[x][y]['aboveleft'] = 1
-
-                if compare(above,aboveleft) and compare(above,left):
-                    d[x][y]['f'] = above
-                    d[x][y]['above'] = 1
-
-                if compare(left,aboveleft) and compare(left,above):
-                    d[x][y]['f'] = left
-                    d[x][y]['left'] = 1
-
-                d[x][y]['f'] = min(aboveleft, above, left)
+                aboveleft = scores[previous_row + y - 1] + subs[y-1]
+                left = scores[previous_row + y] + deletion
+                above = scores[row + y - 1] + insertions[y-1]
+
+                flags = 0
+                if aboveleft - above <= tolerance and aboveleft - left <= tolerance:
+                    flags |= ABOVELEFT
+                if above - aboveleft <= tolerance and above - left <= tolerance:
+                    flags |= ABOVE
+                if left - aboveleft <= tolerance and left - above <= tolerance:
+                    flags |= LEFT
+                trace[row + y] = flags
+                scores[row + y] = min(aboveleft, above, left)
 
         return d
 
 
 
+    def _symbol(self, segment):
+        if type(segment) is str:
+            return segment
+        return segment.symbol
+
     def compare_segments(self, segment1, segment2, underspec_cost=.25):
+        if self.segment_costs is not None and underspec_cost == self.underspec_cost:
+            if segment1 == 'empty':
+                return self.segment_costs[0, self.segment_rows[self._symbol(segment2)]] * self.ins_penalty
+            elif segment2 == 'empty':
+                return self.segment_costs[self.segment_rows[self._symbol(segment1)], 0] * self.del_penalty
+            return (self.segment_costs[self.segment_rows[self._symbol(segment1)],
+                                       self.segment_rows[self._symbol(segment2)]] * self.sub_penalty)
 
         def check_feature_difference(val1, val2, underspec_cost):
             if val1 == val2:
@@ -147,26 +328,24 @@ class Aligner(object):
 
 
     def generate_alignment(self, seq1, seq2, d):
-        alignments = []
         x = len(seq1)
         y = len(seq2)
         current_alignment = []
 
         while x > 0 or y > 0:
-            if d[x][y]['aboveleft']:
-                current_element = {'elem1': seq1[x-1], 'elem2': seq2[y-1], 'dir': 'aboveleft'}
-                current_alignment = [current_element] + current_alignment
+            flags = d.flags(x, y)
+            if flags & ABOVELEFT:
+                current_alignment.append({'elem1': seq1[x-1], 'elem2': seq2[y-1], 'dir': 'aboveleft'})
                 x -= 1
                 y -= 1
-            elif d[x][y]['above']:
-                current_element = {'elem1': None, 'elem2': seq2[y-1], 'dir': 'above'}
-                current_alignment = [current_element] + current_alignment
+            elif flags & ABOVE:
+                current_alignment.append({'elem1': None, 'elem2': seq2[y-1], 'dir': 'above'})
                 y -= 1
-            elif d[x][y]['left']:
-                current_element = {'elem1': seq1[x-1], 'elem2': None, 'dir': 'left'}
-                current_alignment = [current_element] + current_alignment
+            elif flags & LEFT:
+                current_alignment.append({'elem1': seq1[x-1], 'elem2': None, 'dir': 'left'})
                 x -= 1
 
+        current_alignment.reverse()
         return current_alignment
 
     def morpho_related(self, alignment, s1, s2):
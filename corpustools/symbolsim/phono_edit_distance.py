@@ -35,7 +35,5 @@ def phono_edit_distance(word1, word2, sequence_type, features):
 
     a = Aligner(features_tf=True, features=features)
 
-    m = a.make_similarity_matrix(w1, w2)
-
-    return m[-1][-1]['f']
+    return a.distance(w1, w2)
 
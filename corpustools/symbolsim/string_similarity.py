@@ -1,7 +1,7 @@
 from functools import partial
 from corpustools.corpus.classes import Word
-from corpustools.symbolsim.khorsi import khorsi
-from corpustools.symbolsim.edit_distance import edit_distance
+from corpustools.symbolsim.khorsi import khorsi, khorsi_scores
+from corpustools.symbolsim.edit_distance import edit_distance, edit_distances
 from corpustools.symbolsim.phono_edit_distance import phono_edit_distance
 
 from corpustools.exceptions import StringSimilarityError
@@ -14,7 +14,7 @@ def khorsi_wrapper(w1, w2, freq_base,sequence_type, max_distance):
         return None
 
 def edit_distance_wrapper(w1, w2, sequence_type, max_distance):
-    score = edit_distance(w1, w2, sequence_type)
+    score = edit_distance(w1, w2, sequence_type, max_distance)
     if score <= max_distance:
         return score
     else:
@@ -95,14 +95,35 @@ def string_similarity(corpus_context, query, algorithm, **kwargs):
             call_back(cur,total)
         targ_word = query
         relate = list()
-        for word in corpus_context:
+        if algorithm == 'edit_distance':
+            # Distances above max_rel are filtered out anyway, so they
+            # do not need to be computed exactly
+            words = list(corpus_context)
+            distances = edit_distances(targ_word, words, corpus_context.sequence_type,
+                                       max_distance = max_rel)
+            if call_back is not None:
+                cur += len(words)
+                call_back(cur)
+            scored = zip(words, distances.tolist())
+        elif algorithm == 'khorsi':
+            words = list(corpus_context)
+            similarities = khorsi_scores(targ_word, words, freq_base,
+                                         corpus_context.sequence_type)
+            if call_back is not None:
+                cur += len(words)
+                call_back(cur)
+            scored = zip(words, similarities.tolist())
+        else:
+            scored = ((word, None) for word in corpus_context)
+        for word, relatedness in scored:
             if stop_check is not None and stop_check():
                 return
-            if call_back is not None:
-                cur += 1
-                if cur % 50 == 0:
-                    call_back(cur)
-            relatedness = relate_func(targ_word, word)
+            if relatedness is None:
+                if call_back is not None:
+                    cur += 1
+                    if cur % 50 == 0:
+                        call_back(cur)
+                relatedness = relate_func(targ_word, word)
 
             if min_rel is not None and relatedness < min_rel:
                 continue
@@ -4,6 +4,9 @@ import sys
 import os
 
 from corpustools.symbolsim.string_similarity import string_similarity
+from corpustools.symbolsim.edit_distance import (edit_distance, edit_distances,
+                                                bounded_levenshtein)
+from corpustools.corpus.classes import Word
 from corpustools.contextmanagers import CanonicalVariantContext, MostFrequentVariantContext, WeightedVariantContext
 
 def test_spelling(unspecified_test_corpus):
@@ -95,3 +98,32 @@ def test_transcription(unspecified_test_corpus):
     calced.sort(key=lambda t:t[1])
     for i, v in enumerate(expected):
         assert(calced[i] == v)
+
+def test_bounded(unspecified_test_corpus):
+    assert(bounded_levenshtein('kitten', 'sitting') == 3)
+    assert(bounded_levenshtein('kitten', 'sitting', 3) == 3)
+    assert(bounded_levenshtein('kitten', 'sitting', 2) == 3)
+    assert(bounded_levenshtein('kitten', 'sitting', 1) == 2)
+    assert(bounded_levenshtein('', 'abc') == 3)
+    assert(bounded_levenshtein('', 'abc', 1) == 2)
+
+    query = unspecified_test_corpus.find('atema')
+    words = list(unspecified_test_corpus)
+    for sequence_type in ['spelling', 'transcription']:
+        full = [edit_distance(query, w, sequence_type) for w in words]
+        assert(edit_distances(query, words, sequence_type).tolist() == full)
+        for max_distance in [0, 2, 4]:
+            bounded = [min(d, max_distance + 1) for d in full]
+            assert([edit_distance(query, w, sequence_type, max_distance)
+                        for w in words] == bounded)
+            assert(edit_distances(query, words, sequence_type,
+                        max_distance).tolist() == bounded)
+
+def test_one_versus_all(unspecified_test_corpus):
+    words = list(unspecified_test_corpus)
+    for spelling in ['tata', 'tatatatatatata', 'ta' * 40]:
+        query = Word(spelling = spelling, transcription = list(spelling))
+        for sequence_type in ['spelling', 'transcription']:
+            expected = [edit_distance(query, w, sequence_type) for w in words]
+            assert(edit_distances(query, words, sequence_type).tolist() == expected)
+    assert(len(edit_distances(words[0], [], 'transcription')) == 0)
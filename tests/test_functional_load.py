@@ -3,10 +3,16 @@ import sys
 import os
 import pytest
 
+import itertools
+from collections import defaultdict
+from math import log
+
 from corpustools.funcload.functional_load import (minpair_fl, deltah_fl,
                                 relative_minpair_fl, relative_deltah_fl,
-                                all_pairwise_fls,)
-from corpustools.corpus.classes import Segment
+                                all_pairwise_fls, is_minpair,
+                                conflation_classes, minpair_candidates,
+                                fits_environment, environment_bitmap)
+from corpustools.corpus.classes import Segment, Transcription, EnvironmentFilter
 
 from corpustools.contextmanagers import (CanonicalVariantContext,
                                         MostFrequentVariantContext,
@@ -336,3 +342,108 @@ def test_mass_fl(unspecified_test_corpus):
             for result,prediction in zip(all_pairwise_fls(c, **kwargs), v):
                 assert(abs(result[1]-prediction[1]) < 0.0001)
 
+
+def test_conflation_classes():
+    classes = conflation_classes([('s','ʃ'), ('m','n')])
+    assert(classes['s'] == classes['ʃ'])
+    assert(classes['m'] == classes['n'])
+    assert(classes['s'] != classes['m'])
+
+    classes = conflation_classes([('s','ʃ'), ('m','n'), ('ʃ','m')])
+    assert(len(set(classes.values())) == 1)
+
+def test_minpair_candidates(unspecified_test_corpus):
+    segment_pairs = [('s','ʃ'), ('m','n'), ('e','o')]
+    with CanonicalVariantContext(unspecified_test_corpus, 'transcription', 'type') as c:
+        words = list(c)
+        candidates = minpair_candidates(words, c.sequence_type, segment_pairs)
+        expected = [(i, j) for i, j in itertools.combinations(range(len(words)), 2)
+                    if is_minpair(words[i], words[j], c, segment_pairs, None)]
+        assert(set(expected) <= set(candidates))
+        assert(candidates == sorted(candidates))
+
+def test_fits_environment():
+    w1 = Transcription(['s', 'a', 't'])
+    w2 = Transcription(['s', 'a', 'd'])
+    final = EnvironmentFilter([], rhs = [['#']])
+    after_vowel = EnvironmentFilter([], lhs = [['#', 'a']])
+    assert(fits_environment(w1, w2, 2, [final]))
+    assert(not fits_environment(w1, w2, 1, [final]))
+    assert(fits_environment(w1, w2, 0, [after_vowel]))
+    assert(fits_environment(w1, w2, 2, [after_vowel, final]))
+    assert(not fits_environment(w1, w2, 1, [after_vowel]))
+
+def test_environment_bitmap():
+    w1 = Transcription(['s', 'a', 't', 'a'])
+    w2 = Transcription(['s', 'a', 'd', 'a'])
+    for envs in [[EnvironmentFilter([], rhs = [['#']])],
+                 [EnvironmentFilter([], lhs = [['a']])],
+                 [EnvironmentFilter([], lhs = [['#', 'a']], rhs = [['a', 't']])]]:
+        bitmap = environment_bitmap(w1, envs) & environment_bitmap(w2, envs)
+        for i in range(len(w1)):
+            assert(bool(bitmap >> i & 1) == fits_environment(w1, w2, i, envs))
+
+def test_minpair_matches_pairwise_search(unspecified_test_corpus):
+    calls = [[('s','ʃ')], [('m','n')], [('t','n'), ('t','m')],
+             [('s','ʃ'), ('m','n'), ('e','o')]]
+    with CanonicalVariantContext(unspecified_test_corpus, 'transcription', 'token') as c:
+        for segment_pairs in calls:
+            targets = list(itertools.chain.from_iterable(segment_pairs))
+            words = [w for w in c if any(s in w.transcription for s in targets)]
+            expected = [(first, second) for first, second in itertools.combinations(words, 2)
+                        if is_minpair(first, second, c, segment_pairs, None)]
+            result = minpair_fl(c, segment_pairs, distinguish_homophones = True)
+            assert([(str(x[0][0]), str(x[1][0])) for x in result[1]] ==
+                   [tuple(str(w) for w in sorted(pair, key = lambda x: x.transcription))
+                    for pair in expected])
+
+def test_batched_all_pairwise_fls(unspecified_test_corpus):
+    calls = [{'algorithm':'minpair'},
+             {'algorithm':'minpair', 'relative_count_to_relevant_sounds':True},
+             {'algorithm':'minpair', 'relative_count_to_whole_corpus':False,
+                    'distinguish_homophones':True},
+             {'algorithm':'minpair', 'relative_fl':True},
+             {'algorithm':'deltah'},
+             {'algorithm':'deltah', 'prevent_normalization':True},
+             {'algorithm':'deltah', 'relative_fl':True}]
+    for type_or_token in ['type', 'token']:
+        with CanonicalVariantContext(unspecified_test_corpus, 'transcription', type_or_token) as c:
+            for kwargs in calls:
+                batched = dict(all_pairwise_fls(c, batched = True, **kwargs))
+                unbatched = dict(all_pairwise_fls(c, batched = False, **kwargs))
+                assert(batched.keys() == unbatched.keys())
+                for k, v in unbatched.items():
+                    assert(abs(batched[k] - v) < 0.0001)
+
+def test_parallel_fls(unspecified_test_corpus):
+    with CanonicalVariantContext(unspecified_test_corpus, 'transcription', 'token') as c:
+        for algorithm in ['minpair', 'deltah']:
+            serial = dict(all_pairwise_fls(c, algorithm = algorithm, batched = False))
+            parallel = dict(all_pairwise_fls(c, algorithm = algorithm, batched = False,
+                                             num_cores = 2))
+            assert(serial == parallel)
+        for s in ['s', 'm', 'o']:
+            assert(relative_minpair_fl(c, s) ==
+                    relative_minpair_fl(c, s, num_cores = 2))
+            assert(relative_deltah_fl(c, s) ==
+                    relative_deltah_fl(c, s, num_cores = 2))
+
+def test_deltah_matches_full_recount(unspecified_test_corpus):
+    def entropy(probs):
+        return -sum(p * log(p, 2) for p in probs if p > 0)
+
+    calls = [[('s','ʃ')], [('m','n')], [('e','o')], [('t','n'), ('i','u')]]
+    for type_or_token in ['type', 'token']:
+        with CanonicalVariantContext(unspecified_test_corpus, 'transcription', type_or_token) as c:
+            total = sum(w.frequency for w in c)
+            before = defaultdict(float)
+            for w in c:
+                before[str(w.transcription)] += w.frequency / total
+            for segment_pairs in calls:
+                neutralize = {s: ''.join(pair) for pair in segment_pairs for s in pair}
+                after = defaultdict(float)
+                for w in c:
+                    after[tuple(neutralize.get(s, s) for s in w.transcription)] += w.frequency / total
+                h = entropy(before.values())
+                expected = (h - entropy(after.values())) / h
+                assert(abs(deltah_fl(c, segment_pairs) - expected) < 0.0001)
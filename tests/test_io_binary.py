@@ -1,7 +1,12 @@
 import pytest
 import os
+import pickle
 
-from corpustools.corpus.io.binary import download_binary, save_binary, load_binary
+from corpustools.corpus.io import binary
+from corpustools.corpus.io.binary import (download_binary, save_binary, load_binary,
+                                        MAGIC, LazyWordlist)
+from corpustools.corpus.classes import Attribute
+from corpustools.contextmanagers import CanonicalVariantContext
 
 def test_save(export_test_dir, unspecified_test_corpus):
     save_path = os.path.join(export_test_dir, 'testsave.corpus')
@@ -10,6 +15,97 @@ def test_save(export_test_dir, unspecified_test_corpus):
     c = load_binary(save_path)
 
     assert(unspecified_test_corpus == c)
+    assert(all(w._corpus is c for w in c))
+
+def test_load_progress(export_test_dir, unspecified_test_corpus):
+    save_path = os.path.join(export_test_dir, 'testprogress.corpus')
+    save_binary(unspecified_test_corpus,save_path)
+
+    updates = []
+    c = load_binary(save_path, call_back = lambda *args: updates.append(args))
+    assert(unspecified_test_corpus == c)
+    assert(updates[0] == ('Loading...',))
+    assert(updates[1] == (0, os.path.getsize(save_path)))
+
+    assert(load_binary(save_path, stop_check = lambda: True) is None)
+
+def test_lazy_load(export_test_dir, unspecified_test_corpus):
+    save_path = os.path.join(export_test_dir, 'testlazy.corpus')
+    save_binary(unspecified_test_corpus,save_path)
+
+    c = load_binary(save_path, lazy = True)
+    assert(isinstance(c.wordlist, LazyWordlist))
+    assert(len(c) == len(unspecified_test_corpus))
+    assert('atema' in c)
+    assert(c['atema'] is c['atema'])
+    assert(c['atema']._corpus is c)
+    assert(unspecified_test_corpus == c)
+
+    c.remove_word('atema')
+    assert('atema' not in c)
+    assert(len(c) == len(unspecified_test_corpus) - 1)
+
+    c = pickle.loads(pickle.dumps(c))
+    assert(isinstance(c.wordlist, dict))
+    assert(len(c) == len(unspecified_test_corpus) - 1)
+
+def test_lazy_sections(export_test_dir, unspecified_test_corpus, monkeypatch):
+    monkeypatch.setattr(binary, 'WORDS_PER_SECTION', 2)
+    save_path = os.path.join(export_test_dir, 'testsections.corpus')
+    save_binary(unspecified_test_corpus,save_path)
+
+    c = load_binary(save_path, lazy = True)
+    wordlist = c.wordlist
+    held = c['atema']
+    assert(unspecified_test_corpus == c)
+    #Unchanged sections are dropped, apart from words still in use
+    assert(len(wordlist._loaded) <= wordlist.max_sections)
+    assert(len(wordlist._words) == 0)
+    assert(c['atema'] is held)
+
+    c['mata'].frequency = 1000
+    with CanonicalVariantContext(c, 'transcription', 'type') as context:
+        assert(len(list(context)) == len(unspecified_test_corpus))
+    assert(c['mata'].frequency == 1000)
+    assert(wordlist._buffer is not None)
+
+    c.add_attribute(Attribute('test', 'numeric'), initialize_defaults = True)
+    assert(all(w.test == 0 for w in c))
+    assert(wordlist._buffer is None)
+    assert(unspecified_test_corpus.find('mata').frequency != 1000)
+
+def test_lazy_held_edits(export_test_dir, unspecified_test_corpus, monkeypatch):
+    monkeypatch.setattr(binary, 'WORDS_PER_SECTION', 2)
+    save_path = os.path.join(export_test_dir, 'testheld.corpus')
+    save_binary(unspecified_test_corpus,save_path)
+
+    c = load_binary(save_path, lazy = True)
+    #Edit a word after its section was dropped while the word was in use
+    w = c['atema']
+    for word in c:
+        pass
+    w.frequency = 42
+    del w
+    for i in range(2):
+        for word in c:
+            pass
+    assert(c['atema'].frequency == 42)
+
+def test_convert_old(export_test_dir, unspecified_test_corpus):
+    save_path = os.path.join(export_test_dir, 'testold.corpus')
+    with open(save_path, 'wb') as f:
+        pickle.dump(unspecified_test_corpus, f)
+
+    c = load_binary(save_path)
+    assert(unspecified_test_corpus == c)
+    with open(save_path, 'rb') as f:
+        assert(f.read(len(MAGIC)) != MAGIC)
+
+    c = load_binary(save_path, convert = True)
+    assert(unspecified_test_corpus == c)
+    with open(save_path, 'rb') as f:
+        assert(f.read(len(MAGIC)) == MAGIC)
+    assert(unspecified_test_corpus == load_binary(save_path))
 
 
 #class BinaryCorpusLoadTest(unittest.TestCase):
@@ -3,7 +3,7 @@ import unittest
 import sys
 import os
 
-from corpustools.symbolsim.khorsi import lcs
+from corpustools.symbolsim.khorsi import lcs, khorsi, khorsi_scores
 from corpustools.symbolsim.string_similarity import string_similarity
 from corpustools.contextmanagers import (CanonicalVariantContext,
                                         MostFrequentVariantContext,
@@ -160,6 +160,22 @@ def test_lcs_transcription(unspecified_test_corpus):
         assert(calced == (v[2],sorted(v[3])))
 
 
+def test_lcs_ties():
+    assert(lcs(list('ab'), list('ba')) == (['b'], ['a', 'a']))
+    assert(lcs(list('abxcd'), list('cdab')) == (['c', 'd'], ['a', 'b', 'a', 'b', 'x']))
+    assert(lcs(list('ab'), list('cd')) == ([], ['a', 'b', 'c', 'd']))
+
+def test_khorsi_scores(unspecified_test_corpus):
+    for sequence_type in ['spelling', 'transcription']:
+        with CanonicalVariantContext(unspecified_test_corpus, sequence_type, 'type') as c:
+            freq_base = c.get_frequency_base()
+            words = list(c)
+            for query in words:
+                calced = khorsi_scores(query, words, freq_base, sequence_type)
+                for w, score in zip(words, calced):
+                    expected = khorsi(query, w, freq_base, sequence_type)
+                    assert(abs(score - expected) < 0.0001)
+
 def test_mass_relate_spelling_type(unspecified_test_corpus):
     expected = [(unspecified_test_corpus.find('atema'),unspecified_test_corpus.find('atema'),11.0766887),
                 (unspecified_test_corpus.find('atema'),unspecified_test_corpus.find('enuta'),-14.09489383),
@@ -4,10 +4,13 @@ import os
 import sys
 
 import pdb
+import pickle
+import operator
 
 from corpustools.corpus.classes import (Word, Corpus, FeatureMatrix, Segment,
                                         Environment, EnvironmentFilter, Transcription,
                                         WordToken, Discourse)
+from corpustools.corpus.classes.lexicon import encode_segments
 
 
 class CorpusTest(unittest.TestCase):
@@ -162,6 +165,36 @@ class WordTest(unittest.TestCase):
 
         self.assertRaises(AttributeError,getattr,t,'tier1')
 
+    def test_compact_word(self):
+        t = Word(**self.basic)
+        t2 = Word(**self.basic)
+        self.assertTrue(t.descriptors is t2.descriptors)
+        self.assertFalse('_transcription' in t.__dict__)
+        self.assertEqual(sorted(t.__dict__), ['Frequency', 'Spelling', 'Transcription'])
+
+    def test_pickle_word(self):
+        t = Word(**self.basic)
+        state = t.__getstate__()
+        self.assertEqual(state['_transcription_name'], 'Transcription')
+        self.assertTrue(isinstance(state['descriptors'], list))
+        loaded = pickle.loads(pickle.dumps(t))
+        self.assertEqual(loaded, t)
+        self.assertEqual(loaded.frequency, t.frequency)
+        self.assertEqual(loaded.transcription, t.transcription)
+
+        #State of a Word pickled before Words had slots
+        old = Word.__new__(Word)
+        old.__setstate__({'Spelling': 'test', '_spelling': 'test', '_spelling_name': 'Spelling',
+                    'Transcription': Transcription(['a','b']),
+                    '_transcription': Transcription(['a','b']),
+                    '_transcription_name': 'Transcription',
+                    'Frequency': 14.0, '_frequency': 0, '_corpus': None,
+                    'alt_transcriptions': [], 'alt_spellings': [], 'wordtokens': [],
+                    'descriptors': ['Spelling', 'Transcription', 'Frequency']})
+        self.assertEqual(old, Word(spelling='test', transcription=['a','b']))
+        self.assertEqual(old.frequency, 14.0)
+        self.assertEqual(sorted(old.__dict__), ['Frequency', 'Spelling', 'Transcription'])
+
 class FeatureMatrixTest(unittest.TestCase):
     def setUp(self):
         self.basic_info = [{'symbol':'a','feature1':'+','feature2':'+'},
@@ -256,6 +289,24 @@ class FeatureMatrixTest(unittest.TestCase):
         #Error, no default value
         fm.add_feature('feature3')
 
+    def test_segment_distances(self):
+        fm = FeatureMatrix('test',self.basic_info + [{'symbol':'e','feature1':'0','feature2':'+'}])
+        rows, distances = fm.segment_distances()
+        self.assertEqual(distances[rows['a'],rows['d']], 2)
+        self.assertEqual(distances[rows['a'],rows['b']], 1)
+        self.assertEqual(distances[rows['a'],rows['e']], 0.25)
+        self.assertEqual(distances[rows['e'],0], 0.25)
+        self.assertEqual(distances[0,rows['a']], 0.5)
+        self.assertIs(fm.segment_distances()[1], distances)
+
+        rows, distances = fm.segment_distances(1.0)
+        self.assertEqual(distances[rows['a'],rows['e']], 1)
+
+        fm.add_segment('f',{'feature1':'+','feature2':'-'})
+        rows, distances = fm.segment_distances()
+        self.assertEqual(distances[rows['a'],rows['f']], 1)
+        self.assertEqual(pickle.loads(pickle.dumps(fm)).segment_distances()[0], rows)
+
 class CorpusFeatureMatrixTest(unittest.TestCase):
     def setUp(self):
         self.corpus_basic_info = [{'spelling':'a','transcription':['a','b'],'frequency':32.0},
@@ -349,6 +400,37 @@ class TranscriptionTest(unittest.TestCase):
         self.assertEqual('c', cab[0])
         self.assertRaises(IndexError,cab.__getitem__,4)
 
+    def test_interned(self):
+        cab = Transcription(self.cab)
+        seg_cab = Transcription([Segment('c'), 'a', {'symbol':'b'}])
+        self.assertEqual(cab, seg_cab)
+        self.assertEqual(hash(cab), hash(seg_cab))
+        self.assertEqual(hash(cab), hash('c.a.b'))
+        self.assertEqual(list(cab), self.cab)
+        self.assertEqual(cab._list, self.cab)
+        self.assertTrue('a' in cab)
+        self.assertTrue(Segment('b') in cab)
+        self.assertFalse('d' in cab)
+        self.assertFalse('never-seen-symbol' in cab)
+
+        cab._list = self.ab
+        self.assertEqual(cab, Transcription(self.ab))
+        self.assertEqual(hash(cab), hash('a.b'))
+
+    def test_pickle(self):
+        cab = Transcription(self.cab)
+        cab.stress_pattern = {1: '1'}
+        state = cab.__getstate__()
+        self.assertEqual(state['_list'], self.cab)
+        self.assertFalse('_ids' in state)
+        loaded = pickle.loads(pickle.dumps(cab))
+        self.assertEqual(loaded, cab)
+        self.assertEqual(str(loaded), 'c.a1.b')
+
+        old = Transcription.__new__(Transcription)
+        old.__setstate__({'_list': self.cab})
+        self.assertEqual(old, Transcription(self.cab))
+
 
 class EnvironmentTest(unittest.TestCase):
     def setUp(self):
@@ -414,6 +496,29 @@ class EnvironmentFilterTest(unittest.TestCase):
         self.assertFalse(env2 in envfilt)
         self.assertFalse(env3 in envfilt)
 
+    def test_find(self):
+        segs = self.corpus.features_to_segments('+feature1')
+        envfilt = EnvironmentFilter(['a'], rhs = [segs])
+        trans = self.corpus['c'].transcription
+        envs = trans.find(envfilt)
+        self.assertEqual([(e.middle, e.position, e.lhs, e.rhs) for e in envs],
+                        [('a', 2, (), ('b',))])
+        self.assertEqual(trans.find(EnvironmentFilter(['a'], lhs = [['#']])), None)
+
+        envfilt2 = EnvironmentFilter(['b'], lhs = [['*']], rhs = [['#']])
+        found = trans.find_all([envfilt, envfilt2, 'not a filter'])
+        self.assertEqual(found[0], envs)
+        self.assertEqual([(e.middle, e.position, e.lhs, e.rhs) for e in found[1]],
+                        [('b', 3, ('a',), ('#',))])
+        self.assertEqual(found[2], None)
+
+    def test_context_matches(self):
+        envfilt = EnvironmentFilter(['a'], lhs = [['#'], ['c']], rhs = [['b']])
+        encoded = encode_segments(['#', 'c', 'a', 'b', '#'])
+        self.assertTrue(envfilt.context_matches(encoded, 2))
+        self.assertFalse(envfilt.context_matches(encoded, 3))
+        self.assertFalse(envfilt.context_matches(encoded, 1))
+
 
 def test_categories_spe(specified_test_corpus):
     cats = {'ɑ':['Vowel','Open','Near back','Unrounded'],
@@ -481,3 +586,33 @@ def test_redundant_features(specified_test_corpus):
 
     assert('round' in r)
 
+
+def test_columnar(unspecified_test_corpus):
+    store = unspecified_test_corpus.columnar()
+    words = list(unspecified_test_corpus)
+    assert(len(store) == len(words))
+    for view, word in zip(store, words):
+        assert(view.spelling == word.spelling)
+        assert(view.transcription == word.transcription)
+        assert(view.frequency == word.frequency)
+    assert(store.frequency_sum() == sum(w.frequency for w in words))
+
+    order = store.argsort('frequency', reverse = True)
+    assert([store[i].frequency for i in order] ==
+            sorted((w.frequency for w in words), reverse = True))
+
+    expected = {}
+    for w in words:
+        segs = ['#'] + list(w.transcription) + ['#']
+        for i in range(len(segs) - 1):
+            gram = tuple(segs[i:i+2])
+            expected[gram] = expected.get(gram, 0) + w.frequency
+    assert(store.ngram_counts('transcription', 2) == expected)
+
+    unspecified_test_corpus.add_count_attribute('num_t', 'transcription', ['t', 'ʃ'])
+    for w in words:
+        assert(w.num_t == sum(1 for x in w.transcription if x in ['t', 'ʃ']))
+    num_t = [a for a in unspecified_test_corpus.attributes if a.name == 'num_t'][0]
+    subset = unspecified_test_corpus.subset([(num_t, operator.gt, 0)])
+    assert(sorted(w.spelling for w in subset) ==
+            sorted(w.spelling for w in words if w.num_t > 0))
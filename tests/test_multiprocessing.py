@@ -0,0 +1,48 @@
+import pytest
+
+from corpustools.exceptions import PCTError
+from corpustools.multiprocessing import score_mp, filter_mp, execute, take_ranges
+
+def square(x):
+    return x * x
+
+def square_odd(x):
+    if x % 2 == 0:
+        return None
+    return x * x
+
+def is_even(x):
+    return x % 2 == 0
+
+def fail_on_ten(x):
+    if x == 10:
+        raise ValueError('ten')
+    return x
+
+def range_sum(task):
+    return sum(range(*task))
+
+def test_score_mp():
+    progress = []
+    result = score_mp(((i,) for i in range(1000)), square, 2, progress.append, None)
+    assert(result == [(i, i * i) for i in range(1000)])
+    assert(progress[-1] == 1000)
+    assert(progress == sorted(progress))
+
+    result = score_mp(((i,) for i in range(100)), square_odd, 2, None, None, chunk_size = 7)
+    assert(result == [(i, i * i) for i in range(1, 100, 2)])
+
+def test_filter_mp():
+    result = filter_mp(((i,) for i in range(1000)), is_even, 3, None, None)
+    assert(result == [(i,) for i in range(0, 1000, 2)])
+    assert(filter_mp(iter([]), is_even, 2, None, None) == [])
+
+def test_errors_and_stopping():
+    with pytest.raises(ValueError):
+        score_mp(((i,) for i in range(100)), fail_on_ten, 2, None, None)
+    assert(score_mp(((i,) for i in range(100)), square, 2, None, lambda: True) is None)
+
+def test_unordered_ranges():
+    results = dict(execute(range_sum, take_ranges(10000), 2, ordered = False))
+    assert(sorted(results) == sorted(set(results)))
+    assert(sum(results.values()) == sum(range(10000)))
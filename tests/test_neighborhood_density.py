@@ -1,11 +1,25 @@
 
 import sys
 import os
+import json
+import math
+import random
+import multiprocessing
+import pytest
+from collections import defaultdict
 
-from corpustools.corpus.classes import Word
+from corpustools.corpus.classes import Word, Attribute, Corpus
+from corpustools.corpus.classes.lexicon import segment_id
 
 from corpustools.neighdens.neighborhood_density import (neighborhood_density,
-                                                        find_mutation_minpairs)
+                                                        find_mutation_minpairs,
+                                                        neighborhood_density_all_words,
+                                                        weighted_neighborhood_density_all_words,
+                                                        neighbor_graph,
+                                                        find_mutation_minpairs_all_words)
+from corpustools.neighdens.deletion_index import deletion_variants
+from corpustools.neighdens.io import NeighborhoodDensityWriter
+from corpustools.neighdens.graph_cache import NeighborGraphCache
 
 from corpustools.contextmanagers import (CanonicalVariantContext,
                                         MostFrequentVariantContext,
@@ -25,6 +39,63 @@ def test_basic_corpus_nd(specified_test_corpus):
             assert(abs(result[0]-v) < 0.0001)
 
 
+def test_deletion_index(specified_test_corpus):
+    assert(deletion_variants('abc', 1) == set(['abc', 'bc', 'ac', 'ab']))
+
+    with CanonicalVariantContext(specified_test_corpus, 'transcription', 'type') as c:
+        for max_distance in [2, 3]:
+            for w in c:
+                quadratic = neighborhood_density(c, w, None, max_distance = max_distance,
+                                                force_quadratic = True)
+                indexed = neighborhood_density(c, w, None, max_distance = max_distance)
+                assert(quadratic == indexed)
+        assert(c.get_deletion_index(1) is c.get_deletion_index(2))
+
+
+def test_fast_neighborhood_density():
+    corpus = Corpus('geminates')
+    for spelling, transcription in [('pak', ['p','a','k']), ('pakk', ['p','a','k','k']),
+                                    ('pakkk', ['p','a','k','k','k']), ('pa', ['p','a']),
+                                    ('ak', ['a','k']), ('paak', ['p','a','a','k']),
+                                    ('tak', ['t','a','k']), ('tak2', ['t','a','k']),
+                                    ('k', ['k'])]:
+        corpus.add_word(Word(spelling = spelling, transcription = transcription))
+    tier_type = Attribute('transcription', 'tier')
+    with CanonicalVariantContext(corpus, 'transcription', 'type') as c:
+        tierdict = defaultdict(list)
+        for w in c:
+            tierdict[str(w.transcription)].append(w)
+        for w in c:
+            quadratic = neighborhood_density(c, w, tierdict, tier_type = tier_type,
+                                            force_quadratic = True)
+            fast = neighborhood_density(c, w, tierdict, tier_type = tier_type)
+            assert(fast[0] == len(set(fast[1])))
+            assert(set(fast[1]) - set([w]) == quadratic[1])
+        collapsed = neighborhood_density(c, corpus.find('pak'), tierdict, tier_type = tier_type,
+                                        collapse_homophones = True, exclude_query = False)
+        assert(sorted(str(w.transcription) for w in collapsed[1]) ==
+                ['a.k', 'p.a', 'p.a.a.k', 'p.a.k', 'p.a.k.k', 't.a.k'])
+
+def test_tier_index():
+    corpus = Corpus('homophones')
+    for spelling, transcription in [('tak', ['t','a','k']), ('tak2', ['t','a','k']),
+                                    ('pak', ['p','a','k'])]:
+        corpus.add_word(Word(spelling = spelling, transcription = transcription))
+    with CanonicalVariantContext(corpus, 'transcription', 'type') as c:
+        index = c.get_tier_index()
+        assert(index is c.get_tier_index())
+        assert(sorted(str(w) for w in index['t.a.k']) == ['tak', 'tak2'])
+        assert([str(w) for w in index.lookup('t.a.k', exclude = corpus.find('tak'))] == ['tak2'])
+        # The query is left out by identity, so its homophone still counts
+        for w in c:
+            result = neighborhood_density(c, w)
+            assert(sorted(str(n) for n in result[1]) ==
+                    sorted(str(n) for n in c if str(n) != str(w)))
+        result = neighborhood_density(c, corpus.find('tak'), exclude_query = False)
+        assert(result[0] == 3)
+        assert(sorted(str(w) for w in index['t.a.k']) == ['tak', 'tak2'])
+
+
 def test_basic_corpus_mutation_minpairs(specified_test_corpus):
     calls = [({'query':Word(**{'transcription': ['s', 'ɑ', 't', 'ɑ']}),
                     },2)]
@@ -35,6 +106,89 @@ def test_basic_corpus_mutation_minpairs(specified_test_corpus):
             assert(result[0] == v)
             assert(sorted(result[1]) == sorted(['n.ɑ.t.ɑ', 'm.ɑ.t.ɑ']))
 
+def test_mutation_index(specified_test_corpus):
+    with CanonicalVariantContext(specified_test_corpus, 'transcription', 'type') as c:
+        for collapse_homophones in [False, True]:
+            for w in c:
+                quadratic = find_mutation_minpairs(c, w, collapse_homophones = collapse_homophones,
+                                                force_quadratic = True)
+                indexed = find_mutation_minpairs(c, w, collapse_homophones = collapse_homophones)
+                assert(quadratic[0] == indexed[0])
+                assert(sorted(quadratic[1]) == sorted(indexed[1]))
+        assert(c.get_mutation_index() is c.get_mutation_index())
+
+def test_parallel_all_words(specified_test_corpus):
+    attribute = Attribute('parallel_nd_test', 'numeric')
+    tier_type = Attribute('transcription', 'tier')
+    with CanonicalVariantContext(specified_test_corpus, 'transcription', 'type',
+                                attribute = attribute) as c:
+        tierdict = defaultdict(list)
+        for w in c:
+            tierdict[str(w.transcription)].append(w)
+        for max_distance in [1, 2]:
+            runs = []
+            for num_cores in [-1, 2]:
+                results = neighborhood_density_all_words(c, tierdict, tier_type = tier_type,
+                                            max_distance = max_distance, num_cores = num_cores,
+                                            settable_attr = attribute)
+                values = {str(w): getattr(w, attribute.name) for w in specified_test_corpus}
+                runs.append(({k: sorted(v) for k, v in results.items()}, values))
+            assert(runs[0] == runs[1])
+        runs = []
+        for num_cores in [-1, 2]:
+            results = find_mutation_minpairs_all_words(c, tierdict, tier_type = tier_type,
+                                                    num_cores = num_cores)
+            values = {str(w): getattr(w, attribute.name) for w in specified_test_corpus}
+            runs.append(({k: sorted(v) for k, v in results.items()}, values))
+        assert(runs[0] == runs[1])
+
+
+@pytest.fixture
+def spawn_corpus():
+    # Segments that only this process has seen, interned before the
+    # corpus segments so that their codes differ in the workers
+    for i in range(5):
+        segment_id('spawn_unseen_{}'.format(i))
+    segments = ['spawn_{}'.format(s) for s in 'ptkaiu']
+    rand = random.Random(0)
+    corpus = Corpus('spawn')
+    for i in range(100):
+        transcription = [rand.choice(segments) for j in range(rand.randint(2, 4))]
+        corpus.add_word(Word(spelling = 'w{}'.format(i),
+                            transcription = transcription, frequency = 1))
+    previous = multiprocessing.get_start_method(allow_none = True)
+    multiprocessing.set_start_method('spawn', force = True)
+    try:
+        yield corpus
+    finally:
+        multiprocessing.set_start_method(previous, force = True)
+
+def test_spawn_all_words(spawn_corpus):
+    attribute = Attribute('spawn_nd_test', 'numeric')
+    tier_type = Attribute('transcription', 'tier')
+    with CanonicalVariantContext(spawn_corpus, 'transcription', 'type',
+                                attribute = attribute) as c:
+        runs = []
+        for num_cores in [-1, 2]:
+            results = neighborhood_density_all_words(c, tier_type = tier_type,
+                                        max_distance = 2, num_cores = num_cores,
+                                        settable_attr = attribute)
+            runs.append({k: sorted(v) for k, v in results.items()})
+        assert(sum(len(v) for v in runs[0].values()) > 0)
+        assert(runs[0] == runs[1])
+
+def test_spawn_mutation_minpairs(spawn_corpus):
+    attribute = Attribute('spawn_mp_test', 'numeric')
+    tier_type = Attribute('transcription', 'tier')
+    with CanonicalVariantContext(spawn_corpus, 'transcription', 'type',
+                                attribute = attribute) as c:
+        runs = []
+        for num_cores in [-1, 2]:
+            results = find_mutation_minpairs_all_words(c, tier_type = tier_type,
+                                                    num_cores = num_cores)
+            runs.append({k: sorted(v) for k, v in results.items()})
+        assert(sum(len(v) for v in runs[0].values()) > 0)
+        assert(runs[0] == runs[1])
 
 # def test_neighborhood_density_graph(specified_test_corpus):
 #     calls = [({'corpus': specified_test_corpus,
@@ -45,3 +199,113 @@ def test_basic_corpus_mutation_minpairs(specified_test_corpus):
 #         result = neighborhood_density_graph(**c)
 #         assert(result[0] == v)
 #         assert(result[1] == ['n.ɑ.t.ɑ'])
+
+def test_streaming_all_words(specified_test_corpus, export_test_dir):
+    attribute = Attribute('streaming_nd_test', 'numeric')
+    tier_type = Attribute('transcription', 'tier')
+    with CanonicalVariantContext(specified_test_corpus, 'transcription', 'type',
+                                attribute = attribute) as c:
+        tierdict = defaultdict(list)
+        for w in c:
+            tierdict[str(w.transcription)].append(w)
+        expected = neighborhood_density_all_words(c, tierdict, tier_type = tier_type,
+                                                settable_attr = attribute)
+        for num_cores in [-1, 2]:
+            for name in ['nd_stream.txt', 'nd_stream.jsonl']:
+                path = os.path.join(export_test_dir, name)
+                with NeighborhoodDensityWriter(path) as writer:
+                    results = neighborhood_density_all_words(c, tierdict, tier_type = tier_type,
+                                                settable_attr = attribute, num_cores = num_cores,
+                                                writer = writer)
+                assert(results == {})
+                if name.endswith('.jsonl'):
+                    with open(path, encoding = 'utf-8') as f:
+                        lines = [json.loads(line) for line in f]
+                    assert({l['word']: sorted(l['neighbors']) for l in lines} ==
+                            {k: sorted(v) for k, v in expected.items()})
+                    assert(all(l['density'] == len(l['neighbors']) for l in lines))
+                else:
+                    with open(path, encoding = 'utf-8-sig') as f:
+                        lines = [line.rstrip('\n').split('\t') for line in f]
+                    assert(lines[0] == ['Word', 'Density', 'Neighbours'])
+                    assert(sorted(l[0] for l in lines[1:]) == sorted(expected))
+                    for word, density, neighbors in lines[1:]:
+                        assert(int(density) == len(expected[word]))
+
+def test_weighted_all_words(specified_test_corpus):
+    attributes = {'density': Attribute('weighted_nd_test', 'numeric'),
+                'token_frequency': Attribute('weighted_nd_test_token', 'numeric'),
+                'log_frequency': Attribute('weighted_nd_test_log', 'numeric'),
+                'mean_frequency': Attribute('weighted_nd_test_mean', 'numeric')}
+    tier_type = Attribute('transcription', 'tier')
+    with CanonicalVariantContext(specified_test_corpus, 'transcription', 'type') as c:
+        for max_distance in [1, 2]:
+            expected = neighborhood_density_all_words(c, tier_type = tier_type,
+                                            max_distance = max_distance,
+                                            settable_attr = attributes['density'])
+            graph = weighted_neighborhood_density_all_words(c, attributes, tier_type = tier_type,
+                                            max_distance = max_distance)
+            parallel = neighbor_graph(c, tier_type = tier_type, max_distance = max_distance,
+                                            num_cores = 2)
+            assert(graph.indptr.tolist() == parallel.indptr.tolist())
+            assert(graph.indices.tolist() == parallel.indices.tolist())
+            for i, w in enumerate(graph.words):
+                neighbors = graph.neighbors(i)
+                assert(sorted(n.spelling for n in neighbors) == sorted(expected[str(w)]))
+                freqs = [n.original.frequency for n in neighbors]
+                word = w.original
+                assert(word.weighted_nd_test == len(freqs))
+                assert(abs(word.weighted_nd_test_token - sum(freqs)) < 0.0001)
+                assert(abs(word.weighted_nd_test_log - sum(math.log(f) for f in freqs)) < 0.0001)
+                if freqs:
+                    assert(abs(word.weighted_nd_test_mean - sum(freqs) / len(freqs)) < 0.0001)
+                else:
+                    assert(word.weighted_nd_test_mean == 0)
+
+    #Duplicate entries of a word are each other's neighbours, not their own
+    duplicates = Corpus('test')
+    for spelling, transcription, frequency in [('bank', ['b','a','n','k'], 10),
+                                                ('bank', ['b','a','n','k'], 2),
+                                                ('tank', ['t','a','n','k'], 1)]:
+        duplicates.add_word(Word(spelling = spelling, transcription = transcription,
+                                frequency = frequency), allow_duplicates = True)
+    with CanonicalVariantContext(duplicates, 'transcription', 'type') as c:
+        for num_cores in [-1, 2]:
+            graph = weighted_neighborhood_density_all_words(c, attributes, tier_type = tier_type,
+                                            num_cores = num_cores)
+            assert([w.original.frequency for w in graph.words] == [10, 2, 1])
+            assert(graph.indptr.tolist() == [0, 2, 4, 6])
+            assert(graph.indices.tolist() == [1, 2, 0, 2, 0, 1])
+            assert([w.original.weighted_nd_test_token for w in graph.words] == [3, 11, 12])
+            assert([w.original.weighted_nd_test_mean for w in graph.words] == [1.5, 5.5, 6])
+
+def test_neighbor_graph_cache(specified_test_corpus, export_test_dir):
+    cache = NeighborGraphCache(os.path.join(export_test_dir, 'NEIGHBORS'))
+    tier_type = Attribute('transcription', 'tier')
+
+    def graphs(corpus, max_distance):
+        with CanonicalVariantContext(corpus, 'transcription', 'type') as c:
+            expected = neighbor_graph(c, tier_type = tier_type, max_distance = max_distance)
+            key = cache.key(c, 'edit_distance', max_distance)
+        with CanonicalVariantContext(corpus, 'transcription', 'type') as c:
+            cached = neighbor_graph(c, tier_type = tier_type, max_distance = max_distance,
+                                    cache = cache)
+        assert(os.path.exists(cache.path(key)))
+        assert(cached.indptr.tolist() == expected.indptr.tolist())
+        assert(cached.indices.tolist() == expected.indices.tolist())
+        return key
+
+    changed = Corpus('test')
+    for w in specified_test_corpus:
+        if w.spelling != 'mata':
+            changed.add_word(Word(spelling = w.spelling, transcription = list(w.transcription),
+                                frequency = w.frequency))
+    changed.add_word(Word(spelling = 'matat', transcription = ['m', 'ɑ', 't', 'ɑ', 't']))
+    for max_distance in [1, 2]:
+        key = graphs(specified_test_corpus, max_distance)
+        graphs(specified_test_corpus, max_distance)
+        # The corpus has the same name, so the cached graph is updated
+        assert(graphs(changed, max_distance) == key)
+        assert('m.ɑ.t.ɑ.t' in cache.load(key).sequences)
+        assert('m.ɑ.t.ɑ' not in cache.load(key).sequences)
+
@@ -1 +1,24 @@
+from corpustools.symbolsim.phono_align import Aligner
 
+def test_distance(specified_test_corpus):
+    words = list(specified_test_corpus)
+    aligners = [Aligner(features = specified_test_corpus.specifier),
+                Aligner(features_tf = False),
+                Aligner(features_tf = False, ins_penalty = float('inf'),
+                        del_penalty = float('inf'))]
+    for al in aligners:
+        for w1 in words:
+            for w2 in words:
+                m = al.make_similarity_matrix(w1.transcription, w2.transcription)
+                assert(al.distance(w1.transcription, w2.transcription) == m[-1][-1]['f'])
+
+def test_alignment():
+    al = Aligner(features_tf = False)
+    m = al.make_similarity_matrix('tata', 'tat')
+    assert(m[-1][-1]['f'] == 1)
+    assert(m[0][0] == {'aboveleft': 0, 'above': 0, 'left': 0, 'trace': 0, 'f': 0})
+    assert(m[0][2]['above'] == 1)
+    assert(m[2][0]['left'] == 1)
+    alignment = al.generate_alignment('tata', 'tat', m)
+    assert([a['dir'] for a in alignment] == ['aboveleft'] * 3 + ['left'])
+    assert(alignment[-1] == {'elem1': 'a', 'elem2': None, 'dir': 'left'})
@@ -2,10 +2,13 @@
 import pytest
 import os
 import sys
+import copy
 
 from corpustools.corpus.classes import (Word, Corpus, FeatureMatrix,
                                         Environment, EnvironmentFilter, Transcription,
-                                        WordToken, Discourse, SpontaneousSpeechCorpus)
+                                        WordToken, Discourse, SpontaneousSpeechCorpus,
+                                        Attribute)
+from corpustools.contextmanagers import CanonicalVariantContext
 
 
 def test_init():
@@ -61,3 +64,24 @@ def test_init():
 
     assert(d[0].wordtype.frequency == 2)
     assert(d[1].wordtype.frequency == 1)
+
+def test_copy():
+    corpus = Corpus('test')
+    word = Word(spelling='ab', transcription=['a','b'])
+    corpus.add_word(word)
+    wt = WordToken(begin=0.0, end=3, word=word,
+                    frequency=(Attribute('frequency', 'numeric'), 4))
+    word.wordtokens.append(wt)
+
+    copied = copy.copy(wt)
+    assert(copied.begins == 0.0)
+    assert(copied.ends == 3)
+    assert(copied._frequency == 4.0)
+    assert(copied.Frequency == 4.0)
+
+    with CanonicalVariantContext(corpus, 'transcription', 'type') as c:
+        for w in c:
+            token = w.wordtokens[0]
+            assert(token is not wt)
+            assert((token.begins, token.ends) == (0.0, 3))
+            assert(token._frequency == 4.0)